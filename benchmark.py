@@ -0,0 +1,187 @@
+# Scalability benchmark of the synthesis phases
+
+# Times every phase of synthesizeProtocol, plus the output step, on the shipped specs and on
+# generated specs of growing size. Each phase keeps its best time over the repeats. Results are
+# written as one CSV row per (spec, system model, phase), and a previous results file can be
+# given as the baseline to flag phases that got slower or outputs that changed.
+
+import sys, getopt
+import os
+import io
+import csv
+import glob
+import tempfile
+import contextlib
+
+import synthia
+import specgen
+
+phases = ("parse", "constructU", "snapshot", "analysis", "atomicOwn", "atomicOther", "preOrdered",
+          "postOrdered", "replacements", "fixedPoint", "memFSM", "output")
+
+header = ("Spec", "Model", "Stable states", "Input transitions", "States", "Transitions", "Mem transitions", "Phase", "Seconds", "Latency cache hits", "Latency cache misses")
+
+defaultSizes = (4, 8, 16, 32, 64, 128)
+
+# one synthesis run and its output, timed by the synthia instrumentation
+def timePhases(inputfile, configModel, outputDir):
+    instrumentation = synthia.Instrumentation(False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        p = synthia.synthesizeProtocol(inputfile, configModel, None, instrumentation)
+        with p.phase("output"):
+            p.visualizeProtocol(outputDir, False, ("csv", "dot"))
+
+    times = dict((name, instrumentation.seconds(name)) for name in phases)
+    counts = (len(p.ipStates), len(p.ipTransitions), len(p.states), len(p.transitions), len(p.memTransitions))
+    latency = dict((name, (instrumentation.count(name, "latencyCacheHits"), instrumentation.count(name, "latencyCacheMisses"))) for name in phases)
+    return (times, counts, latency)
+
+def benchmarkSpec(inputfile, configModel, repeats, outputDir):
+    best = {}
+    counts = None
+    for r in range(repeats):
+        times, counts, latency = timePhases(inputfile, configModel, outputDir)
+        for name in phases:
+            best[name] = min(best.get(name, times[name]), times[name])
+    best["total"] = sum(best[name] for name in phases)
+    # the cache counts are the same on every repeat
+    latency["total"] = tuple(sum(latency[name][i] for name in phases) for i in (0, 1))
+    spec = os.path.basename(inputfile)
+    return [(spec, configModel) + tuple(str(c) for c in counts) + (name, "%.6f" % best[name]) + tuple(str(c) for c in latency[name]) for name in phases + ("total",)]
+
+def runSuite(specs, sizes, configModels, repeats, workDir, seed=1):
+    inputfiles = []
+    for spec in specs:
+        for m in sorted(glob.glob(spec)):
+            if (m not in inputfiles):
+                inputfiles.append(m)
+    for n in sizes:
+        path = os.path.join(workDir, "gen"+str(n)+".spec")
+        generated = specgen.generateSpec(path, n, None, seed, configModels)
+        print ("Generated "+path+" (seed "+str(generated.seed)+")")
+        inputfiles.append(path)
+
+    rows = []
+    outputDir = os.path.join(workDir, "output")
+    os.makedirs(outputDir, exist_ok=True)
+    for inputfile in inputfiles:
+        for configModel in configModels:
+            try:
+                result = benchmarkSpec(inputfile, configModel, repeats, outputDir)
+            except Exception as e:
+                print ("Failed "+inputfile+" ("+configModel+"): "+type(e).__name__+": "+str(e))
+                continue
+            rows.extend(result)
+            print (os.path.basename(inputfile)+" ("+configModel+"): "+result[-1][8]+" s, "+result[0][4]+" states, "+result[0][5]+" transitions, latency cache "+result[-1][9]+" hits / "+result[-1][10]+" misses")
+    return rows
+
+def printPhaseTable(rows):
+    totals = {}
+    for r in rows:
+        totals.setdefault((r[0], r[1]), {})[r[7]] = float(r[8])
+    names = phases + ("total",)
+    width = max([len(k[0]+" "+k[1]) for k in totals] + [4])
+    print ("Best time per phase (ms)")
+    print ("Spec".ljust(width)+"".join(n.rjust(13) for n in names))
+    for (key, times) in totals.items():
+        print ((key[0]+" "+key[1]).ljust(width)+"".join(("%.2f" % (times[n] * 1000)).rjust(13) for n in names))
+
+def writeResults(path, rows):
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+
+def readResults(path):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [tuple(r) for r in reader]
+
+# phases slower than the baseline by more than the tolerance and the noise floor, and changed outputs
+def compareResults(rows, baseline, tolerance=0.3, floor=0.005):
+    base = dict(((r[0], r[1], r[7]), r) for r in baseline)
+    regressions = []
+    changed = set()
+    for r in rows:
+        b = base.get((r[0], r[1], r[7]))
+        if (b == None):
+            continue
+        if (r[2:7] != b[2:7]):
+            changed.add((r[0], r[1], b[2:7], r[2:7]))
+        new = float(r[8])
+        old = float(b[8])
+        if (new > old * (1 + tolerance) and new - old > floor):
+            regressions.append((r[0], r[1], r[7], old, new))
+
+    for (spec, model, old, new) in sorted(changed):
+        print ("Output changed: "+spec+" ("+model+"): "+" / ".join(old[2:])+" -> "+" / ".join(new[2:])+" states / transitions / mem transitions")
+    for (spec, model, phase, old, new) in regressions:
+        print ("Regression: "+spec+" ("+model+") "+phase+": "+str(round(old * 1000, 2))+" ms -> "+str(round(new * 1000, 2))+" ms (x"+str(round(new / old, 2) if old > 0 else "inf")+")")
+    print ("Compared "+str(len(rows))+" phases: "+str(len(regressions))+" regressions, "+str(len(changed))+" changed outputs")
+    return (regressions, changed)
+
+def main(argv):
+    specs = []
+    sizes = defaultSizes
+    configModels = ["direct", "memory"]
+    repeats = 5
+    outputFile = "benchmark.csv"
+    baselineFile = None
+    tolerance = 0.3
+    seed = 1
+    workDir = None
+
+    usage = 'benchmark.py [-b <spec-glob>[,<spec-glob>...]] [--sizes=<n>[,<n>...]] [-s <system-model>[,<system-model>...]] [-r <repeats>] [-o <results csv>]\n' \
+            '             [--baseline=<results csv>] [--tolerance=<ratio>] [--seed=<seed>] [--work-dir=<dir>]'
+    try:
+        opts, args = getopt.getopt(argv, "hb:s:r:o:", ["batch=", "sizes=", "system-model=", "repeats=", "ofile=", "baseline=", "tolerance=", "seed=", "work-dir="])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-b", "--batch"):
+            specs.extend(a for a in arg.split(",") if a != "")
+        elif opt == "--sizes":
+            sizes = tuple(int(n) for n in arg.split(",") if n != "")
+        elif opt in ("-s", "--system-model"):
+            configModels = [m for m in arg.split(",") if m != ""]
+        elif opt in ("-r", "--repeats"):
+            repeats = int(arg)
+        elif opt in ("-o", "--ofile"):
+            outputFile = arg
+        elif opt == "--baseline":
+            baselineFile = arg
+        elif opt == "--tolerance":
+            tolerance = float(arg)
+        elif opt == "--seed":
+            seed = int(arg)
+        elif opt == "--work-dir":
+            workDir = arg
+
+    if (len(specs) == 0):
+        specs = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.spec")]
+
+    print (" ----- Benchmark -----")
+    if (workDir == None):
+        with tempfile.TemporaryDirectory(prefix="synthia-bench-") as d:
+            rows = runSuite(specs + args, sizes, configModels, repeats, d, seed)
+    else:
+        os.makedirs(workDir, exist_ok=True)
+        rows = runSuite(specs + args, sizes, configModels, repeats, workDir, seed)
+
+    printPhaseTable(rows)
+    writeResults(outputFile, rows)
+    print ("Wrote "+str(len(rows))+" results to "+outputFile)
+
+    if (baselineFile != None):
+        regressions, changed = compareResults(rows, readResults(baselineFile), tolerance)
+        if (len(regressions) > 0 or len(changed) > 0):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
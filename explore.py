@@ -0,0 +1,456 @@
+# Design-space exploration over candidate specs
+
+# Takes a base spec and a set of (state, event) pairs to vary, and enumerates every assignment
+# of destinations the spec rules allow for them (see specgen.legalDestinations). The base
+# destination is always one of the choices, so the base spec is a candidate too.
+# By default the candidates are searched by branch and bound, one subtree per pool task:
+# - the varied transitions are fixed one at a time, depth first
+# - the latency verdict of a transition depends only on its source and event and on the
+#   destinations its analysis looks up, in an order set by the answers so far. Each
+#   (source, event) keeps a verdict tree: a node is the next varied (state, event) pair the
+#   analysis looks up, a branch is that pair's destination, and a leaf is the verdict. A
+#   verdict is analyzed once per path and then shared by every candidate on the path
+# - a transition whose analysis looks up a pair that is not fixed yet waits for that pair and
+#   is checked again only once it is fixed
+# - a non-linear verdict cuts the subtree below the transitions fixed so far
+# - the candidates left at the leaves are linear and are synthesized into a non-stalling protocol
+# With --exhaustive every candidate is built in memory and evaluated on its own. The analysis
+# stops at its first non-linear transition, and only linear candidates are synthesized.
+# Survivors are ranked by transient states, then transitions, then memory transitions.
+
+import sys, getopt, os, io, csv, itertools, contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import synthia
+import specgen
+
+LINEAR = "linear"
+NON_LINEAR = "non-linear"
+FAILED = "failed"
+
+header = ("Candidate", "Candidates", "Verdict", "Transient states", "States", "Transitions", "Mem transitions", "Non-linear transition", "Error")
+
+class DesignSpace:
+    def __init__(self, inputfile, events, sources=None):
+        p = synthia.CoherenceProtocol()
+        synthia.parse(inputfile, p)
+        self.states = [(s.getStateString(), (s.AP, s.PCP, s.SMP)) for s in p.states]
+        self.transitions = [(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()) for t in p.transitions]
+
+        names = [n for (n, enc) in self.states]
+        for n in (sources or []):
+            if (n not in names):
+                raise ValueError("unknown state "+str(n)+" in "+str(inputfile))
+        for e in events:
+            if (e not in synthia.E):
+                raise ValueError("unknown event "+str(e))
+
+        # varied transition rows and their destination choices, base destination first
+        self.varied = []
+        for (i, (src, e, dst)) in enumerate(self.transitions):
+            if (e not in events or (sources and src not in sources)):
+                continue
+            choices = [dst] + [d for d in specgen.legalDestinations(self.states, src, e) if d != dst]
+            if (len(choices) > 1):
+                self.varied.append((i, choices))
+
+    def size(self):
+        n = 1
+        for (i, choices) in self.varied:
+            n = n * len(choices)
+        return n
+
+    def assignments(self):
+        return itertools.product(*[range(len(choices)) for (i, choices) in self.varied])
+
+    def candidate(self, assignment):
+        transitions = list(self.transitions)
+        for ((i, choices), c) in zip(self.varied, assignment):
+            (src, e, dst) = transitions[i]
+            transitions[i] = (src, e, choices[c])
+        return transitions
+
+    def describe(self, assignment):
+        return ["("+self.transitions[i][0]+", "+self.transitions[i][1]+") -> "+choices[c] for ((i, choices), c) in zip(self.varied, assignment)]
+
+    def columns(self):
+        return ["("+self.transitions[i][0]+", "+self.transitions[i][1]+")" for (i, choices) in self.varied]
+
+    def writeSpec(self, path, assignment, title):
+        with open(path, "w") as f:
+            f.write("# "+title+"\n")
+            f.write("@ State modeling\n")
+            for (n, enc) in self.states:
+                f.write(n+" -> ("+", ".join(enc)+")\n")
+            f.write("@ Txn specs\n")
+            for (src, e, dst) in self.candidate(assignment):
+                f.write("("+src+", "+e+") -> "+dst+"\n")
+
+def buildProtocol(states, transitions):
+    p = synthia.CoherenceProtocol()
+    stateMap = {}
+    for (n, (ap, pcp, smp)) in states:
+        s = synthia.CoherenceState(n, True)
+        s.setAP(ap)
+        s.setSMP(smp)
+        s.setPCP(pcp)
+        p.addState(s)
+        stateMap[n] = s
+    for (src, e, dst) in transitions:
+        p.addTransition(synthia.Transition(stateMap[src], e, stateMap[dst]))
+    return p
+
+def newResult(assignment, verdict=None, candidates=1):
+    return {"assignment": tuple(assignment), "candidates": candidates, "verdict": verdict, "nonLinear": "",
+            "transient": 0, "states": 0, "transitions": 0, "memTransitions": 0, "error": ""}
+
+def evaluateProtocol(p, configModel, result, analyzed=False):
+    # linear candidates are synthesized, the first non-linear transition prunes the candidate;
+    # analyzed candidates are known to be linear
+    stable = len(p.states)
+    p.constructU()
+    p.takeSnapshot()
+    for t in p.ipTransitions:
+        if (not analyzed and p.asymptoticLatencyAnalysisTransition(t, configModel)):
+            p.addNonLinearTransitions(t)
+            result["verdict"] = NON_LINEAR
+            result["nonLinear"] = t.getSource().getStateString()+" -- "+t.getTriggerEvent()+" --> "+t.getDestination().getStateString()
+            return result
+        p.addLinearTransitions(t)
+
+    p.synthesizeNonStallingProtocol(configModel)
+    result["verdict"] = LINEAR
+    result["transient"] = len(p.states) - stable
+    result["states"] = len(p.states)
+    result["transitions"] = len(p.transitions)
+    result["memTransitions"] = len(p.memTransitions)
+    return result
+
+def synthesizeCandidate(space, configModel, assignment, analyzed=False):
+    result = newResult(assignment)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            evaluateProtocol(buildProtocol(space.states, space.candidate(assignment)), configModel, result, analyzed)
+    except Exception as e:
+        result["verdict"] = FAILED
+        result["error"] = type(e).__name__+": "+str(e)
+    return result
+
+class Unfixed(Exception):
+    # the analysis looked up a varied pair the search has not fixed yet
+    def __init__(self, pair):
+        Exception.__init__(self, str(pair))
+        self.pair = pair
+
+class PartialProtocol(synthia.CoherenceProtocol):
+    # the stable states of the design space, lookups of varied pairs are answered by the search
+    def __init__(self, space):
+        synthia.CoherenceProtocol.__init__(self)
+        self.stateMap = {}
+        for (n, (ap, pcp, smp)) in space.states:
+            s = synthia.CoherenceState(n, True)
+            s.setAP(ap)
+            s.setSMP(smp)
+            s.setPCP(pcp)
+            self.addState(s)
+            self.stateMap[n] = s
+        self.variedPairs = set((space.transitions[i][0], space.transitions[i][1]) for (i, choices) in space.varied)
+        self.base = {}
+        for (src, e, dst) in space.transitions:
+            if ((src, e) not in self.variedPairs):
+                self.base.setdefault((src, e), dst)
+        self.constructU()
+        self.fixed = {}
+        self.path = []
+
+    def getTransitionDestination(self, s, e):
+        pair = (s.getStateString(), e)
+        if (pair in self.variedPairs):
+            d = self.fixed.get(pair)
+            if (d == None):
+                raise Unfixed(pair)
+            self.path.append((pair, d))
+        else:
+            d = self.base.get(pair)
+            if (d == None):
+                return None
+        return self.stateMap[d]
+
+class BranchAndBound:
+    def __init__(self, space, configModel):
+        self.space = space
+        self.configModel = configModel
+        self.protocol = PartialProtocol(space)
+        # one transition per (source, event) to analyze, the verdict does not depend on its destination
+        self.transitions = {}
+        for (src, e, dst) in space.transitions:
+            if ((src, e) not in self.transitions):
+                self.transitions[(src, e)] = synthia.Transition(self.protocol.stateMap[src], e, self.protocol.stateMap[dst])
+        self.pairs = [((space.transitions[i][0], space.transitions[i][1]), choices) for (i, choices) in space.varied]
+        # (source, event) -> verdict tree: a bool, or (pair, {destination: subtree})
+        self.trees = {}
+        self.analyzed = 0
+        self.reused = 0
+        self.nodes = 0
+
+    # True or False, or the unfixed pair the verdict waits for
+    def verdict(self, key, fixed):
+        node = self.trees.get(key)
+        while (node != None and not isinstance(node, bool)):
+            (pair, branches) = node
+            d = fixed.get(pair)
+            if (d == None):
+                self.reused = self.reused + 1
+                return pair
+            node = branches.get(d)
+        if (node != None):
+            self.reused = self.reused + 1
+            return node
+        return self.analyze(key, fixed)
+
+    def analyze(self, key, fixed):
+        p = self.protocol
+        p.fixed = fixed
+        p.path = []
+        self.analyzed = self.analyzed + 1
+        try:
+            result = p.computeAsymptoticLatencyTransition(self.transitions[key], self.configModel)
+            leaf = result
+        except Unfixed as u:
+            result = u.pair
+            leaf = (u.pair, {})
+
+        # the lookups of this run become a path of the tree, ending in its verdict
+        path = p.path
+        if (key not in self.trees):
+            self.trees[key] = (path[0][0], {}) if len(path) > 0 else leaf
+        node = self.trees[key]
+        for (j, (pair, d)) in enumerate(path):
+            (nodePair, branches) = node
+            if (d not in branches):
+                branches[d] = (path[j + 1][0], {}) if j + 1 < len(path) else leaf
+            node = branches[d]
+        return result
+
+    def search(self, prefix=()):
+        return self.expand(prefix)[0]
+
+    def expand(self, prefix=(), stop=None):
+        # searches the subtree below prefix; with stop, the assignments that reach that depth
+        # are returned as open subtrees instead of being searched
+        results = []
+        self.stop = stop
+        self.open = []
+        self.visit(0, prefix, [], {}, list(self.transitions), {}, results)
+        return (results, self.open)
+
+    def visit(self, depth, prefix, assignment, fixed, check, waiting, results):
+        self.nodes = self.nodes + 1
+        for key in check:
+            r = self.verdict(key, fixed)
+            if (r is True):
+                # above the prefix only the prefix's own subtree is cut
+                if (depth < len(prefix)):
+                    pruned = newResult(prefix, NON_LINEAR, self.remaining(len(prefix)))
+                else:
+                    pruned = newResult(assignment, NON_LINEAR, self.remaining(depth))
+                t = self.transitions[key]
+                d = fixed.get(key, self.protocol.base.get(key, "*"))
+                pruned["nonLinear"] = t.getSource().getStateString()+" -- "+t.getTriggerEvent()+" --> "+d
+                results.append(pruned)
+                return
+            if (r is not False):
+                waiting[key] = r
+
+        if (depth == self.stop):
+            self.open.append(tuple(assignment))
+            return
+
+        if (depth == len(self.pairs)):
+            results.append(synthesizeCandidate(self.space, self.configModel, assignment, True))
+            return
+
+        (pair, choices) = self.pairs[depth]
+        check = [k for (k, q) in waiting.items() if q == pair]
+        rest = dict((k, q) for (k, q) in waiting.items() if q != pair)
+        options = range(len(choices)) if depth >= len(prefix) else (prefix[depth],)
+        for c in options:
+            fixed[pair] = choices[c]
+            assignment.append(c)
+            self.visit(depth + 1, prefix, assignment, fixed, check, dict(rest), results)
+            assignment.pop()
+        del fixed[pair]
+
+    def remaining(self, depth):
+        n = 1
+        for (pair, choices) in self.pairs[depth:]:
+            n = n * len(choices)
+        return n
+
+    def stats(self):
+        return (self.analyzed, self.reused, self.nodes)
+
+# the design space is sent to every worker once, branch-and-bound verdict trees stay in the worker
+workerSpace = None
+workerModel = None
+workerSearch = None
+
+def initWorker(space, configModel):
+    global workerSpace, workerModel, workerSearch
+    workerSpace = space
+    workerModel = configModel
+    workerSearch = BranchAndBound(space, configModel)
+
+def evaluateCandidate(assignment):
+    return synthesizeCandidate(workerSpace, workerModel, assignment)
+
+def searchSubtree(prefix):
+    before = workerSearch.stats()
+    results = workerSearch.search(prefix)
+    return (results, tuple(a - b for (a, b) in zip(workerSearch.stats(), before)))
+
+def subtreeDepth(space, tasks):
+    # the shortest prefix of varied transitions with at least as many assignments as tasks
+    n = 1
+    depth = 0
+    while (depth < len(space.varied) and n < tasks):
+        n = n * len(space.varied[depth][1])
+        depth = depth + 1
+    return depth
+
+def rankCandidates(results):
+    survivors = [r for r in results if r["verdict"] == LINEAR]
+    return sorted(survivors, key=lambda r: (r["transient"], r["transitions"], r["memTransitions"], r["assignment"]))
+
+def explore(space, configModel, jobs=None, maxCandidates=100000):
+    # every candidate on its own
+    total = space.size()
+    if (total > maxCandidates):
+        raise ValueError(str(total)+" candidates exceed the limit of "+str(maxCandidates)+", vary fewer events or states")
+    chunk = max(1, total // (4 * (jobs or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=(space, configModel)) as pool:
+        results = list(pool.map(evaluateCandidate, space.assignments(), chunksize=chunk))
+    return results
+
+def branchAndBound(space, configModel, jobs=None):
+    # returns the results, one per synthesized candidate or pruned subtree, and the
+    # (analyzed verdicts, reused verdicts, search nodes) counts
+    workers = jobs or os.cpu_count() or 1
+    # the subtrees above the task prefixes are settled here, pruned ones become one result each
+    search = BranchAndBound(space, configModel)
+    (results, prefixes) = search.expand((), subtreeDepth(space, 1 if workers == 1 else 4 * workers))
+    stats = search.stats()
+    if (len(prefixes) == 0):
+        return (results, stats)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=(space, configModel)) as pool:
+        for (subtree, counts) in pool.map(searchSubtree, prefixes):
+            results.extend(subtree)
+            stats = tuple(a + b for (a, b) in zip(stats, counts))
+    return (results, stats)
+
+def writeResults(path, space, results):
+    # one row per candidate or pruned subtree, * for the transitions a subtree leaves free
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header[:2] + tuple(space.columns()) + header[2:])
+        for (i, r) in enumerate(results):
+            destinations = [choices[c] for ((j, choices), c) in zip(space.varied, r["assignment"])]
+            destinations = destinations + ["*"] * (len(space.varied) - len(destinations))
+            w.writerow([i, r["candidates"]] + destinations + [r["verdict"], r["transient"], r["states"], r["transitions"], r["memTransitions"], r["nonLinear"], r["error"]])
+
+def printSummary(space, results, ranked, top):
+    pruned = sum(r["candidates"] for r in results if r["verdict"] == NON_LINEAR)
+    subtrees = len([r for r in results if r["verdict"] == NON_LINEAR])
+    failed = [r for r in results if r["verdict"] == FAILED]
+    print ("Candidates: "+str(sum(r["candidates"] for r in results))+", linear: "+str(len(ranked))+", pruned as non-linear: "+str(pruned)+" in "+str(subtrees)+" subtrees, failed: "+str(len(failed)))
+    base = tuple(0 for v in space.varied)
+    for r in results:
+        if (r["assignment"] == base[:len(r["assignment"])]):
+            print ("Base spec: "+r["verdict"]+("" if r["verdict"] != LINEAR else " ("+str(r["transient"])+" transient states, "+str(r["transitions"])+" transitions)"))
+            break
+    if (len(ranked) == 0):
+        return
+    print ("Best "+str(min(top, len(ranked)))+" linear candidates")
+    print ("Rank".ljust(6)+"Transient".rjust(10)+"Transitions".rjust(13)+"Mem".rjust(6)+"  Changes from the base spec")
+    for (rank, r) in enumerate(ranked[:top]):
+        changes = [d for (d, c) in zip(space.describe(r["assignment"]), r["assignment"]) if c != 0]
+        print (str(rank + 1).ljust(6)+str(r["transient"]).rjust(10)+str(r["transitions"]).rjust(13)+str(r["memTransitions"]).rjust(6)+"  "+("; ".join(changes) or "(base spec)"))
+
+def main(argv):
+    inputfile = ' '
+    configModel = 'direct'
+    events = []
+    sources = None
+    jobs = None
+    top = 10
+    outputFile = None
+    specDir = None
+    maxCandidates = 100000
+    exhaustive = False
+
+    usage = 'explore.py -i <base spec> -s <system-model> -e <event>[,<event>...] [--states=<state>[,<state>...]] [-j <jobs>] [-k <top>]\n' \
+            '           [-o <results csv>] [--specs=<dir>] [--exhaustive] [--max-candidates=<n>]'
+    try:
+        opts, args = getopt.getopt(argv, "hi:s:e:j:k:o:", ["ifile=", "system-model=", "events=", "states=", "jobs=", "top=", "ofile=", "specs=", "exhaustive", "max-candidates="])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-s", "--system-model"):
+            configModel = arg
+        elif opt in ("-e", "--events"):
+            events.extend(e for e in arg.split(",") if e != "")
+        elif opt == "--states":
+            sources = [s for s in arg.split(",") if s != ""]
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-k", "--top"):
+            top = int(arg)
+        elif opt in ("-o", "--ofile"):
+            outputFile = arg
+        elif opt == "--specs":
+            specDir = arg
+        elif opt == "--exhaustive":
+            exhaustive = True
+        elif opt == "--max-candidates":
+            maxCandidates = int(arg)
+
+    if (len(events) == 0):
+        print (usage)
+        sys.exit(2)
+
+    try:
+        space = DesignSpace(inputfile, events, sources)
+        print (" ----- Design-space exploration: "+str(space.size())+" candidates, "+str(len(space.varied))+" varied transitions -----")
+        if (exhaustive):
+            results = explore(space, configModel, jobs, maxCandidates)
+        else:
+            (results, (analyzed, reused, nodes)) = branchAndBound(space, configModel, jobs)
+            print ("Searched "+str(nodes)+" nodes: "+str(analyzed)+" verdicts analyzed, "+str(reused)+" reused")
+    except synthia.SpecError as e:
+        print (str(e))
+        sys.exit(2)
+    except ValueError as e:
+        print (str(e))
+        sys.exit(2)
+
+    ranked = rankCandidates(results)
+    printSummary(space, results, ranked, top)
+    if (outputFile != None):
+        writeResults(outputFile, space, results)
+        print ("Wrote "+str(len(results))+" candidates and pruned subtrees to "+outputFile)
+    if (specDir != None):
+        os.makedirs(specDir, exist_ok=True)
+        for (rank, r) in enumerate(ranked[:top]):
+            path = os.path.join(specDir, "candidate-"+str(rank + 1)+".spec")
+            space.writeSpec(path, r["assignment"], "Candidate "+str(rank + 1)+" of "+os.path.basename(inputfile)+" ("+configModel+" model): "+str(r["transient"])+" transient states, "+str(r["transitions"])+" transitions")
+        print ("Wrote "+str(min(top, len(ranked)))+" candidate specs to "+specDir)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,1009 @@
+# Step 5: Simulate protocol (cycle-level snooping bus)
+
+# Timed simulation of N private caches and the shared memory running the synthesized
+# FSMs over a TDM snooping bus. Slot k (slotWidth cycles) belongs to core k mod N and
+# carries one message of that core: a data response, the ordering of a response
+# (X_A states), or the ordering of its own request. Data sent in slot k reaches the
+# requester at the end of the slot, one more slot later in the memory model where
+# cache-to-cache data goes through the shared memory.
+
+import sys, getopt, time, struct
+from array import array
+import numpy as np
+
+import synthia
+from verifier import SystemModel, READ, WRITE, REPLACEMENT, ORDERED, DATA, SEND_DATA, WRITE_BACK
+
+# events of the dense cache tables
+OWN_READ_M = 0
+OWN_READ_P = 1
+OWN_WRITE_M = 2
+OWN_WRITE_P = 3
+REPLACE = 4
+OTHER_READ = 5
+OTHER_WRITE = 6
+ORDER = 7
+DATA_IN = 8
+EVENTS = 9
+eventNames = ["OwnReadM", "OwnReadP", "OwnWriteM", "OwnWriteP", "Replacement", "OtherRead", "OtherWrite", ORDERED, DATA]
+
+# messages of the dense memory tables
+GETS = 0
+GETM = 1
+PUTM = 2
+MESSAGES = 3
+messageNames = ["GetS", "GetM", "PutM"]
+requestMessages = {READ: GETS, WRITE: GETM, REPLACEMENT: PUTM}
+
+# simulator events
+ARRIVE = 0
+RESUME = 1
+
+# bus messages, for the occupancy counts
+REQUEST_MSG = 0
+RESPONSE_MSG = 1
+DATA_MSG = 2
+
+# latencies are folded into histograms every FOLD_BATCH requests
+FOLD_BATCH = 1 << 16
+
+# binary trace: a header, then fixed-width records in the order of the text trace
+TRACE_MAGIC = b"SYNTRACE"
+TRACE_VERSION = 1
+traceHeader = struct.Struct("<8sIIIQ4x")
+traceRecord = np.dtype([("address", "<u8"), ("core", "<u2"), ("op", "u1"), ("pad", "u1")])
+traceOps = {"R": READ, "W": WRITE}
+
+class CompiledTables:
+    # the synthesized FSMs as dense integer tables, -1 where an event is not handled
+    def __init__(self, protocol, configModel):
+        m = SystemModel(protocol, configModel)
+        self.model = m
+        self.configModel = configModel
+        n = len(m.cacheStates)
+
+        self.nextState = np.full((n, EVENTS), -1, dtype=np.int32)
+        self.flags = np.zeros((n, EVENTS), dtype=np.int8)
+        for ((s, e), options) in m.cacheNext.items():
+            if (e in eventNames):
+                (d, f) = options[0]
+                self.nextState[s, eventNames.index(e)] = d
+                self.flags[s, eventNames.index(e)] = f
+        self.stable = np.array(m.stable, dtype=bool)
+        self.owner = np.array(m.owner, dtype=bool)
+        self.intended = np.array([i if d == None else d for (i, d) in enumerate(m.intended)], dtype=np.int32)
+
+        k = len(m.memStates)
+        self.memNext = np.full((k, MESSAGES), -1, dtype=np.int32)
+        self.memStall = np.zeros((k, MESSAGES), dtype=bool)
+        for ((src, msg), options) in m.memNext.items():
+            self.memNext[src, messageNames.index(msg)] = options[0]
+        for (src, msg) in m.memStalls:
+            if (msg in messageNames):
+                self.memStall[src, messageNames.index(msg)] = True
+        # memory state once the data it waits for arrives, after a PutM or after a GetS/GetM
+        self.memReceive = np.arange(k, dtype=np.int32)
+        self.memWriteBack = np.arange(k, dtype=np.int32)
+        for i in range(k):
+            if (m.memStable[i]):
+                continue
+            received = m.memInternal.get((i, False), [])
+            writtenBack = m.memInternal.get((i, True), []) + received
+            if (len(received) > 0):
+                self.memReceive[i] = received[0]
+            if (len(writtenBack) > 0):
+                self.memWriteBack[i] = writtenBack[0]
+        self.memStable = np.array(m.memStable, dtype=bool)
+
+        # the pre-ordered state a request is re-targeted to when its M/P variant changed
+        self.retarget = dict(((s, kind, v), d) for ((s, kind, v), d) in m.retarget.items())
+        self.invalidState = m.invalidState
+
+    def stateName(self, i):
+        return self.model.cacheStates[i].getStateString()
+
+class RandomWorkload:
+    # per-core request streams of uniformly chosen lines and operations
+    def __init__(self, numCores, requests, lines=1, writeRatio=0.3, replacementRatio=0.05, seed=1):
+        rng = np.random.default_rng(seed)
+        perCore = (requests + numCores - 1) // numCores
+        self.numCores = numCores
+        self.lineArrays = []
+        self.opArrays = []
+        for c in range(numCores):
+            count = min(perCore, requests - c * perCore) if c * perCore < requests else 0
+            draw = rng.random(count)
+            ops = np.full(count, READ, dtype=np.int8)
+            ops[draw < writeRatio + replacementRatio] = WRITE
+            ops[draw < replacementRatio] = REPLACEMENT
+            self.lineArrays.append(rng.integers(0, lines, count))
+            self.opArrays.append(ops)
+        self.lines = [a.tolist() for a in self.lineArrays]
+        self.ops = [a.tolist() for a in self.opArrays]
+        self.position = [0] * numCores
+
+    def nextRequest(self, c):
+        i = self.position[c]
+        if (i >= len(self.ops[c])):
+            return None
+        self.position[c] = i + 1
+        return (self.lines[c][i], self.ops[c][i])
+
+    # all requests in bus order (the cores take turns), as (cores, lines, ops) arrays
+    def batches(self, size):
+        cores = np.concatenate([np.full(len(a), c, dtype=np.int64) for (c, a) in enumerate(self.opArrays)])
+        turns = np.concatenate([np.arange(len(a)) for a in self.opArrays])
+        order = np.lexsort((cores, turns))
+        lines = np.concatenate(self.lineArrays)[order]
+        ops = np.concatenate(self.opArrays)[order]
+        cores = cores[order]
+        for i in range(0, len(order), size):
+            yield (cores[i:i + size], lines[i:i + size], ops[i:i + size])
+
+# streams the per-core requests of a binary trace: every core has its own cursor into the
+# memory-mapped records and buffers at most one batch of its requests
+class TraceWorkload:
+    def __init__(self, path, numCores=None, lineSize=64, batch=1 << 16):
+        (self.numCores, self.records) = openTrace(path)
+        if (numCores != None and numCores < self.numCores):
+            raise ValueError(path+" has requests of "+str(self.numCores)+" cores")
+        if (numCores != None):
+            self.numCores = numCores
+        self.numCores = max(1, self.numCores)
+        self.lineBits = lineSize.bit_length() - 1
+        self.batch = batch
+        self.cursors = [0] * self.numCores
+        self.lines = [[] for c in range(self.numCores)]
+        self.ops = [[] for c in range(self.numCores)]
+        self.next = [0] * self.numCores
+
+    def refill(self, c):
+        # scan forward from the core's cursor one window of records at a time until some of its
+        # requests turn up; a window holds one batch, so the buffer never grows beyond that
+        position = self.cursors[c]
+        found = []
+        while (len(found) == 0 and position < len(self.records)):
+            chunk = self.records[position:position + self.batch]
+            found = np.flatnonzero(chunk["core"] == c)
+            position = position + len(chunk)
+        self.cursors[c] = position
+        if (len(found) == 0):
+            return False
+        self.lines[c] = (chunk["address"][found] >> np.uint64(self.lineBits)).tolist()
+        self.ops[c] = chunk["op"][found].tolist()
+        self.next[c] = 0
+        return True
+
+    def nextRequest(self, c):
+        i = self.next[c]
+        if (i >= len(self.ops[c])):
+            if (not self.refill(c)):
+                return None
+            i = 0
+        self.next[c] = i + 1
+        return (self.lines[c][i], self.ops[c][i])
+
+    # all requests in trace order, which is taken as the bus order
+    def batches(self, size):
+        for i in range(0, len(self.records), size):
+            chunk = self.records[i:i + size]
+            yield (chunk["core"].astype(np.int64), chunk["address"] >> np.uint64(self.lineBits), chunk["op"])
+
+def openTrace(path):
+    with open(path, "rb") as f:
+        header = f.read(traceHeader.size)
+    if (len(header) < traceHeader.size):
+        raise ValueError(path+" is not a trace file")
+    (magic, version, recordSize, numCores, count) = traceHeader.unpack(header)
+    if (magic != TRACE_MAGIC or recordSize != traceRecord.itemsize):
+        raise ValueError(path+" is not a trace file")
+    if (version != TRACE_VERSION):
+        raise ValueError(path+" has trace format version "+str(version)+", expected "+str(TRACE_VERSION))
+    if (count == 0):
+        return (numCores, np.zeros(0, dtype=traceRecord))
+    return (numCores, np.memmap(path, dtype=traceRecord, mode="r", offset=traceHeader.size, shape=(count,)))
+
+# text trace: one "<core> <address> <R|W>" request per line, the address in decimal or 0x hex
+def convertTrace(textPath, binaryPath, batch = 1 << 18):
+    count = 0
+    numCores = 0
+    with open(textPath, "r") as src, open(binaryPath, "wb") as dst:
+        dst.write(traceHeader.pack(TRACE_MAGIC, TRACE_VERSION, traceRecord.itemsize, 0, 0))
+        records = np.zeros(batch, dtype=traceRecord)
+        n = 0
+        for (number, text) in enumerate(src, 1):
+            fields = text.split("#")[0].replace(",", " ").split()
+            if (len(fields) == 0):
+                continue
+            try:
+                records[n] = (int(fields[1], 0), int(fields[0]), traceOps[fields[2].upper()], 0)
+            except (ValueError, KeyError, IndexError, OverflowError):
+                raise ValueError(textPath+":"+str(number)+": expected <core> <address> <R|W>, got '"+text.strip()+"'")
+            n = n + 1
+            if (n == batch):
+                numCores = max(numCores, int(records["core"].max()) + 1)
+                records.tofile(dst)
+                count = count + n
+                n = 0
+        if (n > 0):
+            numCores = max(numCores, int(records["core"][:n].max()) + 1)
+            records[:n].tofile(dst)
+            count = count + n
+        dst.seek(0)
+        dst.write(traceHeader.pack(TRACE_MAGIC, TRACE_VERSION, traceRecord.itemsize, numCores, count))
+    return (numCores, count)
+
+class SimulationResult:
+    def __init__(self, numCores):
+        self.numCores = numCores
+        self.requests = 0
+        self.hits = 0
+        self.cycles = 0
+        self.seconds = 0.0
+        # requests completed since the last fold
+        self.latencies = array("q")
+        self.kinds = array("b")
+        self.cores = array("h")
+        self.missFlags = array("b")
+        # folded statistics: latency histograms in cycles, per-core histograms in slots
+        self.histogram = np.zeros(1, dtype=np.int64)
+        self.missHistogram = np.zeros(1, dtype=np.int64)
+        self.coreHistogram = np.zeros((numCores, 1), dtype=np.int64)
+        self.coreSum = np.zeros(numCores, dtype=np.int64)
+        self.kindCount = np.zeros(4, dtype=np.int64)
+        self.kindMax = np.zeros(4, dtype=np.int64)
+        self.busySlots = 0
+        self.slotUse = np.zeros((numCores, 3), dtype=np.int64)
+        self.memoryStalls = 0
+        self.unhandled = {}
+        self.stuck = None
+
+    def fold(self, slotWidth):
+        if (len(self.latencies) == 0):
+            return
+        lat = np.frombuffer(self.latencies, dtype=np.int64).copy()
+        kinds = np.frombuffer(self.kinds, dtype=np.int8).copy()
+        cores = np.frombuffer(self.cores, dtype=np.int16).copy()
+        misses = np.frombuffer(self.missFlags, dtype=np.int8).astype(bool)
+        del self.latencies[:]
+        del self.kinds[:]
+        del self.cores[:]
+        del self.missFlags[:]
+
+        self.requests = self.requests + len(lat)
+        self.histogram = addCounts(self.histogram, np.bincount(lat))
+        self.missHistogram = addCounts(self.missHistogram, np.bincount(lat[misses]))
+        slots = lat // slotWidth
+        width = max(self.coreHistogram.shape[1], int(slots.max()) + 1)
+        if (width > self.coreHistogram.shape[1]):
+            grown = np.zeros((self.numCores, width), dtype=np.int64)
+            grown[:, :self.coreHistogram.shape[1]] = self.coreHistogram
+            self.coreHistogram = grown
+        np.add.at(self.coreHistogram, (cores, slots), 1)
+        np.add.at(self.coreSum, cores, lat)
+        np.add.at(self.kindCount, kinds, 1)
+        np.maximum.at(self.kindMax, kinds, lat)
+
+def addCounts(a, b):
+    if (len(b) > len(a)):
+        (a, b) = (b, a)
+    a[:len(b)] += b
+    return a
+
+# smallest value at or above the q quantile of a histogram
+def histogramPercentile(hist, q):
+    cumulative = np.cumsum(hist)
+    return int(np.searchsorted(cumulative, q * cumulative[-1]))
+
+def histogramMean(hist):
+    return float(np.dot(np.arange(len(hist)), hist)) / max(1, int(hist.sum()))
+
+class BusSimulator:
+    def __init__(self, tables, numCores, slotWidth=50, hitLatency=1):
+        self.tables = tables
+        self.numCores = numCores
+        self.slotWidth = slotWidth
+        self.hitLatency = hitLatency
+        self.forwardSlots = 1 if tables.configModel == "memory" else 0
+        if (tables.invalidState == None):
+            raise ValueError("protocol has no invalid stable state")
+
+    def run(self, workload):
+        t = self.tables
+        N = self.numCores
+        W = self.slotWidth
+        nxt = t.nextState.tolist()
+        flg = t.flags.tolist()
+        stable = t.stable.tolist()
+        ownerState = t.owner.tolist()
+        intended = t.intended.tolist()
+        memNext = t.memNext.tolist()
+        memStall = t.memStall.tolist()
+        memReceive = t.memReceive.tolist()
+        memWriteBack = t.memWriteBack.tolist()
+        memStable = t.memStable.tolist()
+        retarget = t.retarget
+        invalid = t.invalidState
+        forward = self.forwardSlots
+        hitLatency = self.hitLatency
+
+        result = SimulationResult(N)
+        latencies = result.latencies
+        kinds = result.kinds
+        cores = result.cores
+        missFlags = result.missFlags
+        slotUse = result.slotUse
+        unhandled = result.unhandled
+
+        # per line: cache state of every core, owner core (-1: memory) and memory state
+        lineStates = {}
+        lineOwner = {}
+        lineMem = {}
+        # message that left the memory waiting for data
+        lineMemMsg = {}
+        # per core: the request in flight (line, kind, issue cycle), ordered yet, line it waits on for data
+        reqLine = [None] * N
+        reqKind = [0] * N
+        issued = [0] * N
+        ordered = [False] * N
+        waitLine = [None] * N
+        blocked = [False] * N
+        # per core: lines whose transient state has a response to order, caches waiting on its data
+        # and the slot the oldest of them started waiting
+        responses = [{} for c in range(N)]
+        waiters = [{} for c in range(N)]
+        owedSince = [{} for c in range(N)]
+        memWaiters = {}
+        events = {}
+
+        def statesOf(line):
+            states = lineStates.get(line)
+            if (states == None):
+                states = [invalid] * N
+                lineStates[line] = states
+                lineOwner[line] = -1
+                lineMem[line] = 0
+            return states
+
+        def complete(c, finish, miss=True):
+            latencies.append(finish - issued[c])
+            kinds.append(reqKind[c])
+            cores.append(c)
+            missFlags.append(miss)
+            if (len(latencies) >= FOLD_BATCH):
+                result.fold(W)
+            reqLine[c] = None
+            reqKind[c] = 0
+            waitLine[c] = None
+            ordered[c] = False
+
+        def unhandledEvent(s, e):
+            key = (t.stateName(s), eventNames[e])
+            unhandled[key] = unhandled.get(key, 0) + 1
+
+        # core c takes requests from cycle T on, hits are served locally until the end of slot k
+        def start(c, T, k):
+            limit = (k + 1) * W
+            while (True):
+                if (reqLine[c] == None):
+                    request = workload.nextRequest(c)
+                    if (request == None):
+                        return
+                    (line, kind) = request
+                    reqLine[c] = line
+                    reqKind[c] = kind
+                    issued[c] = T
+                line = reqLine[c]
+                kind = reqKind[c]
+                states = statesOf(line)
+                s = states[c]
+                if (not stable[s]):
+                    # a response on this line is still outstanding
+                    blocked[c] = True
+                    return
+                blocked[c] = False
+                owner = lineOwner[line]
+                if (kind == READ):
+                    e = OWN_READ_P if owner >= 0 and owner != c else OWN_READ_M
+                elif (kind == WRITE):
+                    e = OWN_WRITE_P if owner >= 0 and owner != c else OWN_WRITE_M
+                else:
+                    e = REPLACE
+                d = nxt[s][e]
+                if (d >= 0 and not stable[d]):
+                    states[c] = d
+                    return
+                if (d < 0 and not (kind == REPLACEMENT and s == invalid)):
+                    unhandledEvent(s, e)
+                elif (d >= 0):
+                    states[c] = d
+                    if (owner == c and not ownerState[d]):
+                        lineOwner[line] = -1
+                result.hits = result.hits + 1
+                T = T + hitLatency
+                complete(c, T, False)
+                if (T >= limit):
+                    k = T // W
+                    events.setdefault(k, []).append((RESUME, c, T))
+                    return
+
+        def schedule(k, c, line):
+            events.setdefault(k, []).append((ARRIVE, c, line))
+
+        # data reaching the memory, which may complete its transient state
+        def memoryData(line, k):
+            mem = lineMem[line]
+            if (memStable[mem]):
+                return
+            mem = memWriteBack[mem] if lineMemMsg.get(line) == PUTM else memReceive[mem]
+            lineMem[line] = mem
+            if (memStable[mem]):
+                for w in memWaiters.pop(line, []):
+                    schedule(k + 1, w, line)
+
+        def sendData(c, line, k):
+            owedSince[c].pop(line, None)
+            for w in waiters[c].pop(line, []):
+                schedule(k + 1 + forward, w, line)
+            memoryData(line, k)
+
+        def orderResponse(c, line, k):
+            states = lineStates[line]
+            s = states[c]
+            d = nxt[s][ORDER]
+            f = flg[s][ORDER]
+            del responses[c][line]
+            states[c] = d
+            if (not stable[d] and nxt[d][ORDER] >= 0):
+                responses[c][line] = True
+            if (f & (SEND_DATA | WRITE_BACK)):
+                sendData(c, line, k)
+            if (stable[d] and blocked[c] and reqLine[c] == line):
+                events.setdefault(k + 1, []).append((RESUME, c, (k + 1) * W))
+
+        def orderRequest(c, k):
+            line = reqLine[c]
+            kind = reqKind[c]
+            states = lineStates[line]
+            s = states[c]
+            owner = lineOwner[line]
+            if (kind != REPLACEMENT):
+                s = retarget.get((s, kind, "P" if owner >= 0 and owner != c else "M"), s)
+            msg = requestMessages[kind]
+            if (kind == REPLACEMENT and owner != c):
+                # the memory drops a write-back from a cache that lost ownership before it was ordered
+                msg = None
+            mem = lineMem[line]
+            if (msg != None and memStall[mem][msg]):
+                result.memoryStalls = result.memoryStalls + 1
+                return False
+            d = nxt[s][ORDER]
+            f = flg[s][ORDER]
+            states[c] = d
+            ordered[c] = True
+
+            newOwner = owner
+            if (kind == WRITE or (kind == READ and ownerState[intended[d]])):
+                newOwner = c
+            elif (kind == REPLACEMENT and owner == c):
+                newOwner = -1
+
+            if (msg != None and memNext[mem][msg] >= 0):
+                lineMem[line] = memNext[mem][msg]
+                lineMemMsg[line] = msg
+
+            # every other cache snoops the request in the same slot
+            supplier = -1
+            if (kind != REPLACEMENT):
+                observed = OTHER_READ if kind == READ else OTHER_WRITE
+                for j in range(N):
+                    if (j == c):
+                        continue
+                    sj = states[j]
+                    dj = nxt[sj][observed]
+                    if (dj < 0):
+                        unhandledEvent(sj, observed)
+                        continue
+                    fj = flg[sj][observed]
+                    states[j] = dj
+                    if (not stable[dj] and nxt[dj][ORDER] >= 0 and not (reqLine[j] == line and not ordered[j])):
+                        responses[j][line] = True
+                    if (fj & SEND_DATA):
+                        if (supplier < 0 or j == owner):
+                            supplier = j
+                    elif (j == owner and not stable[dj] and supplier < 0):
+                        # the owner hands the block on once its own data or response is through
+                        supplier = j
+                    if (j == owner and newOwner == owner and not ownerState[intended[dj]]):
+                        newOwner = -1
+            lineOwner[line] = newOwner
+
+            if (f & (SEND_DATA | WRITE_BACK) or (kind == REPLACEMENT and msg != None)):
+                sendData(c, line, k)
+
+            if (kind != REPLACEMENT and nxt[d][DATA_IN] >= 0):
+                waitLine[c] = line
+                if (supplier >= 0):
+                    waiters[supplier].setdefault(line, []).append(c)
+                    owedSince[supplier].setdefault(line, k)
+                elif (owner == c or memStable[lineMem[line]]):
+                    schedule(k + 1, c, line)
+                else:
+                    memWaiters.setdefault(line, []).append(c)
+            else:
+                if (not stable[d] and nxt[d][ORDER] >= 0):
+                    responses[c][line] = True
+                complete(c, (k + 1) * W)
+                events.setdefault(k + 1, []).append((RESUME, c, (k + 1) * W))
+            return True
+
+        def arrive(c, line, k):
+            states = lineStates[line]
+            s = states[c]
+            d = nxt[s][DATA_IN]
+            if (d < 0):
+                unhandledEvent(s, DATA_IN)
+                return
+            states[c] = d
+            if (not stable[d] and nxt[d][ORDER] >= 0):
+                responses[c][line] = True
+            if (waitLine[c] == line):
+                complete(c, k * W)
+                start(c, k * W, k)
+
+        start0 = time.time()
+        for c in range(N):
+            start(c, 0, 0)
+
+        k = 0
+        idle = 0
+        while (True):
+            for (kind, c, x) in events.pop(k, ()):
+                if (kind == ARRIVE):
+                    arrive(c, x, k)
+                else:
+                    start(c, x, k)
+
+            # the slot owner sends one message
+            c = k % N
+            acted = False
+            if (len(responses[c]) > 0):
+                orderResponse(c, next(iter(responses[c])), k)
+                slotUse[c][RESPONSE_MSG] += 1
+                acted = True
+            else:
+                owed = None
+                for line in waiters[c]:
+                    if (waitLine[c] != line):
+                        owed = line
+                        break
+                # owed data and the core's own request go out in arrival order, except that a read or
+                # write has to wait until the data the core owes for its line is handed on
+                ready = reqLine[c] != None and not ordered[c] and not blocked[c] and issued[c] <= k * W
+                if (ready and reqKind[c] != REPLACEMENT and reqLine[c] in waiters[c]):
+                    ready = False
+                if (ready and (owed == None or issued[c] < owedSince[c][owed] * W)):
+                    acted = orderRequest(c, k)
+                    if (acted):
+                        slotUse[c][REQUEST_MSG] += 1
+                if (not acted and owed != None):
+                    sendData(c, owed, k)
+                    slotUse[c][DATA_MSG] += 1
+                    acted = True
+
+            if (acted):
+                result.busySlots = result.busySlots + 1
+                idle = 0
+            else:
+                idle = idle + 1
+            k = k + 1
+
+            if (len(events) == 0 and all(r == None for r in reqLine)):
+                break
+            if (idle > 1000 * N):
+                result.stuck = "no bus message for "+str(idle)+" slots; waiting: "+", ".join("core "+str(j)+" "+t.stateName(lineStates[reqLine[j]][j]) for j in range(N) if reqLine[j] != None)
+                break
+
+        result.fold(W)
+        result.cycles = k * W
+        result.seconds = time.time() - start0
+        return result
+
+    def printResult(self, result):
+        W = self.slotWidth
+        print ("Simulated "+str(result.requests)+" requests ("+str(self.numCores)+" cores, "+self.tables.configModel+" model, "+str(W)+"-cycle slots) in "+str(round(result.seconds, 2))+" s ("+str(int(result.requests / result.seconds if result.seconds > 0 else 0))+" requests/s)")
+        if (result.requests > 0):
+            hist = result.histogram
+            slots = result.cycles // W
+            print ("Hits: "+str(result.hits)+", bus slots used: "+str(result.busySlots)+" of "+str(slots)+", memory stalls: "+str(result.memoryStalls))
+            print ("Latency (cycles): mean "+str(round(histogramMean(hist), 1))+", p50 "+str(histogramPercentile(hist, 0.5))+", p99 "+str(histogramPercentile(hist, 0.99))+", max "+str(len(hist) - 1)+" ("+str(round((len(hist) - 1) / W, 1))+" slots)")
+            misses = result.missHistogram
+            if (misses.sum() > 0):
+                print ("Miss latency (cycles): mean "+str(round(histogramMean(misses), 1))+", p50 "+str(histogramPercentile(misses, 0.5))+", p99 "+str(histogramPercentile(misses, 0.99))+", max "+str(len(misses) - 1))
+            for (kind, name) in ((READ, "read"), (WRITE, "write"), (REPLACEMENT, "replacement")):
+                if (result.kindCount[kind] > 0):
+                    print ("  "+name+": "+str(result.kindCount[kind])+" requests, max "+str(result.kindMax[kind])+" cycles")
+            # per-core latency and share of the core's own bus slots in use
+            ownSlots = max(1, slots // self.numCores)
+            for c in range(self.numCores):
+                h = result.coreHistogram[c]
+                n = int(h.sum())
+                if (n == 0):
+                    continue
+                use = result.slotUse[c]
+                print ("  core "+str(c)+": "+str(n)+" requests, mean "+str(round(float(result.coreSum[c]) / n, 1))+" cycles, p99 "+str(histogramPercentile(h, 0.99))+" slots, max "+str(int(np.flatnonzero(h)[-1]))+" slots; bus "+str(round(100.0 * int(use.sum()) / ownSlots, 1))+"% of own slots ("+str(use[REQUEST_MSG])+" requests, "+str(use[RESPONSE_MSG])+" responses, "+str(use[DATA_MSG])+" data)")
+            # latency histogram in slots
+            bins = result.coreHistogram.sum(axis=0)
+            print ("Latency distribution (slots: requests): "+", ".join(str(i)+": "+str(int(n)) for (i, n) in enumerate(bins) if n > 0))
+        for ((s, e), n) in sorted(result.unhandled.items()):
+            print ("Unhandled event: "+e+" in "+s+" ("+str(n)+" times)")
+        if (result.stuck != None):
+            print ("Simulation stopped: "+result.stuck)
+
+# dense ids for the lines of a request stream, in order of first use
+class LineIndex:
+    def __init__(self):
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def ids(self, lines):
+        (unique, inverse) = np.unique(lines, return_inverse=True)
+        ids = np.fromiter((self.index.setdefault(u, len(self.index)) for u in unique.tolist()), dtype=np.int64, count=len(unique))
+        return ids[inverse]
+
+class FunctionalResult:
+    def __init__(self, tables, numCores):
+        self.numCores = numCores
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.responses = 0
+        self.transitions = 0
+        self.unhandled = np.zeros((len(tables.model.cacheStates), EVENTS), dtype=np.int64)
+        self.states = None
+        self.seconds = 0.0
+
+    def sameAs(self, other):
+        return ((self.requests, self.hits, self.misses, self.responses, self.transitions) == (other.requests, other.hits, other.misses, other.responses, other.transitions)
+                and np.array_equal(self.unhandled, other.unhandled) and np.array_equal(self.states, other.states))
+
+# Untimed simulation over an atomic bus: every request runs to completion in bus order.
+# A miss is ordered, snooped by the other caches, gets its data, and the responses it
+# triggered (X_A states) are ordered before the next request. runScalar applies one
+# request at a time; runVectorized keeps the state of every (line, core) pair in one
+# array and applies a round of requests to distinct lines at once.
+class FunctionalSimulator:
+    def __init__(self, tables, numCores):
+        self.tables = tables
+        self.numCores = numCores
+        if (tables.invalidState == None):
+            raise ValueError("protocol has no invalid stable state")
+
+    def runScalar(self, workload, batch=1 << 20):
+        t = self.tables
+        N = self.numCores
+        nxt = t.nextState.tolist()
+        stable = t.stable.tolist()
+        ownerState = t.owner.tolist()
+        invalid = t.invalidState
+        steps = len(nxt)
+        result = FunctionalResult(t, N)
+        unhandled = result.unhandled
+        index = LineIndex()
+        rows = []
+        start = time.time()
+
+        for (cores, lines, ops) in workload.batches(batch):
+            ids = index.ids(lines)
+            while (len(rows) < len(index)):
+                rows.append([invalid] * N)
+            for (c, line, op) in zip(cores.tolist(), ids.tolist(), ops.tolist()):
+                row = rows[line]
+                result.requests = result.requests + 1
+                s = row[c]
+                otherOwner = any(ownerState[row[j]] for j in range(N) if j != c)
+                if (op == READ):
+                    e = OWN_READ_P if otherOwner else OWN_READ_M
+                elif (op == WRITE):
+                    e = OWN_WRITE_P if otherOwner else OWN_WRITE_M
+                else:
+                    e = REPLACE
+                d = nxt[s][e]
+                if (d < 0):
+                    if (not (op == REPLACEMENT and s == invalid)):
+                        unhandled[s][e] += 1
+                    result.hits = result.hits + 1
+                    continue
+                result.transitions = result.transitions + 1
+                if (stable[d]):
+                    row[c] = d
+                    result.hits = result.hits + 1
+                    continue
+                result.misses = result.misses + 1
+                d2 = nxt[d][ORDER]
+                if (d2 < 0):
+                    unhandled[d][ORDER] += 1
+                    row[c] = d
+                    continue
+                row[c] = d2
+                result.transitions = result.transitions + 1
+                if (op != REPLACEMENT):
+                    observed = OTHER_READ if op == READ else OTHER_WRITE
+                    for j in range(N):
+                        if (j == c):
+                            continue
+                        dj = nxt[row[j]][observed]
+                        if (dj < 0):
+                            unhandled[row[j]][observed] += 1
+                        else:
+                            row[j] = dj
+                            result.transitions = result.transitions + 1
+                dd = nxt[row[c]][DATA_IN]
+                if (dd >= 0):
+                    row[c] = dd
+                    result.transitions = result.transitions + 1
+                for j in range(N):
+                    for step in range(steps):
+                        if (stable[row[j]] or nxt[row[j]][ORDER] < 0):
+                            break
+                        row[j] = nxt[row[j]][ORDER]
+                        result.responses = result.responses + 1
+                        result.transitions = result.transitions + 1
+
+        result.states = np.array(rows, dtype=np.int32).reshape(len(rows), N)
+        result.seconds = time.time() - start
+        return result
+
+    def runVectorized(self, workload, batch=1 << 20):
+        t = self.tables
+        N = self.numCores
+        nxt = t.nextState
+        stable = t.stable
+        ownerState = t.owner
+        invalid = t.invalidState
+        steps = len(nxt)
+        result = FunctionalResult(t, N)
+        unhandled = result.unhandled
+        index = LineIndex()
+        states = np.full((1024, N), invalid, dtype=np.int32)
+        columns = np.arange(N)
+        start = time.time()
+
+        for (cores, lines, ops) in workload.batches(batch):
+            ids = index.ids(lines)
+            if (len(index) > len(states)):
+                grown = np.full((max(len(index), 2 * len(states)), N), invalid, dtype=np.int32)
+                grown[:len(states)] = states
+                states = grown
+            result.requests = result.requests + len(ids)
+            ops = ops.astype(np.int64)
+
+            # round r holds the r-th request of every line in this batch, so its lines are distinct
+            order = np.argsort(ids, kind="stable")
+            sortedIds = ids[order]
+            starts = np.flatnonzero(np.r_[True, sortedIds[1:] != sortedIds[:-1]])
+            rank = np.empty(len(ids), dtype=np.int64)
+            rank[order] = np.arange(len(ids)) - np.repeat(starts, np.diff(np.r_[starts, len(ids)]))
+            byRank = np.argsort(rank, kind="stable")
+            bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+
+            for r in range(len(bounds) - 1):
+                sel = byRank[bounds[r]:bounds[r + 1]]
+                l = ids[sel]
+                c = cores[sel]
+                o = ops[sel]
+                rows = states[l]
+                s = rows[np.arange(len(l)), c]
+                owners = ownerState[rows]
+                owners[np.arange(len(l)), c] = False
+                otherOwner = owners.any(axis=1)
+                e = np.where(o == READ, np.where(otherOwner, OWN_READ_P, OWN_READ_M), np.where(o == WRITE, np.where(otherOwner, OWN_WRITE_P, OWN_WRITE_M), REPLACE))
+                d = nxt[s, e]
+
+                missing = d < 0
+                bad = missing & ~((o == REPLACEMENT) & (s == invalid))
+                np.add.at(unhandled, (s[bad], e[bad]), 1)
+                hit = ~missing & stable[np.maximum(d, 0)]
+                result.hits = result.hits + int(missing.sum()) + int(hit.sum())
+                result.transitions = result.transitions + int((~missing).sum())
+                states[l[hit], c[hit]] = d[hit]
+
+                miss = ~missing & ~hit
+                if (not miss.any()):
+                    continue
+                result.misses = result.misses + int(miss.sum())
+                l = l[miss]
+                c = c[miss]
+                o = o[miss]
+                d = d[miss]
+                rows = rows[miss]
+                i = np.arange(len(l))
+                d2 = nxt[d, ORDER]
+                stuck = d2 < 0
+                np.add.at(unhandled, (d[stuck], np.full(int(stuck.sum()), ORDER)), 1)
+                rows[i, c] = np.where(stuck, d, d2)
+                result.transitions = result.transitions + int((~stuck).sum())
+                go = ~stuck
+
+                # snoops of the other caches
+                observed = np.where(o == READ, OTHER_READ, OTHER_WRITE)
+                dj = nxt[rows, observed[:, None]]
+                snooping = (go & (o != REPLACEMENT))[:, None] & (columns[None, :] != c[:, None])
+                bad = snooping & (dj < 0)
+                np.add.at(unhandled, (rows[bad], np.broadcast_to(observed[:, None], rows.shape)[bad]), 1)
+                handled = snooping & (dj >= 0)
+                rows = np.where(handled, dj, rows)
+                result.transitions = result.transitions + int(handled.sum())
+
+                # data for the requester
+                mine = rows[i, c]
+                dd = nxt[mine, DATA_IN]
+                got = go & (dd >= 0)
+                rows[i[got], c[got]] = dd[got]
+                result.transitions = result.transitions + int(got.sum())
+
+                # responses, one ordering step at a time
+                active = go[:, None]
+                for step in range(steps):
+                    nextOrder = nxt[rows, ORDER]
+                    pending = active & ~stable[rows] & (nextOrder >= 0)
+                    count = int(pending.sum())
+                    if (count == 0):
+                        break
+                    rows = np.where(pending, nextOrder, rows)
+                    result.responses = result.responses + count
+                    result.transitions = result.transitions + count
+                states[l] = rows
+
+        result.states = states[:len(index)].copy()
+        result.seconds = time.time() - start
+        return result
+
+    def printResult(self, result, mode):
+        rate = result.transitions / result.seconds if result.seconds > 0 else 0.0
+        print ("Applied "+str(result.requests)+" requests to "+str(len(result.states))+" lines ("+str(self.numCores)+" cores, atomic bus, "+mode+") in "+str(round(result.seconds, 2))+" s ("+str(int(rate))+" line transitions/s)")
+        print ("Hits: "+str(result.hits)+", misses: "+str(result.misses)+", responses: "+str(result.responses)+", transitions: "+str(result.transitions))
+        for (s, e) in zip(*np.nonzero(result.unhandled)):
+            print ("Unhandled event: "+eventNames[e]+" in "+self.tables.stateName(s)+" ("+str(result.unhandled[s, e])+" times)")
+
+def simulateProtocol(protocol, configModel, numCores, requests, lines=1, writeRatio=0.3, replacementRatio=0.05, slotWidth=50, seed=1):
+    tables = CompiledTables(protocol, configModel)
+    simulator = BusSimulator(tables, numCores, slotWidth)
+    result = simulator.run(RandomWorkload(numCores, requests, lines, writeRatio, replacementRatio, seed))
+    simulator.printResult(result)
+    return result
+
+def replayTrace(protocol, configModel, tracePath, numCores=None, lineSize=64, slotWidth=50):
+    workload = TraceWorkload(tracePath, numCores, lineSize)
+    tables = CompiledTables(protocol, configModel)
+    simulator = BusSimulator(tables, workload.numCores, slotWidth)
+    result = simulator.run(workload)
+    simulator.printResult(result)
+    return result
+
+# mode: "scalar", "vectorized", or "check" to run both and compare them
+def simulateFunctional(protocol, configModel, workload, mode="vectorized"):
+    tables = CompiledTables(protocol, configModel)
+    simulator = FunctionalSimulator(tables, workload.numCores)
+    if (mode == "scalar"):
+        result = simulator.runScalar(workload)
+        simulator.printResult(result, "scalar")
+        return result
+    result = simulator.runVectorized(workload)
+    simulator.printResult(result, "vectorized")
+    if (mode == "check"):
+        reference = simulator.runScalar(workload)
+        simulator.printResult(reference, "scalar")
+        if (not result.sameAs(reference)):
+            raise RuntimeError("vectorized and scalar simulation differ")
+        print ("Vectorized and scalar results are identical")
+    return result
+
+def main(argv):
+    inputfile = ' '
+    configModel = 'direct'
+    numCores = 4
+    requests = 100000
+    lines = 1
+    writeRatio = 0.3
+    replacementRatio = 0.05
+    slotWidth = 50
+    seed = 1
+    tracePath = None
+    textTrace = None
+    outputPath = None
+    lineSize = 64
+    coresGiven = False
+    functional = None
+
+    usage = ('simulator.py -i <input-protocol> -s <system-model> [-n <cores>] [-r <requests>] [-l <lines>] [--writes=<ratio>] [--replacements=<ratio>] [--slot=<cycles>] [--seed=<seed>]\n'
+             '             [-t <binary trace> [--line-size=<bytes>]] [--functional | --vectorized | --check]\n'
+             'simulator.py --convert=<text trace> -o <binary trace>')
+    try:
+        opts, args = getopt.getopt(argv, "hi:s:n:r:l:t:o:", ["ifile=", "system-model=", "cores=", "requests=", "lines=", "writes=", "replacements=", "slot=", "seed=", "trace=", "convert=", "line-size=", "functional", "vectorized", "check"])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-s", "--system-model"):
+            configModel = arg
+        elif opt in ("-n", "--cores"):
+            numCores = int(arg)
+            coresGiven = True
+        elif opt in ("-r", "--requests"):
+            requests = int(arg)
+        elif opt in ("-l", "--lines"):
+            lines = int(arg)
+        elif opt == "--writes":
+            writeRatio = float(arg)
+        elif opt == "--replacements":
+            replacementRatio = float(arg)
+        elif opt == "--slot":
+            slotWidth = int(arg)
+        elif opt == "--seed":
+            seed = int(arg)
+        elif opt in ("-t", "--trace"):
+            tracePath = arg
+        elif opt == "--convert":
+            textTrace = arg
+        elif opt == "-o":
+            outputPath = arg
+        elif opt == "--line-size":
+            lineSize = int(arg)
+        elif opt == "--functional":
+            functional = "scalar"
+        elif opt == "--vectorized":
+            functional = "vectorized"
+        elif opt == "--check":
+            functional = "check"
+
+    if (textTrace != None):
+        if (outputPath == None):
+            print (usage)
+            sys.exit(2)
+        try:
+            (cores, count) = convertTrace(textTrace, outputPath)
+        except ValueError as e:
+            print (str(e))
+            sys.exit(2)
+        print ("Wrote "+str(count)+" requests of "+str(cores)+" cores to "+outputPath)
+        return
+
+    try:
+        protocol = synthia.openProtocol(inputfile, configModel)
+    except (synthia.SpecError, synthia.ProtocolFileError) as e:
+        print (str(e))
+        sys.exit(2)
+    print (" ----- Step 5: Simulate protocol -----")
+    if (functional != None):
+        try:
+            if (tracePath != None):
+                workload = TraceWorkload(tracePath, numCores if coresGiven else None, lineSize)
+            else:
+                workload = RandomWorkload(numCores, requests, lines, writeRatio, replacementRatio, seed)
+            simulateFunctional(protocol, configModel, workload, functional)
+        except ValueError as e:
+            print (str(e))
+            sys.exit(2)
+        return
+    if (tracePath != None):
+        try:
+            result = replayTrace(protocol, configModel, tracePath, numCores if coresGiven else None, lineSize, slotWidth)
+        except ValueError as e:
+            print (str(e))
+            sys.exit(2)
+    else:
+        result = simulateProtocol(protocol, configModel, numCores, requests, lines, writeRatio, replacementRatio, slotWidth, seed)
+    if (result.stuck != None):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,190 @@
+# Synthetic protocol specifications for scalability runs
+
+# Emits a .spec file with a chosen number of stable states and state-changing transitions.
+# Every state gets a transition for each of the six events that obeys the coherence rules
+# the shipped specs follow:
+# - own reads lead to a state with read permission, own writes to a state with write permission
+# - OtherWrite invalidates, OtherRead leaves no exclusive copy behind
+# - the invalid state stays invalid on snoops
+# Stable states are drawn from the (AP, PCP, SMP) combinations below. Beyond six states the
+# combinations repeat under new names.
+# Not every such spec can be synthesized, so candidates are synthesized under the requested system
+# models and the next seed is tried until one succeeds.
+
+import sys, getopt
+import io
+import random
+import contextlib
+
+import synthia
+
+ownEvents = ('OwnReadM', 'OwnReadP', 'OwnWriteM', 'OwnWriteP')
+otherEvents = ('OtherRead', 'OtherWrite')
+
+# (AP, PCP, SMP) combinations of M, S, E, O and F, in the order they are introduced
+encodings = [
+    ("write", "active", "dirty"),
+    ("read", "passive", "clean"),
+    ("exclusiveRead", "active", "dirty"),
+    ("read", "active", "dirty"),
+    ("read", "active", "clean"),
+]
+
+namePrefix = {"write": "M", "exclusiveRead": "E", "read": "S", "invalid": "I"}
+
+# destinations the rules allow for (n, e), states as (name, (AP, PCP, SMP)) pairs
+def legalDestinations(states, n, e):
+    encodingOf = dict(states)
+    if (e in ('OwnReadM', 'OwnReadP')):
+        return [d for (d, enc) in states if enc[0] != "invalid"]
+    if (e in ('OwnWriteM', 'OwnWriteP')):
+        return [d for (d, enc) in states if enc[0] == "write"]
+    invalid = [d for (d, enc) in states if enc[0] == "invalid"]
+    if (e == 'OtherRead'):
+        return ([n] if encodingOf[n][0] == "invalid" else [d for (d, enc) in states if enc[0] in ("read", "invalid")])
+    if (e == 'OtherWrite'):
+        return invalid[:1]
+    return []
+
+class GeneratedSpec:
+    def __init__(self, stableStates, transitions=None, seed=1):
+        if (stableStates < 2):
+            raise ValueError("a protocol needs at least 2 stable states, got "+str(stableStates))
+        rng = random.Random(seed)
+
+        # the names have the same width so concatenated transient state names stay unambiguous
+        width = len(str(stableStates - 1))
+        self.states = [("I"+"0".zfill(width), ("invalid", "passive", "clean"))]
+        for i in range(1, stableStates):
+            enc = encodings[(i - 1) % len(encodings)]
+            self.states.append((namePrefix[enc[0]]+str(i).zfill(width), enc))
+        self.invalid = self.states[0][0]
+
+        readable = [n for (n, enc) in self.states if enc[0] != "invalid"]
+        writable = [n for (n, enc) in self.states if enc[0] == "write"]
+        shared = [n for (n, enc) in self.states if enc[0] in ("read", "invalid")]
+        positions = dict((id(pool), dict((d, j) for (j, d) in enumerate(pool))) for pool in (readable, writable, shared))
+
+        # the destination pool of (state, event), and whether staying put is what a plain protocol does
+        def options(n, ap, e):
+            if (e in ('OwnReadM', 'OwnReadP')):
+                return (readable, ap != "invalid")
+            if (e in ('OwnWriteM', 'OwnWriteP')):
+                return (writable, ap == "write")
+            if (e == 'OtherRead'):
+                return (([n], True) if ap == "invalid" else (shared, ap == "read"))
+            return ([self.invalid], n == self.invalid)
+
+        # destinations in the pool other than n, counted and indexed without building per-state lists
+        def others(pool, n):
+            index = positions.get(id(pool))
+            if (index == None):
+                return len([d for d in pool if d != n])
+            return len(pool) - (1 if n in index else 0)
+
+        def pick(pool, n, i):
+            index = positions.get(id(pool))
+            if (index == None):
+                return [d for d in pool if d != n][i]
+            p = index.get(n)
+            if (p == None or i < p):
+                return pool[i]
+            return pool[i + 1]
+
+        # the required state changes come first, then self loops are turned into state changes
+        self.destinations = {}
+        loops = []
+        for (n, enc) in self.states:
+            for e in ownEvents + otherEvents:
+                (pool, stays) = options(n, enc[0], e)
+                if (stays):
+                    self.destinations[(n, e)] = n
+                    if (others(pool, n) > 0):
+                        loops.append((n, e, pool))
+                else:
+                    self.destinations[(n, e)] = pick(pool, n, rng.randrange(others(pool, n)))
+
+        changing = len([k for (k, d) in self.destinations.items() if d != k[0]])
+        self.minTransitions = changing
+        self.maxTransitions = changing + len(loops)
+        if (transitions == None):
+            transitions = changing + len(loops) // 2
+        if (transitions < self.minTransitions or transitions > self.maxTransitions):
+            raise ValueError("state-changing transitions for "+str(stableStates)+" stable states must be in ["+str(self.minTransitions)+", "+str(self.maxTransitions)+"], got "+str(transitions))
+
+        for (n, e, pool) in rng.sample(loops, transitions - changing):
+            self.destinations[(n, e)] = pick(pool, n, rng.randrange(others(pool, n)))
+        self.transitions = transitions
+
+    def write(self, path, title=None):
+        with open(path, "w") as f:
+            f.write("# "+(title or "Generated spec: "+str(len(self.states))+" stable states, "+str(self.transitions)+" state-changing transitions")+"\n")
+            f.write("@ State modeling\n")
+            for (n, enc) in self.states:
+                f.write(n+" -> ("+", ".join(enc)+")\n")
+            f.write("@ Txn specs\n")
+            for (n, enc) in self.states:
+                f.write("# Transitions from "+n+"\n")
+                for e in ownEvents + otherEvents:
+                    f.write("("+n+", "+e+") -> "+self.destinations[(n, e)]+"\n")
+
+def synthesizes(path, configModels):
+    for configModel in configModels:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                synthia.synthesizeProtocol(path, configModel)
+        except Exception:
+            return False
+    return True
+
+def generateSpec(path, stableStates, transitions=None, seed=1, configModels=("direct", "memory"), attempts=50):
+    for s in range(seed, seed + attempts):
+        spec = GeneratedSpec(stableStates, transitions, s)
+        spec.seed = s
+        spec.write(path)
+        if (synthesizes(path, configModels)):
+            return spec
+    raise ValueError("no synthesizable spec with "+str(stableStates)+" stable states for seeds "+str(seed)+"-"+str(seed + attempts - 1))
+
+def main(argv):
+    outputfile = None
+    stableStates = 4
+    transitions = None
+    seed = 1
+    configModels = ("direct", "memory")
+
+    usage = 'specgen.py -o <spec file> [-n <stable states>] [-t <state-changing transitions>] [--seed=<seed>] [--no-check]'
+    try:
+        opts, args = getopt.getopt(argv, "ho:n:t:", ["ofile=", "states=", "transitions=", "seed=", "no-check"])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-o", "--ofile"):
+            outputfile = arg
+        elif opt in ("-n", "--states"):
+            stableStates = int(arg)
+        elif opt in ("-t", "--transitions"):
+            transitions = int(arg)
+        elif opt == "--seed":
+            seed = int(arg)
+        elif opt == "--no-check":
+            configModels = ()
+
+    if (outputfile == None):
+        print (usage)
+        sys.exit(2)
+
+    try:
+        spec = generateSpec(outputfile, stableStates, transitions, seed, configModels)
+    except ValueError as e:
+        print (str(e))
+        sys.exit(2)
+    print ("Wrote "+outputfile+": "+str(stableStates)+" stable states, "+str(spec.transitions)+" state-changing transitions (range "+str(spec.minTransitions)+"-"+str(spec.maxTransitions)+"), seed "+str(spec.seed))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -6,10 +6,28 @@
 # Step 4: Verify protocol (model checker)
 
 import sys, getopt
+import os
 import re
-from graphviz import Digraph
+import csv
+import json
+import mmap
+import struct
+import glob
+import hashlib
+import time
+import contextlib
+import cProfile
+import tracemalloc
+from collections import deque
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from graphviz import Digraph, Source
+import graphviz
 from ctypes import c_char_p
-import copy
+import types
+import numpy as np
+
+VERSION = "1.0"
 
 # dictionaries for parsing
 stateMap = {}
@@ -26,38 +44,163 @@ aweightMap = {"write":2, "exclusiveRead":2, "read":1, "invalid":0} # access perm
 mweightMap = {"dirty":1, "clean":0} # shared memory weight
 pweightMap = {"active":1, "passive":0} # peer weight
 
+# output formats: csv tables, dot text, the binary protocol file and images rendered by graphviz
+imageFormats = ('pdf', 'png', 'svg')
+outputFormats = ('csv', 'dot', 'synp') + imageFormats
+defaultOutputFormats = ('csv', 'dot')
+
+# images are laid out by a background pool so synthesis never waits on dot
+renderPool = None
+pendingRenders = []
+
+def renderImage(dotSource, path, fmt, view):
+    data = Source(dotSource).pipe(format=fmt)
+    with open(path, "wb") as f:
+        f.write(data)
+    if (view):
+        graphviz.view(path)
+    return path
+
+def submitRender(dotSource, path, fmt, view=False):
+    global renderPool
+    if (renderPool == None):
+        renderPool = ThreadPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)))
+    fut = renderPool.submit(renderImage, dotSource, path, fmt, view)
+    pendingRenders.append(fut)
+    return fut
+
+def waitForRenders(block=True):
+    # collect the finished renders (all pending ones when blocking), returns the errors of those that failed
+    errors = []
+    for fut in list(pendingRenders):
+        if (not block and not fut.done()):
+            continue
+        pendingRenders.remove(fut)
+        try:
+            fut.result()
+        except Exception as e:
+            errors.append(type(e).__name__+": "+str(e))
+    return errors
+
+# per-phase instrumentation: wall time, peak traced memory, state and transition counts and
+# an optional cProfile of every pipeline phase, reported as JSON
+counterNames = ("statesCreated", "statesDeduplicated", "transitionsCreated", "transitionsDeduplicated",
+                "memStatesCreated", "memTransitionsCreated", "memTransitionsDeduplicated",
+                "latencyCacheHits", "latencyCacheMisses")
+
+class Instrumentation:
+    def __init__(self, traceMemory=True, profileDir=None):
+        self.traceMemory = traceMemory
+        self.profileDir = profileDir
+        self.phases = []
+        self.info = {}
+
+    @contextlib.contextmanager
+    def phase(self, name, p):
+        before = dict(p.counts)
+        if (self.traceMemory):
+            if (not tracemalloc.is_tracing()):
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            startMemory = tracemalloc.get_traced_memory()[0]
+        profiler = None
+        if (self.profileDir != None):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            record = {"name": name, "seconds": seconds}
+            if (profiler != None):
+                profiler.disable()
+                os.makedirs(self.profileDir, exist_ok=True)
+                record["profile"] = os.path.join(self.profileDir, name+".prof")
+                profiler.dump_stats(record["profile"])
+            if (self.traceMemory):
+                current, peak = tracemalloc.get_traced_memory()
+                record["peakBytes"] = peak - startMemory
+                record["retainedBytes"] = current - startMemory
+            record["states"] = len(p.states)
+            record["transitions"] = len(p.transitions)
+            record["memStates"] = len(p.memStates)
+            record["memTransitions"] = len(p.memTransitions)
+            for c in counterNames:
+                record[c] = p.counts[c] - before[c]
+            self.phases.append(record)
+
+    def seconds(self, name):
+        return sum(r["seconds"] for r in self.phases if r["name"] == name)
+
+    def count(self, name, counter):
+        return sum(r[counter] for r in self.phases if r["name"] == name)
+
+    def report(self):
+        total = {"seconds": sum(r["seconds"] for r in self.phases)}
+        if (self.traceMemory):
+            total["peakBytes"] = max([r["peakBytes"] for r in self.phases] + [0])
+        for c in counterNames:
+            total[c] = sum(r[c] for r in self.phases)
+        return dict(self.info, version=VERSION, traceMemory=self.traceMemory, phases=self.phases, total=total)
+
+    def writeReport(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
+
+    def printSummary(self):
+        # totals after the phase, then created / de-duplicated during it
+        print ("Phase".ljust(14)+"ms".rjust(10)+("peak KiB".rjust(10) if self.traceMemory else "")+"states +new/dup".rjust(18)+"transitions +new/dup".rjust(24)+"mem transitions +new/dup".rjust(28)+"latency hit/miss".rjust(18))
+        for r in self.phases:
+            print (r["name"].ljust(14)+("%.2f" % (r["seconds"] * 1000)).rjust(10)+(str(r["peakBytes"] // 1024).rjust(10) if self.traceMemory else "")
+                   +(str(r["states"])+" +"+str(r["statesCreated"])+"/"+str(r["statesDeduplicated"])).rjust(18)
+                   +(str(r["transitions"])+" +"+str(r["transitionsCreated"])+"/"+str(r["transitionsDeduplicated"])).rjust(24)
+                   +(str(r["memTransitions"])+" +"+str(r["memTransitionsCreated"])+"/"+str(r["memTransitionsDeduplicated"])).rjust(28)
+                   +(str(r["latencyCacheHits"])+"/"+str(r["latencyCacheMisses"])).rjust(18))
+
+# interned state table: every state name gets a small integer id
+stateIdMap = {}
+stateNames = []
+
+def internState(name):
+    sid = stateIdMap.get(name)
+    if (sid == None):
+        sid = len(stateNames)
+        stateIdMap[name] = sid
+        stateNames.append(name)
+    return sid
+
 class CoherenceState:
+    __slots__ = ('state', 'id', 'stable', 'AP', 'SMP', 'PCP', 'apWeight', 'smpWeight', 'pcpWeight',
+                 'parent', 'isPreOrdered', 'source', 'intendedDest')
+
     def __init__ (self, state, isStableState):
         self.state = state
-        self.isStableState = isStableState
-        self.AP = -1
-        self.SMP = -1
-        self.PCP = -1
+        self.id = internState(str(state))
+        self.stable = isStableState
         self.parent = None
         self.isPreOrdered = False 
         self.source = None
         self.intendedDest = None
+        self.setAP(-1)
+        self.setSMP(-1)
+        self.setPCP(-1)
 
     def isTransientState(self):
-        return not self.isStableState
+        return not self.stable
 
     def isStableState(self):
-        return self.isStableState
+        return self.stable
 
     def copyStateEncoding(self, state):
         if (state.isTransientState()):
             if (state.getParent() == None):
-                self.AP = state.source.AP
-                self.SMP = state.source.SMP
-                self.PCP = state.source.PCP
+                state = state.source
             else:
-                self.AP = state.getParent().AP
-                self.SMP = state.getParent().SMP
-                self.PCP = state.getParent().PCP
-        else:
-            self.AP = state.AP
-            self.SMP = state.SMP
-            self.PCP = state.PCP
+                state = state.getParent()
+        self.setAP(state.AP)
+        self.setSMP(state.SMP)
+        self.setPCP(state.PCP)
 
     def setParent(self, p):
         self.parent = p
@@ -68,14 +211,18 @@ class CoherenceState:
     def setIntendedDestination(self, d):
         self.intendedDest = d
 
+    # weights are resolved once here, None marks an unknown encoding
     def setAP(self, ap):
         self.AP = ap
+        self.apWeight = aweightMap.get(ap)
 
     def setSMP(self, smp):
         self.SMP = smp
+        self.smpWeight = mweightMap.get(smp)
 
     def setPCP(self, pcp):
         self.PCP = pcp
+        self.pcpWeight = pweightMap.get(pcp)
 
     def setPreOrderedFlag(self):
         self.isPreOrdered = True
@@ -110,13 +257,22 @@ class CoherenceState:
         return (self.AP, self.SMP, self.PCP)
 
     def getAPWeight(self):
-        return aweightMap[self.AP]
+        if (self.apWeight == None):
+            raise KeyError(self.AP)
+        return self.apWeight
 
     def getSMPWeight(self):
-        return mweightMap[self.SMP]
+        if (self.smpWeight == None):
+            raise KeyError(self.SMP)
+        return self.smpWeight
 
     def getPCPWeight(self):
-        return pweightMap[self.PCP]
+        if (self.pcpWeight == None):
+            raise KeyError(self.PCP)
+        return self.pcpWeight
+
+    def getWeights(self):
+        return (self.getAPWeight(), self.getSMPWeight(), self.getPCPWeight())
  
     def getIntendedDestination(self):
         return self.intendedDest
@@ -174,6 +330,9 @@ class Transition:
     def updateTriggerEvent(self, e):
         self.event = e
 
+    def getKey(self):
+        return (self.source.id, self.event, self.destination.id)
+
     def printTransition(self):
         print(str(self.source.state)+" -- "+str(self.event)+" --> "+str(self.destination.state))
 
@@ -225,19 +384,105 @@ class StateView:
 
         return True
 
+class TransitionList:
+    # ordered set of transitions: iterates in insertion order, append and remove take
+    # constant time (transitions hash by identity)
+    __slots__ = ('items',)
+
+    def __init__(self, transitions=()):
+        self.items = dict.fromkeys(transitions)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, transition):
+        return transition in self.items
+
+    def append(self, transition):
+        self.items[transition] = None
+
+    def remove(self, transition):
+        del self.items[transition]
+
+    def first(self):
+        return next(iter(self.items))
+
+    def copy(self):
+        return list(self.items)
+
+class ProtocolSnapshot:
+    # read-only view of the input protocol taken before synthesis changes it. The states and
+    # transitions are the live objects, only the lists are frozen, so lookups by identity or
+    # state id agree with the live protocol and taking a snapshot copies no state
+    __slots__ = ('states', 'transitions', 'transitionMap')
+
+    def __init__(self, states, transitions):
+        transitionMap = {}
+        for t in transitions:
+            transitionMap.setdefault((t.getSource().id, t.getTriggerEvent()), t)
+        object.__setattr__(self, 'states', tuple(states))
+        object.__setattr__(self, 'transitions', tuple(transitions))
+        object.__setattr__(self, 'transitionMap', types.MappingProxyType(transitionMap))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("protocol snapshots are read-only")
+
+    def getTransition(self, s, e):
+        return self.transitionMap.get((s.id, e))
+
 class CoherenceProtocol:
     def __init__(self):
         self.states = []
         self.memStates = []
         self.preOrderedStates = []
         self.postOrderedStates = []
-        self.transitions = []
+        # worklists of transient states not yet processed by the synthesis steps
+        self.preOrderedQueue = deque()
+        self.postOrderedQueue = deque()
+        self.transitions = TransitionList()
         self.memTransitions = []
-        self.U = []
+        # U: validity matrix over the state views (si, sj), indexed by URow[state]
+        # (grown in place, UBuffer has spare capacity)
+        self.U = np.zeros((0, 0), dtype=bool)
+        self.UBuffer = self.U
+        self.UStates = []
+        self.URow = {}
+        self.UAP = []
+        self.UPCP = []
+        self.UUnknown = set()
         self.linearTransitions = []
         self.nonLinearTransitions = []
-        self.ipStates = []
-        self.ipTransitions = []
+        # input protocol snapshot, ipStates and ipTransitions are its lists
+        self.snapshot = None
+        self.ipStates = ()
+        self.ipTransitions = ()
+
+        # hash indices over the state and transition lists
+        # (source, event, destination) -> transition, used for de-duplication
+        # (source, event) -> TransitionList, used for lookups (first match wins)
+        self.stateIndex = {}
+        self.preOrderedIndex = {}
+        self.postOrderedIndex = {}
+        self.transitionIndex = {}
+        self.transitionMap = {}
+        self.memTransitionIndex = {}
+
+        # memoized latency analysis, keyed on the transition and the set of view sources
+        self.latencyCache = {}
+        self.viewSources = set()
+        self.viewSourceCount = 0
+        self.viewSourceVersion = 0
+
+        # when set, records the (state, event) pairs read from the input protocol
+        self.lookupTrace = None
+
+        # created and de-duplicated states and transitions, read by the instrumentation
+        self.counts = dict((c, 0) for c in counterNames)
+        self.instrumentation = None
+        self.configModel = None
         self.EV = [("OwnWriteM", "OtherWrite"), ("OwnWriteP", "OtherWrite"), ("OtherWrite", "OwnWriteM"), ("OtherWrite", "OwnWriteP"), ("OwnReadM", "OtherRead"), ("OwnReadP", "OtherRead"), ("OtherRead", "OwnReadM"), ("OtherRead", "OwnReadP")]
 
 
@@ -247,48 +492,42 @@ class CoherenceProtocol:
         for t in self.transitions:
             t.printTransition()
 
-    def visualizeProtocol(self):
-        f = Digraph("Protocol visualization", filename = "private-cache-state-machine.viz")
-        g = Digraph("Protocol visualization", filename = "shared-memory-state-machine.viz")
-
-        f.attr(rankdir="LR", size="10,10")
-        g.attr(rankdir="LR", size="10,10")
-
-        f.attr('node', shape='circle')
-        g.attr('node', shape='square')
-
-        
-        ff = open(str("output-private-cache.csv"), "a")
-        gf = open(str("output-shared-memory.csv"), "a")
-
-        ff.write("Source,Event,Action,Destination")
-        gf.write("Source,Event,Action,Destination")
-
-        for t in self.transitions:
-            ff.write(str(t.getSource().getStateString())+","+str(t.getTriggerEvent())+","+str(t.getAction())+","+str(t.getDestination().getStateString())+"\n")
-
-        for t in self.memTransitions:
-            gf.write(str(t.getSource().getStateString())+","+str(t.getTriggerEvent())+","+str(t.getAction())+","+str(t.getDestination().getStateString())+"\n")
-
-        ff.close()
-        gf.close()
-        
-        for t in self.transitions:
-            f.edge(str(t.getSource().getStateString()), str(t.getDestination().getStateString()), label=str(str(t.getTriggerEvent())+"/"+str(t.getAction())))
-
-        for t in self.memTransitions:
-            g.edge(str(t.getSource().getStateString()), str(t.getDestination().getStateString()), label=str(str(t.getTriggerEvent())+"/"+str(t.getAction())))
-
-         
-       # print ("Total transitions: "+str(len(self.transitions) + len(self.memTransitions)))
-
-        #f.view()
-        #g.view()
-        f.render("private-cache-state-machine.viz", view=True)
-        g.render("shared-memory-state-machine.viz", view=True)
+    def visualizeProtocol(self, outputDir='.', view=False, formats=defaultOutputFormats):
+        # write the selected output formats, images are only submitted to the render pool
+        formats = list(formats)
+        if (view and len([fmt for fmt in formats if fmt in imageFormats]) == 0):
+            formats.append('pdf')
+        for fmt in formats:
+            if (fmt not in outputFormats):
+                raise ValueError("unknown output format "+str(fmt))
+
+        machines = (("private-cache", "circle", self.transitions), ("shared-memory", "square", self.memTransitions))
+        for (name, shape, transitions) in machines:
+            if ('csv' in formats):
+                with open(os.path.join(outputDir, "output-"+name+".csv"), "w", newline="", buffering=1 << 16) as cf:
+                    w = csv.writer(cf)
+                    w.writerow(("Source", "Event", "Action", "Destination"))
+                    w.writerows((t.getSource().getStateString(), t.getTriggerEvent(), t.getAction(), t.getDestination().getStateString()) for t in transitions)
+
+            f = Digraph("Protocol visualization", filename = name+"-state-machine.viz")
+            f.attr(rankdir="LR", size="10,10")
+            f.attr('node', shape=shape)
+            for t in transitions:
+                f.edge(str(t.getSource().getStateString()), str(t.getDestination().getStateString()), label=str(str(t.getTriggerEvent())+"/"+str(t.getAction())))
+
+            path = os.path.join(outputDir, name+"-state-machine.viz")
+            if ('dot' in formats):
+                with open(path, "w", buffering=1 << 16) as df:
+                    df.write(f.source)
+            for fmt in formats:
+                if (fmt in imageFormats):
+                    submitRender(f.source, path+"."+fmt, fmt, view)
+
+        if ('synp' in formats):
+            writeProtocolFile(os.path.join(outputDir, "protocol.synp"), self, self.configModel)
 
     def getU(self):
-        return self.U
+        return [StateView(self.UStates[i], self.UStates[j]) for i, j in np.argwhere(self.U)]
 
     def isNonLinearLatency(self):
         if (len(self.nonLinearTransitions) > 0):
@@ -313,56 +552,117 @@ class CoherenceProtocol:
                 return True
         return False
 
+    def printLatencyVerdict(self):
+        if (self.isNonLinearLatency()):
+            print ("Input protocol has non-linear WCAL bound")
+            self.printNonLinearTransitions()
+        else:
+            print ("Input protocol has linear WCAL bound")
+
     def printNonLinearTransitions(self):
         for t in self.nonLinearTransitions:
             t.printTransition()
             #printStr = str(t[0].printStateView()+ " -- "+str(t[1])+" --> "+t[2].printStateView())
             #print (printStr)
 
+    def phase(self, name):
+        if (self.instrumentation == None):
+            return contextlib.nullcontext()
+        return self.instrumentation.phase(name, self)
+
     def addState(self, state):
-        for s in self.states:
-            if (s.state == state.state):
-                return s
+        s = self.stateIndex.get(state.id)
+        if (s != None):
+            self.counts["statesDeduplicated"] += 1
+            return s
+        self.counts["statesCreated"] += 1
         self.states.append(state)
+        self.stateIndex[state.id] = state
         return state
 
     def addMemState(self, state):
+        self.counts["memStatesCreated"] += 1
         self.memStates.append(state)
 
     def addPreOrderedState(self, state):
-        for i in self.preOrderedStates:
-            if (i.getStateString() == state.getStateString()):
-                return i
+        i = self.preOrderedIndex.get(state.id)
+        if (i != None):
+            self.counts["statesDeduplicated"] += 1
+            return i
+        self.counts["statesCreated"] += 1
         self.preOrderedStates.append(state)
+        self.preOrderedIndex[state.id] = state
+        self.preOrderedQueue.append(state)
         self.states.append(state)
+        self.stateIndex.setdefault(state.id, state)
         return state
 
 
     def addPostOrderedState(self, state):
-        for i in self.postOrderedStates:
-            if (i.getStateString() == state.getStateString()):
-                return i 
+        i = self.postOrderedIndex.get(state.id)
+        if (i != None):
+            self.counts["statesDeduplicated"] += 1
+            return i
+        self.counts["statesCreated"] += 1
         self.postOrderedStates.append(state)
+        self.postOrderedIndex[state.id] = state
+        self.postOrderedQueue.append(state)
         self.states.append(state)
+        self.stateIndex.setdefault(state.id, state)
         return state
 
     def addTransition(self, transition):
-        for t in self.transitions:
-            if (t.source.getStateString() == transition.source.getStateString() and 
-                t.destination.getStateString() == transition.destination.getStateString() and
-                t.event == transition.event):
-                return
-        
+        if (transition.getKey() in self.transitionIndex):
+            self.counts["transitionsDeduplicated"] += 1
+            return
+
+        self.appendTransition(transition)
+
+    def appendTransition(self, transition):
+        # add without de-duplication, keeping the indices in sync
+        self.counts["transitionsCreated"] += 1
         self.transitions.append(transition)
+        self.transitionIndex.setdefault(transition.getKey(), transition)
+        bucket = self.transitionMap.get((transition.source, transition.event))
+        if (bucket == None):
+            bucket = self.transitionMap[(transition.source, transition.event)] = TransitionList()
+        bucket.append(transition)
+
+    def removeTransition(self, transition):
+        self.transitions.remove(transition)
+        key = transition.getKey()
+        if (self.transitionIndex.get(key) is transition):
+            del self.transitionIndex[key]
+            for t in self.transitionMap.get((transition.source, transition.event), []):
+                if (t is not transition and t.getKey() == key):
+                    self.transitionIndex[key] = t
+                    break
+
+        bucket = self.transitionMap.get((transition.source, transition.event))
+        if (bucket != None and transition in bucket):
+            bucket.remove(transition)
+            if (len(bucket) == 0):
+                del self.transitionMap[(transition.source, transition.event)]
 
     def addMemTransition(self, transition):
-        for t in self.memTransitions:
-            if (t.source.getStateString() == transition.source.getStateString() and
-                    t.destination.getStateString() == transition.destination.getStateString() and
-                    t.event == transition.event):
-                return
+        key = transition.getKey()
+        if (key in self.memTransitionIndex):
+            self.counts["memTransitionsDeduplicated"] += 1
+            return
 
+        self.counts["memTransitionsCreated"] += 1
         self.memTransitions.append(transition)
+        self.memTransitionIndex[key] = transition
+
+    def setSnapshot(self, snapshot):
+        # input protocol snapshot used by the latency analysis
+        self.snapshot = snapshot
+        self.ipStates = snapshot.states
+        self.ipTransitions = snapshot.transitions
+        self.latencyCache = {}
+
+    def takeSnapshot(self):
+        self.setSnapshot(ProtocolSnapshot(self.states, self.transitions))
 
     def addNonLinearTransitions(self, a):
         self.nonLinearTransitions.append(a)
@@ -371,40 +671,92 @@ class CoherenceProtocol:
         self.linearTransitions.append(a)
 
     def constructU(self):
-        for si in self.states:
-            for sj in self.states:
-                sv = StateView(si, sj)
-                if (sv.isValid()):
-                    self.U.append(sv)
+        self.updateU(self.states)
+
+    def updateU(self, states):
+        # add rows and columns to U for states it does not cover yet
+        n0 = len(self.UStates)
+        for s in states:
+            if (s not in self.URow):
+                self.URow[s] = len(self.UStates)
+                self.UStates.append(s)
+                # states with an unknown encoding never form a valid view here,
+                # getValidStateViews checks them one by one
+                if (s.apWeight == None or s.pcpWeight == None):
+                    self.UUnknown.add(self.URow[s])
+                    self.UAP.append(3)
+                    self.UPCP.append(2)
+                else:
+                    self.UAP.append(s.apWeight)
+                    self.UPCP.append(s.pcpWeight)
+
+        n = len(self.UStates)
+        if (n == n0):
+            return
+
+        if (n > self.UBuffer.shape[0]):
+            buf = np.zeros((2 * n, 2 * n), dtype=bool)
+            buf[:n0, :n0] = self.UBuffer[:n0, :n0]
+            self.UBuffer = buf
+
+        ap = np.array(self.UAP, dtype=np.int8)
+        pcp = np.array(self.UPCP, dtype=np.int8)
+        block = (np.add.outer(ap[n0:], ap) <= 2) & (np.add.outer(pcp[n0:], pcp) <= 1)
+        self.UBuffer[n0:n, :n] = block
+        self.UBuffer[:n, n0:n] = block.T
+        self.U = self.UBuffer[:n, :n]
+
+    def getValidStateViews(self, states, sj):
+        # valid views (si, sj) for si in states, transient states are viewed through their source
+        candidates = []
+        seen = set()
+        for s in states:
+            if s.isTransientState():
+                s = s.getSource()
+            if (s not in seen):
+                seen.add(s)
+                candidates.append(s)
+
+        self.updateU(candidates + [sj])
+        col = self.URow[sj]
+        rows = np.array([self.URow[s] for s in candidates], dtype=np.intp)
+        valid = self.U[rows, col]
+        if (len(self.UUnknown) > 0):
+            for i in range(len(candidates)):
+                if (rows[i] in self.UUnknown or col in self.UUnknown):
+                    valid[i] = StateView(candidates[i], sj).isValid()
+        return [StateView(candidates[i], sj) for i in np.flatnonzero(valid)]
 
     def getTransitionDestination(self, s, e):
+        if (self.lookupTrace != None):
+            self.lookupTrace.add((s.getStateString(), e))
         t = self.getIpTransition(s, e)
         if (t != None):
             return t.getStableDestination()
 
 
     def getTransition(self, s, e):
-        for t in self.transitions:
-            if (t.getSource() == s and t.getTriggerEvent() == e):
-                return t
+        bucket = self.transitionMap.get((s, e))
+        if (bucket):
+            return bucket.first()
 
         return None
     
     def getIpTransition(self, s, e):
-        for t in self.ipTransitions:
-            if (t.getSource().getStateString() == s.getStateString() and t.getTriggerEvent() == e):
-                return t
-        return None
+        if (self.snapshot == None):
+            return None
+        return self.snapshot.getTransition(s, e)
 
     
     def isSameState(self, s, t):
-        if (s.getAPWeight() == t.getAPWeight() and s.getPCPWeight() == t.getPCPWeight() and s.getSMPWeight() == t.getSMPWeight()):
+        if (s.getWeights() == t.getWeights()):
             return True
         return False
 
     def preOrderedTransitions(self, configModel):
         O = ["OtherRead", "OtherWrite"]
-        for ts in self.preOrderedStates:
+        while (len(self.preOrderedQueue) > 0):
+            ts = self.preOrderedQueue.popleft()
             for e in O:
                 nextDest = self.getTransitionDestination(ts.getSource(), e)
 
@@ -493,7 +845,8 @@ class CoherenceProtocol:
                 
     def postOrderedTransitions(self, configModel): 
         O = ["OtherRead", "OtherWrite"]
-        for ts in self.postOrderedStates:
+        while (len(self.postOrderedQueue) > 0):
+            ts = self.postOrderedQueue.popleft()
             for e in O:
                 nextDest = self.getTransitionDestination(ts.getIntendedDestination(), e)
                 # TODO: need to change this to something more comprehensive
@@ -732,7 +1085,33 @@ class CoherenceProtocol:
                                         t2 = Transition(newTState, "Ordered", newIState)
                                         self.addMemTransition(t2)
 
+    def updateViewSources(self):
+        # the analysis views every state through its source, the version changes
+        # only when a state with a new source object is added
+        for s in self.states[self.viewSourceCount:]:
+            if s.isTransientState():
+                s = s.getSource()
+            if (id(s) not in self.viewSources):
+                self.viewSources.add(id(s))
+                self.viewSourceVersion = self.viewSourceVersion + 1
+        self.viewSourceCount = len(self.states)
+
+    def getLatencyCacheStats(self):
+        return (self.counts["latencyCacheHits"], self.counts["latencyCacheMisses"])
+
     def asymptoticLatencyAnalysisTransition(self, t, configModel):
+        self.updateViewSources()
+        key = (t.getSource(), t.getStableSource(), t.getTriggerEvent(), configModel, self.viewSourceVersion)
+        if (key in self.latencyCache):
+            self.counts["latencyCacheHits"] += 1
+            return self.latencyCache[key]
+
+        self.counts["latencyCacheMisses"] += 1
+        result = self.computeAsymptoticLatencyTransition(t, configModel)
+        self.latencyCache[key] = result
+        return result
+
+    def computeAsymptoticLatencyTransition(self, t, configModel):
         sv = ()
         tv = ()
         ev = ()
@@ -748,45 +1127,40 @@ class CoherenceProtocol:
             else:
                 EV = [("OwnReadM", "OtherRead"), ("OwnReadP", "OtherRead")]
                 states = self.states
+            views = self.getValidStateViews(states, t.getStableSource())
             for ev in EV:
-                for s in states:
-                    if s.isTransientState():
-                        sv = StateView(s.getSource(), t.getStableSource())
-                    else:
-                        sv = StateView(s, t.getStableSource())
-
-                    if (sv.isValid()):
-                        d1 = self.getTransitionDestination(sv.getState(0), ev[0])
-                        d2 = self.getTransitionDestination(sv.getState(1), ev[1])
-                        tv = StateView(d1, d2)
+                for sv in views:
+                    d1 = self.getTransitionDestination(sv.getState(0), ev[0])
+                    d2 = self.getTransitionDestination(sv.getState(1), ev[1])
+                    tv = StateView(d1, d2)
 
-                        # need to check if there are bcasts
-                        if (d1 == sv.getState(0) or d2 == sv.getState(1)):
-                            continue
+                    # need to check if there are bcasts
+                    if (d1 == sv.getState(0) or d2 == sv.getState(1)):
+                        continue
 
-                        cua = 0
-                        if (ev[1] == "OwnWriteM" or ev[1] == "OwnReadM" or ev[1] == "OwnWriteP" or ev[1] == "OwnReadP"):
-                            cua = 1
+                    cua = 0
+                    if (ev[1] == "OwnWriteM" or ev[1] == "OwnReadM" or ev[1] == "OwnWriteP" or ev[1] == "OwnReadP"):
+                        cua = 1
 
 
-                        if (configModel == "memory"):
-                            if (cua == 1):
-                                if (d1.getSMPWeight() - sv.getState(1).getSMPWeight() < 0 or d1.getPCPWeight() - sv.getState(0).getPCPWeight() < 0):
-                                    return True
-                            else:
-                                if (d2.getSMPWeight() - sv.getState(1).getSMPWeight() < 0 or d2.getPCPWeight() - sv.getState(1).getPCPWeight() < 0):
-                                    return True
-                        else: 
-                            mvalDelta = tv.computeSMWeight() - sv.computeSMWeight()
-                            pvalDelta = tv.computePPWeight() - sv.computePPWeight()
+                    if (configModel == "memory"):
+                        if (cua == 1):
+                            if (d1.getSMPWeight() - sv.getState(1).getSMPWeight() < 0 or d1.getPCPWeight() - sv.getState(0).getPCPWeight() < 0):
+                                return True
+                        else:
+                            if (d2.getSMPWeight() - sv.getState(1).getSMPWeight() < 0 or d2.getPCPWeight() - sv.getState(1).getPCPWeight() < 0):
+                                return True
+                    else: 
+                        mvalDelta = tv.computeSMWeight() - sv.computeSMWeight()
+                        pvalDelta = tv.computePPWeight() - sv.computePPWeight()
 
                         
-                            if (mvalDelta < 0 and tv.getState(cua).getSMP() == sv.getState(cua).getSMP()):
-                                return True
+                        if (mvalDelta < 0 and tv.getState(cua).getSMP() == sv.getState(cua).getSMP()):
+                            return True
 
 
-                            if (pvalDelta < 0 and tv.getState(cua).getPCP() == sv.getState(cua).getPCP()):
-                                return True
+                        if (pvalDelta < 0 and tv.getState(cua).getPCP() == sv.getState(cua).getPCP()):
+                            return True
 
         if (t.getTriggerEvent() == "OtherWrite"):
             if (t.getSource().getPCPWeight() > 0):
@@ -794,43 +1168,37 @@ class CoherenceProtocol:
             else:
                 EV = [("OwnWriteM", "OtherWrite"), ("OwnWriteP", "OtherWrite")]
 
+            views = self.getValidStateViews(self.states, t.getSource())
             for ev in EV:
-                for s in self.states:
-                    if s.isTransientState():
-                        sv = StateView(s.getSource(), t.getSource())
-                    else:
-                        sv = StateView(s, t.getSource())
-
-                    
-                    if (sv.isValid()):
-                        d1 = self.getTransitionDestination(sv.getState(0), ev[0])
-                        d2 = self.getTransitionDestination(sv.getState(1), ev[1])
+                for sv in views:
+                    d1 = self.getTransitionDestination(sv.getState(0), ev[0])
+                    d2 = self.getTransitionDestination(sv.getState(1), ev[1])
 
-                        tv = StateView(d1, d2)
+                    tv = StateView(d1, d2)
 
-                        cua = 0
-                        if (ev[1] == "OwnWriteM" or ev[1] == "OwnReadM" or ev[1] == "OwnWriteP" or ev[1] == "OwnReadP"):
-                            cua = 1
+                    cua = 0
+                    if (ev[1] == "OwnWriteM" or ev[1] == "OwnReadM" or ev[1] == "OwnWriteP" or ev[1] == "OwnReadP"):
+                        cua = 1
 
 
-                        if (configModel == "memory"):
-                            if (cua == 1):
-                                if (d1.getSMPWeight() - sv.getState(0).getSMPWeight() < 0 or d1.getPCPWeight() - sv.getState(0).getPCPWeight() < 0):
-                                    return True
-                            else:
-                                if (d2.getSMPWeight() - sv.getState(1).getSMPWeight() < 0 or d2.getPCPWeight() - sv.getState(1).getPCPWeight() < 0):
-                                    return True
-                        else: 
-                            mvalDelta = tv.computeSMWeight() - sv.computeSMWeight()
-                            pvalDelta = tv.computePPWeight() - sv.computePPWeight()
+                    if (configModel == "memory"):
+                        if (cua == 1):
+                            if (d1.getSMPWeight() - sv.getState(0).getSMPWeight() < 0 or d1.getPCPWeight() - sv.getState(0).getPCPWeight() < 0):
+                                return True
+                        else:
+                            if (d2.getSMPWeight() - sv.getState(1).getSMPWeight() < 0 or d2.getPCPWeight() - sv.getState(1).getPCPWeight() < 0):
+                                return True
+                    else: 
+                        mvalDelta = tv.computeSMWeight() - sv.computeSMWeight()
+                        pvalDelta = tv.computePPWeight() - sv.computePPWeight()
 
 
-                            if (mvalDelta < 0 and tv.getState(cua).getSMP() == sv.getState(cua).getSMP()):
-                                return True
+                        if (mvalDelta < 0 and tv.getState(cua).getSMP() == sv.getState(cua).getSMP()):
+                            return True
 
 
-                            if (pvalDelta < 0 and tv.getState(cua).getPCP() == sv.getState(cua).getPCP()):
-                                return True
+                        if (pvalDelta < 0 and tv.getState(cua).getPCP() == sv.getState(cua).getPCP()):
+                            return True
  
         return False
     
@@ -846,28 +1214,28 @@ class CoherenceProtocol:
         for s in self.states:
             if (s.isTransientState() == True):
                 for ev in ["OtherRead", "OtherWrite"]:
-                    txnFound = False
-                    for t in self.transitions:
-                        if (t.getSource().state == s.getStateString() and t.getTriggerEvent() == ev):
-                            txnFound = True
-                            break
-
-                    if (txnFound == False):
+                    if (self.getTransition(s, ev) == None):
                         # transition with s and ev not found, create a stalling transition
                         t = Transition(s, "Stall", s)
-                        self.transitions.append(t)
+                        self.appendTransition(t)
                         stallTxn = stallTxn+1
                 
         print ("Total transitions: "+str(len(self.transitions)))
         print ("Total stall transitions: "+str(stallTxn))
         self.visualizeProtocol()
 
-    def constructNonStallingProtocol(self, outputfile, configModel):
+    def constructNonStallingProtocol(self, outputfile, configModel, outputDir='.', view=False, formats=defaultOutputFormats):
+        self.synthesizeNonStallingProtocol(configModel)
+        self.visualizeProtocol(outputDir, view, formats)
+
+    def synthesizeNonStallingProtocol(self, configModel):
 
         #@@@@@@@@@@@@#
         # Step 1: Bus communication
-        p1 = self.constructAtomicOwnImplementation()
-        self.constructAtomicOtherImplementation(configModel)
+        with self.phase("atomicOwn"):
+            p1 = self.constructAtomicOwnImplementation()
+        with self.phase("atomicOther"):
+            self.constructAtomicOtherImplementation(configModel)
 
         #print ("@@@@@ BUS COMMUNICATION @@@@@@@")
         #tmpProtocol = CoherenceProtocol()
@@ -876,39 +1244,35 @@ class CoherenceProtocol:
         #tmpProtocol.completeAndVisualizeProtocol()
 
         #@@@@@@@@@@@@#
-        # step 2: Interleaving
-        # step 2.1: pre-ordered
-        self.preOrderedTransitions(configModel)
-
-        #print ("@@@@@@@@@@@@@@")
-        #print ("@@@@@ PRE-ORDERED @@@@@@@")
-        #tmpProtocol.states = copy.deepcopy(self.states)
-        #tmpProtocol.transitions = copy.deepcopy(self.transitions)
-        #tmpProtocol.completeAndVisualizeProtocol()
+        # steps 2-4: Interleaving and replacement
+        self.synthesizeTransientStates(configModel)
 
-        # step 2.2: post-ordered
-        self.postOrderedTransitions(configModel)
+        #@@@@@@@@@@@@#
+        # step 5: create memory state machine
+        with self.phase("memFSM"):
+            self.constructMemStateMachine(configModel)
 
-        #print ("@@@@@@@@@@@@@@")
-        #print ("@@@@@ POST-ORDERED @@@@@@@")
-        #tmpProtocol.states = copy.deepcopy(self.states)
-        #tmpProtocol.transitions = copy.deepcopy(self.transitions)
-        #tmpProtocol.completeAndVisualizeProtocol()
+    def synthesizeTransientStates(self, configModel):
+        # worklist engine: every transient state is queued once when it is added and
+        # processed once, until no step produces new transient states
 
-        #@@@@@@@@@@@@#
-        # step 4: replacement
-        self.handleReplacements()
+        # step 2.1: pre-ordered
+        with self.phase("preOrdered"):
+            self.preOrderedTransitions(configModel)
 
-        #@@@@@@@@@@@@#
-        # step 4: run preOrdered again
-        # steps 3 and 4 may have introduced new pre-ordered transient states
-        self.preOrderedTransitions(configModel)
+        # step 2.2: post-ordered
+        with self.phase("postOrdered"):
+            self.postOrderedTransitions(configModel)
 
-        #@@@@@@@@@@@@#
-        # step 5: create memory state machine
-        self.constructMemStateMachine(configModel)
+        # step 3: replacement
+        with self.phase("replacements"):
+            self.handleReplacements()
 
-        self.visualizeProtocol()
+        # step 4: fixed point, the steps above may have introduced new transient states
+        with self.phase("fixedPoint"):
+            while (len(self.preOrderedQueue) > 0 or len(self.postOrderedQueue) > 0):
+                self.preOrderedTransitions(configModel)
+                self.postOrderedTransitions(configModel)
 
     def handleReplacements(self):
         invStableState = self.getInvalidStableState()
@@ -987,7 +1351,7 @@ class CoherenceProtocol:
                     t2 = Transition(tstate1, "Ordered", tstate2)
                     t3 = Transition(tstate2, "Data", t.getDestination())
 
-                    self.transitions.remove(t)
+                    self.removeTransition(t)
                     self.addTransition(t1)
                     self.addTransition(t2)
                     self.addTransition(t3)
@@ -1036,7 +1400,7 @@ class CoherenceProtocol:
                             else:
                                 t2.setAction(" Write-back data")
 
-                        self.transitions.remove(t)
+                        self.removeTransition(t)
                         self.addTransition(t1)
                         self.addTransition(t2)
 
@@ -1046,113 +1410,867 @@ class CoherenceProtocol:
                             t.setAction("Send data")
 
 
-def parse(inputFile, inputCoherenceProtocol):
+# spec grammar, compiled once: section markers, state encodings and transitions
+sectionPattern = re.compile(r'\s*@\s*(state modeling|txn specs|include)\b\s*(.*?)\s*$', re.I)
+statePattern = re.compile(r'\s*([^\s(),#]+)\s*->\s*\(\s*([^\s(),]+)\s*,\s*([^\s(),]+)\s*,\s*([^\s(),]+)\s*\)\s*$')
+txnPattern = re.compile(r'\s*\(\s*([^\s(),]+)\s*,\s*([^\s(),]+)\s*\)\s*->\s*([^\s(),]+)\s*$')
 
-    f = open(str(inputFile), "r")
-    flines = f.readlines()
+class SpecError(ValueError):
+    def __init__(self, path, line, column, message):
+        ValueError.__init__(self, str(path)+":"+str(line)+":"+str(column)+": "+message)
+        self.path = path
+        self.line = line
+        self.column = column
 
-    parseState = 'idle'
+def parse(inputFile, inputCoherenceProtocol):
+    # streams the spec once; every state and transition is checked before synthesis starts
+    parseFile(str(inputFile), inputCoherenceProtocol, {}, [])
 
-    stateMap = {}
+def parseFile(path, inputCoherenceProtocol, stateMap, including, includedFrom=None):
+    # stateMap: name -> (state, path, line) of its definition, shared with included files
+    if (os.path.abspath(path) in including):
+        raise SpecError(includedFrom[0], includedFrom[1], includedFrom[2], "include cycle through "+path)
+    try:
+        f = open(path, "r")
+    except OSError as e:
+        if (includedFrom == None):
+            raise
+        raise SpecError(includedFrom[0], includedFrom[1], includedFrom[2], "cannot include "+path+": "+str(e.strerror))
+    including.append(os.path.abspath(path))
 
-    for line in flines:
-        stateDemarkSearch = re.search(r'@ State modeling', line, re.M|re.I)
-        txnDemarkSearch = re.search(r'@ Txn specs', line, re.M|re.I)
-        commentLine = re.match(r'^#.*', line, re.M|re.I)
+    parseState = 'idle'
+    with f:
+        for (lineno, line) in enumerate(f, 1):
+            stripped = line.strip()
+            if (stripped == "" or stripped[0] == "#"):
+                continue
+
+            if (stripped[0] == "@"):
+                m = sectionPattern.match(line)
+                if (m == None):
+                    raise SpecError(path, lineno, line.index("@") + 1, "unknown section "+stripped)
+                kind = m.group(1).lower()
+                if (kind == "state modeling"):
+                    parseState = 'state'
+                elif (kind == "txn specs"):
+                    parseState = 'txn'
+                else:
+                    target = m.group(2).strip('"\'')
+                    if (target == ""):
+                        raise SpecError(path, lineno, m.end(1) + 1, "include needs a file name")
+                    target = os.path.join(os.path.dirname(path), target)
+                    parseFile(target, inputCoherenceProtocol, stateMap, including, (path, lineno, m.start(2) + 1))
+                continue
 
-        if (commentLine):
-            continue
-        if (stateDemarkSearch):
-            parseState = 'state'
-        elif (txnDemarkSearch):
-            parseState = 'txn'
-        else :
             if (parseState == 'state'):
-                stateEncodeExp = re.match(r'(.*) -> \((.*), (.*), (.*)\)', line, re.M|re.I)
-
-                if (stateEncodeExp):
-                    state = str(stateEncodeExp.group(1))
-                    ap = str(stateEncodeExp.group(2))
-                    pc = str(stateEncodeExp.group(3))
-                    sm = str(stateEncodeExp.group(4))
+                m = statePattern.match(line)
+                if (m == None):
+                    raise SpecError(path, lineno, len(line) - len(line.lstrip()) + 1, "expected <state> -> (<AP>, <PCP>, <SMP>)")
+                (state, ap, pc, sm) = m.groups()
+                for (group, value, values) in ((2, ap, aweightMap), (3, pc, pweightMap), (4, sm, mweightMap)):
+                    if (value not in values):
+                        raise SpecError(path, lineno, m.start(group) + 1, "unknown "+("AP", "PCP", "SMP")[group - 2]+" value "+value+" (expected one of "+", ".join(values)+")")
+                if (state in stateMap):
+                    first = stateMap[state]
+                    raise SpecError(path, lineno, m.start(1) + 1, "state "+state+" is already defined at "+first[1]+":"+str(first[2]))
+
+                cohState = CoherenceState(state, True)
+                cohState.setAP(ap)
+                cohState.setSMP(sm)
+                cohState.setPCP(pc)
+
+                inputCoherenceProtocol.addState(cohState)
+                stateMap[state] = (cohState, path, lineno)
 
-                    cohState = CoherenceState(state, True)
-                    cohState.setAP(ap)
-                    cohState.setSMP(sm)
-                    cohState.setPCP(pc)
-
-                    inputCoherenceProtocol.addState(cohState)
-                    stateMap[state] = cohState
- 
             elif (parseState == 'txn'):
-                txnEncodeExp = re.match(r'\((.*), (.*)\) -> (.*)', line, re.M|re.I)
-
-                if (txnEncodeExp):
-                    source = txnEncodeExp.group(1)
-                    destination = txnEncodeExp.group(3)
-                    event = txnEncodeExp.group(2)
-
-                    sourceState = stateMap[source]
-                    destState = stateMap[destination]
+                m = txnPattern.match(line)
+                if (m == None):
+                    raise SpecError(path, lineno, len(line) - len(line.lstrip()) + 1, "expected (<state>, <event>) -> <state>")
+                (source, event, destination) = m.groups()
+                sourceState = stateMap.get(source)
+                destState = stateMap.get(destination)
+                if (sourceState == None):
+                    raise SpecError(path, lineno, m.start(1) + 1, "undefined state "+source)
+                if (event not in E):
+                    raise SpecError(path, lineno, m.start(2) + 1, "unknown event "+event+" (expected one of "+", ".join(E)+")")
+                if (destState == None):
+                    raise SpecError(path, lineno, m.start(3) + 1, "undefined state "+destination)
+
+                transition = Transition(sourceState[0], event, destState[0])
+                inputCoherenceProtocol.addTransition(transition)
 
-                    transition = Transition(sourceState, event, destState)
-                    inputCoherenceProtocol.addTransition(transition)
+            else:
+                raise SpecError(path, lineno, len(line) - len(line.lstrip()) + 1, "expected a section marker (@ State modeling, @ Txn specs or @ include) before "+stripped)
 
-    parseState = 'idle'
+    including.pop()
 
 
-def analyzeProtocol(inputFile, configModel):
+def analyzeProtocol(inputFile, configModel, inputCoherenceProtocol=None):
 
-    inputCoherenceProtocol = CoherenceProtocol()
+    if (inputCoherenceProtocol == None):
+        inputCoherenceProtocol = CoherenceProtocol()
 
-    # parse and populate stateMap, txnMap
-    parse(inputFile, inputCoherenceProtocol)
+        # parse and populate stateMap, txnMap
+        parse(inputFile, inputCoherenceProtocol)
     
     # construct U_p
-    inputCoherenceProtocol.constructU()
+    with inputCoherenceProtocol.phase("constructU"):
+        inputCoherenceProtocol.constructU()
 
-    # asymptotic latency analysis
-    inputCoherenceProtocol.ipTransitions = inputCoherenceProtocol.transitions
-    inputCoherenceProtocol.asymptoticLatencyAnalysis(configModel)
+    # the analysis and the synthesis read the input protocol through the same snapshot
+    with inputCoherenceProtocol.phase("snapshot"):
+        inputCoherenceProtocol.takeSnapshot()
 
-    if (inputCoherenceProtocol.isNonLinearLatency()):
-        print ("Input protocol has non-linear WCAL bound")
-        inputCoherenceProtocol.printNonLinearTransitions()
-    else:
-        print ("Input protocol has linear WCAL bound")
+    # asymptotic latency analysis
+    with inputCoherenceProtocol.phase("analysis"):
+        inputCoherenceProtocol.asymptoticLatencyAnalysis(configModel)
+    inputCoherenceProtocol.printLatencyVerdict()
 
     return inputCoherenceProtocol
 
+# synthesis result cache, keyed by the parsed spec, the system model and the tool version
+
+def getToolVersion():
+    # the digest of this file invalidates cached results whenever the synthesis code changes
+    with open(os.path.abspath(__file__), "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return VERSION+"+"+digest[:16]
+
+def getCacheKey(inputCoherenceProtocol, configModel):
+    # comments, blank lines and formatting of the spec file do not change the key
+    spec = {
+        "states": [(s.getStateString(), s.AP, s.PCP, s.SMP) for s in inputCoherenceProtocol.states],
+        "transitions": [(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()) for t in inputCoherenceProtocol.transitions],
+        "model": configModel,
+        "version": getToolVersion(),
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+def stateToDict(s, kind):
+    d = {"name": s.getStateString(), "stable": s.isStableState(), "AP": s.AP, "SMP": s.SMP, "PCP": s.PCP,
+         "preOrdered": s.isPreOrdered, "kind": kind, "source": None, "parent": None, "intendedDest": None}
+    if (s.source != None):
+        d["source"] = s.source.getStateString()
+    if (s.getParent() != None):
+        d["parent"] = s.getParent().getStateString()
+    if (s.getIntendedDestination() != None):
+        d["intendedDest"] = s.getIntendedDestination().getStateString()
+    return d
+
+def collectStates(states, transitions):
+    # states of the machine followed by states only reachable through transitions or links,
+    # as (state, member of the machine) pairs, one per state name
+    result = []
+    seen = set()
+    work = list(states)
+    for t in transitions:
+        work.append(t.getSource())
+        work.append(t.getDestination())
+    i = 0
+    while (i < len(work)):
+        s = work[i]
+        i = i + 1
+        if (s.getStateString() in seen):
+            continue
+        seen.add(s.getStateString())
+        result.append((s, i <= len(states)))
+        for link in (s.source, s.getParent(), s.getIntendedDestination()):
+            if (link != None):
+                work.append(link)
+    return result
+
+def statesToDicts(states, transitions, kindOf):
+    return [stateToDict(s, kindOf(s) if member else None) for (s, member) in collectStates(states, transitions)]
+
+def protocolToDict(p, configModel):
+    preOrdered = set(id(s) for s in p.preOrderedStates)
+    postOrdered = set(id(s) for s in p.postOrderedStates)
+
+    def kindOf(s):
+        if (id(s) in preOrdered):
+            return "pre"
+        if (id(s) in postOrdered):
+            return "post"
+        return "state"
+
+    return {
+        "version": getToolVersion(),
+        "model": configModel,
+        "states": statesToDicts(p.states, p.transitions, kindOf),
+        "memStates": statesToDicts(p.memStates, p.memTransitions, lambda s: "state"),
+        "transitions": [(t.getSource().getStateString(), t.getTriggerEvent(), t.getAction(), t.getDestination().getStateString()) for t in p.transitions],
+        "memTransitions": [(t.getSource().getStateString(), t.getTriggerEvent(), t.getAction(), t.getDestination().getStateString()) for t in p.memTransitions],
+        "nonLinear": [(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()) for t in p.nonLinearTransitions],
+    }
+
+def statesFromDicts(dicts):
+    states = {}
+    for d in dicts:
+        s = CoherenceState(d["name"], d["stable"])
+        s.setAP(d["AP"])
+        s.setSMP(d["SMP"])
+        s.setPCP(d["PCP"])
+        s.isPreOrdered = d["preOrdered"]
+        states[d["name"]] = s
+    for d in dicts:
+        s = states[d["name"]]
+        if (d["source"] != None):
+            s.setSource(states[d["source"]])
+        if (d["parent"] != None):
+            s.setParent(states[d["parent"]])
+        if (d["intendedDest"] != None):
+            s.setIntendedDestination(states[d["intendedDest"]])
+    return states
+
+def protocolFromDict(d, p):
+    # fill p, which holds the parsed input protocol, with the synthesized machines from d
+    p.takeSnapshot()
+    ipTransitions = dict(((t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()), t) for t in p.ipTransitions)
+    for key in d["nonLinear"]:
+        p.addNonLinearTransitions(ipTransitions[tuple(key)])
+    for t in p.ipTransitions:
+        if (t not in p.nonLinearTransitions):
+            p.addLinearTransitions(t)
+
+    synthesized = CoherenceProtocol()
+    states = statesFromDicts(d["states"])
+    for sd in d["states"]:
+        s = states[sd["name"]]
+        if (sd["kind"] == "pre"):
+            synthesized.addPreOrderedState(s)
+        elif (sd["kind"] == "post"):
+            synthesized.addPostOrderedState(s)
+        elif (sd["kind"] == "state"):
+            synthesized.addState(s)
+    for (src, e, a, dst) in d["transitions"]:
+        t = Transition(states[src], e, states[dst])
+        t.setAction(a)
+        synthesized.appendTransition(t)
+
+    memStates = statesFromDicts(d["memStates"])
+    for sd in d["memStates"]:
+        if (sd["kind"] != None):
+            synthesized.addMemState(memStates[sd["name"]])
+    for (src, e, a, dst) in d["memTransitions"]:
+        t = Transition(memStates[src], e, memStates[dst])
+        t.setAction(a)
+        synthesized.addMemTransition(t)
+
+    for attr in ("states", "preOrderedStates", "postOrderedStates", "transitions", "memStates", "memTransitions",
+                 "stateIndex", "preOrderedIndex", "postOrderedIndex", "transitionIndex", "transitionMap", "memTransitionIndex"):
+        setattr(p, attr, getattr(synthesized, attr))
+    p.preOrderedQueue.clear()
+    p.postOrderedQueue.clear()
+    return p
+
+def loadCachedProtocol(cacheDir, key, p):
+    path = os.path.join(cacheDir, key+".json")
+    if (not os.path.exists(path)):
+        return None
+    try:
+        with open(path, "r") as f:
+            d = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (d.get("version") != getToolVersion()):
+        return None
+    return protocolFromDict(d, p)
+
+def storeCachedProtocol(cacheDir, key, p, configModel):
+    os.makedirs(cacheDir, exist_ok=True)
+    path = os.path.join(cacheDir, key+".json")
+    tmpPath = path+"."+str(os.getpid())+".tmp"
+    with open(tmpPath, "w") as f:
+        json.dump(protocolToDict(p, configModel), f)
+    os.replace(tmpPath, path)
+
+# binary protocol file: the synthesized machines in a versioned, fixed-layout format that is
+# memory-mapped and read in place, so tools can open a protocol without synthesizing it again
+# - header: magic, format version, string indices of the system model and the tool version,
+#   then an (offset, count) entry per section
+# - string pool: state names, events, actions and encodings as offsets into UTF-8 bytes
+# - per machine (private cache, shared memory, input protocol): a state table and a transition table
+#   referring to states by their row and to strings by their index
+# - the rows of the input transitions with a non-linear WCAL bound
+# all integers are little-endian, sections start on 8-byte boundaries
+
+PROTOCOL_MAGIC = b"SYNPROTO"
+PROTOCOL_FORMAT = 1
+
+protocolHeader = struct.Struct("<8sHHIII")
+protocolSection = struct.Struct("<QQ")
+protocolSections = ("stringOffsets", "stringBytes", "states", "transitions", "memStates", "memTransitions",
+                    "ipStates", "ipTransitions", "nonLinear")
+
+# a missing encoding (-1) or link (-1) and an unknown weight (-1)
+NO_STRING = 0xFFFFFFFF
+
+stateDtype = np.dtype([("name", "<u4"), ("AP", "<u4"), ("PCP", "<u4"), ("SMP", "<u4"),
+                       ("apWeight", "i1"), ("pcpWeight", "i1"), ("smpWeight", "i1"), ("flags", "u1"),
+                       ("source", "<i4"), ("parent", "<i4"), ("intendedDest", "<i4")])
+transitionDtype = np.dtype([("source", "<i4"), ("event", "<u4"), ("action", "<u4"), ("destination", "<i4")])
+
+# flags: bit 0 stable, bit 1 pre-ordered, bits 2-3 the list the state belongs to
+STATE_STABLE = 1
+STATE_PREORDERED = 2
+stateKinds = (None, "state", "pre", "post")
+
+class ProtocolFileError(ValueError):
+    def __init__(self, path, message):
+        ValueError.__init__(self, str(path)+": "+message)
+        self.path = path
+
+def isProtocolFile(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(PROTOCOL_MAGIC)) == PROTOCOL_MAGIC
+    except OSError:
+        return False
+
+def writeProtocolFile(path, p, configModel):
+    # loading checks the file against the system model, so it must be known
+    if (configModel == None or configModel == ""):
+        raise ProtocolFileError(path, "no system model given for the protocol file")
+    strings = {}
+    def intern(value):
+        if (value == -1 or value == None):
+            return NO_STRING
+        if (value not in strings):
+            strings[value] = len(strings)
+        return strings[value]
+
+    preOrdered = set(id(s) for s in p.preOrderedStates)
+    postOrdered = set(id(s) for s in p.postOrderedStates)
+
+    def machine(states, transitions, kindOf):
+        collected = collectStates(states, transitions)
+        rows = dict((s.getStateString(), i) for (i, (s, member)) in enumerate(collected))
+        table = np.zeros(len(collected), dtype=stateDtype)
+        for (i, (s, member)) in enumerate(collected):
+            kind = stateKinds.index(kindOf(s)) if member else 0
+            table[i] = (intern(s.getStateString()), intern(s.AP), intern(s.PCP), intern(s.SMP),
+                        -1 if s.apWeight == None else s.apWeight, -1 if s.pcpWeight == None else s.pcpWeight,
+                        -1 if s.smpWeight == None else s.smpWeight,
+                        (STATE_STABLE if s.isStableState() else 0) | (STATE_PREORDERED if s.isPreOrdered else 0) | (kind << 2),
+                        -1 if s.source == None else rows[s.source.getStateString()],
+                        -1 if s.getParent() == None else rows[s.getParent().getStateString()],
+                        -1 if s.getIntendedDestination() == None else rows[s.getIntendedDestination().getStateString()])
+        edges = np.zeros(len(transitions), dtype=transitionDtype)
+        for (i, t) in enumerate(transitions):
+            edges[i] = (rows[t.getSource().getStateString()], intern(t.getTriggerEvent()), intern(t.getAction()),
+                        rows[t.getDestination().getStateString()])
+        return (table, edges)
+
+    def kindOf(s):
+        if (id(s) in preOrdered):
+            return "pre"
+        if (id(s) in postOrdered):
+            return "post"
+        return "state"
+
+    model = intern(configModel)
+    version = intern(getToolVersion())
+    (states, transitions) = machine(p.states, p.transitions, kindOf)
+    (memStates, memTransitions) = machine(p.memStates, p.memTransitions, lambda s: "state")
+    (ipStates, ipTransitions) = machine(p.ipStates, p.ipTransitions, lambda s: "state")
+    ipRows = dict(((t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()), i) for (i, t) in enumerate(p.ipTransitions))
+    nonLinear = np.array([ipRows[(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString())] for t in p.nonLinearTransitions], dtype="<u4")
+
+    encoded = [str(value).encode("utf-8") for value in strings]
+    stringOffsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(b) for b in encoded], out=stringOffsets[1:])
+    stringBytes = np.frombuffer(b"".join(encoded), dtype="u1")
+
+    arrays = (stringOffsets, stringBytes, states, transitions, memStates, memTransitions, ipStates, ipTransitions, nonLinear)
+    offset = protocolHeader.size + protocolSection.size * len(arrays)
+    entries = []
+    for a in arrays:
+        offset = (offset + 7) & ~7
+        entries.append((offset, len(a)))
+        offset = offset + a.nbytes
+
+    tmpPath = path+"."+str(os.getpid())+".tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(protocolHeader.pack(PROTOCOL_MAGIC, PROTOCOL_FORMAT, 0, model, version, len(arrays)))
+        for entry in entries:
+            f.write(protocolSection.pack(*entry))
+        for (a, (start, count)) in zip(arrays, entries):
+            f.write(b"\0" * (start - f.tell()))
+            f.write(a.tobytes())
+    os.replace(tmpPath, path)
+
+class ProtocolImage:
+    # read-only view of a binary protocol file: the tables are numpy arrays over the mapped file
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ProtocolFileError(path, "empty file")
+        try:
+            self.readSections()
+        except Exception:
+            self.close()
+            raise
+
+    def readSections(self):
+        if (len(self.map) < protocolHeader.size):
+            raise ProtocolFileError(self.path, "truncated header")
+        (magic, version, flags, model, toolVersion, count) = protocolHeader.unpack_from(self.map, 0)
+        if (magic != PROTOCOL_MAGIC):
+            raise ProtocolFileError(self.path, "not a protocol file")
+        if (version != PROTOCOL_FORMAT):
+            raise ProtocolFileError(self.path, "format version "+str(version)+", expected "+str(PROTOCOL_FORMAT))
+        if (count != len(protocolSections)):
+            raise ProtocolFileError(self.path, str(count)+" sections, expected "+str(len(protocolSections)))
+
+        dtypes = (np.dtype("<u4"), np.dtype("u1"), stateDtype, transitionDtype, stateDtype, transitionDtype,
+                  stateDtype, transitionDtype, np.dtype("<u4"))
+        for (i, (name, dtype)) in enumerate(zip(protocolSections, dtypes)):
+            (offset, n) = protocolSection.unpack_from(self.map, protocolHeader.size + i * protocolSection.size)
+            if (offset + n * dtype.itemsize > len(self.map)):
+                raise ProtocolFileError(self.path, "section "+name+" runs past the end of the file")
+            setattr(self, name, np.frombuffer(self.map, dtype=dtype, count=n, offset=offset))
+        self.strings = [None] * (len(self.stringOffsets) - 1)
+        self.model = self.string(model)
+        self.toolVersion = self.string(toolVersion)
+
+    def string(self, i):
+        if (i == NO_STRING):
+            return -1
+        s = self.strings[i]
+        if (s == None):
+            s = self.stringBytes[self.stringOffsets[i]:self.stringOffsets[i + 1]].tobytes().decode("utf-8")
+            self.strings[i] = s
+        return s
+
+    def close(self):
+        # the array views must go before the map can be closed
+        for name in protocolSections:
+            if (hasattr(self, name)):
+                delattr(self, name)
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def buildStates(self, table):
+        states = []
+        for row in table.tolist():
+            s = CoherenceState(self.string(row[0]), bool(row[7] & STATE_STABLE))
+            s.setAP(self.string(row[1]))
+            s.setPCP(self.string(row[2]))
+            s.setSMP(self.string(row[3]))
+            s.isPreOrdered = bool(row[7] & STATE_PREORDERED)
+            states.append(s)
+        for (s, row) in zip(states, table.tolist()):
+            if (row[8] >= 0):
+                s.setSource(states[row[8]])
+            if (row[9] >= 0):
+                s.setParent(states[row[9]])
+            if (row[10] >= 0):
+                s.setIntendedDestination(states[row[10]])
+        return states
+
+    def buildTransitions(self, states, table):
+        transitions = []
+        for (src, e, a, dst) in table.tolist():
+            t = Transition(states[src], self.string(e), states[dst])
+            t.setAction(self.string(a) if a != NO_STRING else '')
+            transitions.append(t)
+        return transitions
+
+    def protocol(self):
+        p = CoherenceProtocol()
+        p.configModel = self.model
+
+        states = self.buildStates(self.states)
+        for (s, flags) in zip(states, self.states["flags"].tolist()):
+            kind = stateKinds[flags >> 2]
+            if (kind == "pre"):
+                p.addPreOrderedState(s)
+            elif (kind == "post"):
+                p.addPostOrderedState(s)
+            elif (kind == "state"):
+                p.addState(s)
+        for t in self.buildTransitions(states, self.transitions):
+            p.appendTransition(t)
+
+        memStates = self.buildStates(self.memStates)
+        for (s, flags) in zip(memStates, self.memStates["flags"].tolist()):
+            if (flags >> 2 != 0):
+                p.addMemState(s)
+        for t in self.buildTransitions(memStates, self.memTransitions):
+            p.addMemTransition(t)
+
+        ipStates = self.buildStates(self.ipStates)
+        members = [s for (s, flags) in zip(ipStates, self.ipStates["flags"].tolist()) if flags >> 2 != 0]
+        p.setSnapshot(ProtocolSnapshot(members, self.buildTransitions(ipStates, self.ipTransitions)))
+        nonLinear = set(self.nonLinear.tolist())
+        for (i, t) in enumerate(p.ipTransitions):
+            if (i in nonLinear):
+                p.addNonLinearTransitions(t)
+            else:
+                p.addLinearTransitions(t)
+        return p
+
+def loadProtocolFile(path):
+    with ProtocolImage(path) as image:
+        return image.protocol()
+
+def openProtocol(inputfile, configModel, cacheDir=None, instrumentation=None):
+    # a binary protocol file is loaded as is, anything else is a spec to synthesize
+    if (not isProtocolFile(inputfile)):
+        return synthesizeProtocol(inputfile, configModel, cacheDir, instrumentation)
+    p = loadProtocolFile(inputfile)
+    if (p.configModel != configModel):
+        raise ProtocolFileError(inputfile, "synthesized for the "+str(p.configModel)+" model, not "+str(configModel))
+    p.instrumentation = instrumentation
+    return p
+
+def synthesizeProtocol(inputfile, configModel, cacheDir=None, instrumentation=None):
+    print(" ----- Step 1: Analyze protocol -----")
+    ipCoherenceProtocol = CoherenceProtocol()
+    ipCoherenceProtocol.instrumentation = instrumentation
+    ipCoherenceProtocol.configModel = configModel
+    if (instrumentation != None):
+        instrumentation.info.update(spec=str(inputfile), model=configModel)
+    with ipCoherenceProtocol.phase("parse"):
+        parse(inputfile, ipCoherenceProtocol)
+
+    key = None
+    if (cacheDir != None):
+        with ipCoherenceProtocol.phase("cacheLoad"):
+            key = getCacheKey(ipCoherenceProtocol, configModel)
+            cached = loadCachedProtocol(cacheDir, key, ipCoherenceProtocol)
+        if (cached != None):
+            ipCoherenceProtocol.printLatencyVerdict()
+            print(" ----- Step 2: Non-stalling protocol implementation (cached) ----")
+            return ipCoherenceProtocol
+
+    analyzeProtocol(inputfile, configModel, ipCoherenceProtocol)
+
+    print(" ----- Step 2: Non-stalling protocol implementation ----")
+    ipCoherenceProtocol.synthesizeNonStallingProtocol(configModel)
+
+    if (cacheDir != None):
+        with ipCoherenceProtocol.phase("cacheStore"):
+            storeCachedProtocol(cacheDir, key, ipCoherenceProtocol, configModel)
+    return ipCoherenceProtocol
+
+class IncrementalSynthesis:
+    # keeps the previous run of one spec warm and redoes only the latency analysis
+    # of transitions whose inputs changed
+    def __init__(self, inputfile, configModel, outputDir='.', cacheDir=None, formats=defaultOutputFormats):
+        self.inputfile = inputfile
+        self.configModel = configModel
+        self.outputDir = outputDir
+        self.cacheDir = cacheDir
+        self.formats = formats
+        self.protocol = None
+        self.stateEncodings = None
+        self.destinations = {}  # (source, event) -> destination of the previous run
+        self.verdicts = {}      # (source, event, destination) -> non-linear?
+        self.dependencies = {}  # (source, event, destination) -> (state, event) pairs read by its analysis
+
+    def diff(self, p):
+        # (source, event) pairs whose destination was added, removed or changed
+        encodings = [(s.getStateString(), s.AP, s.PCP, s.SMP) for s in p.states]
+        destinations = {}
+        for t in p.transitions:
+            destinations.setdefault((t.getSource().getStateString(), t.getTriggerEvent()), t.getDestination().getStateString())
+
+        changed = set()
+        for key in set(destinations) | set(self.destinations):
+            if (destinations.get(key) != self.destinations.get(key)):
+                changed.add(key)
+
+        stateModelChanged = (encodings != self.stateEncodings)
+        return (changed, stateModelChanged, encodings, destinations)
+
+    def analyze(self, p, changed, stateModelChanged):
+        # verdicts are reused when none of the (state, event) pairs their analysis read changed
+        p.constructU()
+        p.takeSnapshot()
+
+        verdicts = {}
+        dependencies = {}
+        reused = 0
+        for t in p.ipTransitions:
+            key = (t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString())
+            deps = self.dependencies.get(key)
+            if (not stateModelChanged and key in self.verdicts and deps != None and deps.isdisjoint(changed)):
+                nonLinear = self.verdicts[key]
+                reused = reused + 1
+            else:
+                p.lookupTrace = set()
+                nonLinear = p.computeAsymptoticLatencyTransition(t, self.configModel)
+                deps = p.lookupTrace
+                p.lookupTrace = None
+
+            verdicts[key] = nonLinear
+            dependencies[key] = deps
+            if (nonLinear):
+                p.addNonLinearTransitions(t)
+            else:
+                p.addLinearTransitions(t)
+
+        p.printLatencyVerdict()
+        return (reused, verdicts, dependencies)
+
+    def update(self):
+        start = time.time()
+        p = CoherenceProtocol()
+        p.configModel = self.configModel
+        parse(self.inputfile, p)
+
+        changed, stateModelChanged, encodings, destinations = self.diff(p)
+        if (self.protocol != None and len(changed) == 0 and not stateModelChanged):
+            print ("No changes to the protocol specification")
+            return self.protocol
+
+        print (" ----- Step 1: Analyze protocol ("+str(len(changed))+" changed transitions) -----")
+        key = None
+        cached = None
+        if (self.cacheDir != None):
+            key = getCacheKey(p, self.configModel)
+            cached = loadCachedProtocol(self.cacheDir, key, p)
+
+        if (cached != None):
+            # verdicts come from the cache, their dependencies are unknown
+            verdicts = {}
+            dependencies = {}
+            p.printLatencyVerdict()
+            print (" ----- Step 2: Non-stalling protocol implementation (cached) ----")
+        else:
+            reused, verdicts, dependencies = self.analyze(p, changed, stateModelChanged)
+            print ("Reused "+str(reused)+" of "+str(len(p.ipTransitions))+" latency verdicts")
+
+            print (" ----- Step 2: Non-stalling protocol implementation ----")
+            p.synthesizeNonStallingProtocol(self.configModel)
+            if (self.cacheDir != None):
+                storeCachedProtocol(self.cacheDir, key, p, self.configModel)
+
+        # only a successful synthesis becomes the base of the next diff
+        self.protocol = p
+        self.stateEncodings = encodings
+        self.destinations = destinations
+        self.verdicts = verdicts
+        self.dependencies = dependencies
+
+        p.visualizeProtocol(self.outputDir, False, self.formats)
+        print ("Updated outputs in "+str(round((time.time() - start) * 1000, 1))+" ms")
+        return p
+
+    def watch(self, interval=0.2):
+        # poll the spec file and re-synthesize on every save
+        lastMtime = None
+        print ("Watching "+str(self.inputfile)+" (Ctrl-C to stop)")
+        try:
+            while True:
+                try:
+                    mtime = os.stat(self.inputfile).st_mtime_ns
+                except OSError:
+                    mtime = None
+                if (mtime != None and mtime != lastMtime):
+                    lastMtime = mtime
+                    try:
+                        self.update()
+                    except Exception as e:
+                        # keep the previous run warm until the spec is fixed
+                        print ("Update failed: "+type(e).__name__+": "+str(e))
+                for err in waitForRenders(False):
+                    print ("Rendering failed: "+err)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+def newInstrumentation(reportFile, profileDir):
+    if (reportFile == None and profileDir == None):
+        return None
+    return Instrumentation(reportFile != None, profileDir)
+
+def batchJob(inputfile, configModel, outputDir, cacheDir=None, formats=defaultOutputFormats, reportFile=None, profileDir=None):
+    # one (spec, system model) job of a batch run, console output goes to the job's log
+    summary = {"spec": inputfile, "model": configModel, "outputDir": outputDir, "linear": None,
+               "nonLinear": [], "inputTransitions": 0, "states": 0, "transitions": 0, "memTransitions": 0, "error": ""}
+
+    os.makedirs(outputDir, exist_ok=True)
+    # reports and profiles of a job go to its output directory
+    if (profileDir != None):
+        profileDir = os.path.join(outputDir, os.path.basename(os.path.normpath(profileDir)))
+    instrumentation = newInstrumentation(reportFile, profileDir)
+    with open(os.path.join(outputDir, "synthia.log"), "w") as log, contextlib.redirect_stdout(log):
+        try:
+            p = synthesizeProtocol(inputfile, configModel, cacheDir, instrumentation)
+            summary["linear"] = not p.isNonLinearLatency()
+            summary["nonLinear"] = [str(t.getSource().getStateString())+" -- "+str(t.getTriggerEvent())+" --> "+str(t.getDestination().getStateString()) for t in p.nonLinearTransitions]
+            summary["inputTransitions"] = len(p.ipTransitions)
+            summary["states"] = len(p.states)
+            summary["transitions"] = len(p.transitions)
+            summary["memTransitions"] = len(p.memTransitions)
+
+            with p.phase("output"):
+                p.visualizeProtocol(outputDir, False, formats)
+            if (reportFile != None):
+                instrumentation.writeReport(os.path.join(outputDir, os.path.basename(reportFile)))
+            errors = waitForRenders()
+            if (len(errors) > 0):
+                summary["error"] = "; ".join(errors)
+                print ("\n".join(errors))
+        except Exception as e:
+            traceback.print_exc(file=log)
+            summary["error"] = type(e).__name__+": "+str(e)
+
+    return summary
+
+def batchSynthesis(specs, configModels, outputRoot, jobs=None, cacheDir=None, formats=defaultOutputFormats, reportFile=None, profileDir=None):
+    # synthesize every (spec, system model) pair in a process pool
+    inputfiles = []
+    for spec in specs:
+        matches = sorted(glob.glob(spec))
+        if (len(matches) == 0):
+            print ("No spec files match "+str(spec))
+        for m in matches:
+            if (m not in inputfiles):
+                inputfiles.append(m)
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for inputfile in inputfiles:
+            name = os.path.splitext(os.path.basename(inputfile))[0]
+            for configModel in configModels:
+                outputDir = os.path.join(outputRoot, name+"-"+configModel)
+                futures.append(pool.submit(batchJob, inputfile, configModel, outputDir, cacheDir, formats, reportFile, profileDir))
+        for fut in futures:
+            summaries.append(fut.result())
+
+    printBatchSummary(summaries, os.path.join(outputRoot, "summary.csv"))
+    return summaries
+
+def printBatchSummary(summaries, summaryFile):
+    header = ("Spec", "Model", "WCAL", "Input transitions", "States", "Transitions", "Mem transitions", "Error")
+    rows = []
+    for s in summaries:
+        if (s["linear"] == None):
+            verdict = "-"
+        elif (s["linear"]):
+            verdict = "linear"
+        else:
+            verdict = "non-linear"
+        rows.append((s["spec"], s["model"], verdict, str(s["inputTransitions"]), str(s["states"]),
+                     str(s["transitions"]), str(s["memTransitions"]), s["error"]))
+
+    widths = [max(len(r[i]) for r in rows + [header]) for i in range(len(header))]
+    print ("@@@@@ Batch summary @@@@@")
+    for r in [header] + rows:
+        print ("  ".join(r[i].ljust(widths[i]) for i in range(len(header))).rstrip())
+    for s in summaries:
+        for t in s["nonLinear"]:
+            print ("non-linear ("+s["spec"]+", "+s["model"]+"): "+t)
+
+    os.makedirs(os.path.dirname(summaryFile) or '.', exist_ok=True)
+    with open(summaryFile, "w", newline="") as sf:
+        w = csv.writer(sf)
+        w.writerow(header)
+        w.writerows(rows)
+
+    linear = len([s for s in summaries if s["linear"] == True])
+    nonLinear = len([s for s in summaries if s["linear"] == False])
+    failed = len([s for s in summaries if s["error"] != ""])
+    print ("Jobs: "+str(len(summaries))+", linear: "+str(linear)+", non-linear: "+str(nonLinear)+", failed: "+str(failed))
+
 def main(argv):
     # main function
     inputfile= ' '
     outputfile= ' '
     configModel='direct' # memory: all communication through shared memory, direct: pt-to-pt communication
+    batchSpecs = []
+    outputRoot = 'synthia-output'
+    jobs = None
+    cacheDir = os.environ.get("SYNTHIA_CACHE_DIR") or None
+    watch = False
+    formats = defaultOutputFormats
+    view = False
+    reportFile = None
+    profileDir = None
+
+    usage = 'synth.py -i <input-protocol> -s <system-model> [-f <format>[,<format>...]] [--view] [-c <cache-dir>] [-w] [--report=<json>] [--profile=<dir>]\n' \
+            'synth.py -b <spec-glob>[,<spec-glob>...] -s <system-model>[,<system-model>...] [-o <output-dir>] [-j <jobs>] [-f <format>[,<format>...]] [-c <cache-dir>] [--report=<json>] [--profile=<dir>]\n' \
+            'output formats: '+", ".join(outputFormats)+' (default: '+",".join(defaultOutputFormats)+')'
 
     try:
-        opts, args = getopt.getopt(argv, "hi:s:", ["ifile=", "system-model="])
+        opts, args = getopt.getopt(argv, "hi:s:b:o:j:c:wf:", ["ifile=", "system-model=", "batch=", "output-dir=", "jobs=", "cache-dir=", "no-cache", "watch", "formats=", "view", "report=", "profile="])
     except getopt.GetoptError:
-        print ('synth.py -i <input-protocol> -s <system-model>')
+        print (usage)
         sys.exit(2)
 
     for opt, arg in opts:
         if opt == '-h' :
-            print ('synth.py -i <input> -s <system-model>')
+            print (usage)
             sys.exit()
         elif opt in ("-i", "--ifile"):
             inputfile = arg
             outputfile = "linear-"+arg
         elif opt in ("-s", "--system-model"):
             configModel = arg
+        elif opt in ("-b", "--batch"):
+            batchSpecs.extend(a for a in arg.split(",") if a != "")
+        elif opt in ("-o", "--output-dir"):
+            outputRoot = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-c", "--cache-dir"):
+            cacheDir = arg
+        elif opt == "--no-cache":
+            cacheDir = None
+        elif opt in ("-w", "--watch"):
+            watch = True
+        elif opt in ("-f", "--formats"):
+            formats = tuple(fmt for fmt in arg.split(",") if fmt != "")
+            for fmt in formats:
+                if (fmt not in outputFormats):
+                    print ("Unknown output format "+str(fmt))
+                    print (usage)
+                    sys.exit(2)
+        elif opt == "--view":
+            view = True
+        elif opt == "--report":
+            reportFile = arg
+        elif opt == "--profile":
+            profileDir = arg
 
     print("@@@@@ Predictable protocol analyzer @@@@@")
-    print(" ----- Step 1: Analyze protocol -----")
-    ipCoherenceProtocol = analyzeProtocol(inputfile, configModel)
-    ipCoherenceProtocol.ipStates = copy.deepcopy(ipCoherenceProtocol.states)
-    ipCoherenceProtocol.ipTransitions = copy.deepcopy(ipCoherenceProtocol.transitions)
+    if (len(batchSpecs) > 0):
+        batchSynthesis(batchSpecs + args, [m for m in configModel.split(",") if m != ""], outputRoot, jobs, cacheDir, formats, reportFile, profileDir)
+        return
 
-    print(" ----- Step 2: Non-stalling protocol implementation ----")
-    ipCoherenceProtocol.constructNonStallingProtocol(inputfile, configModel)
+    if (watch):
+        IncrementalSynthesis(inputfile, configModel, '.', cacheDir, formats).watch()
+        return
+
+    instrumentation = newInstrumentation(reportFile, profileDir)
+    try:
+        ipCoherenceProtocol = synthesizeProtocol(inputfile, configModel, cacheDir, instrumentation)
+    except SpecError as e:
+        print (str(e))
+        sys.exit(2)
+    (hits, misses) = ipCoherenceProtocol.getLatencyCacheStats()
+    print ("Latency analysis cache: "+str(hits)+" hits, "+str(misses)+" misses")
+    with ipCoherenceProtocol.phase("output"):
+        ipCoherenceProtocol.visualizeProtocol('.', view, formats)
+    if (instrumentation != None):
+        instrumentation.printSummary()
+        if (reportFile != None):
+            instrumentation.writeReport(reportFile)
+            print ("Wrote instrumentation report to "+reportFile)
+    for err in waitForRenders():
+        print ("Rendering failed: "+err)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,295 @@
+# Step 7: Compiled transition tables
+
+# Compiles the synthesized private-cache and shared-memory FSMs into dense tables indexed by
+# [state, event]: the next state and a bitmask of the actions the transition performs.
+# - cache events are the events of E followed by the internal events of the synthesis
+#   (Ordered, Data, ...), memory events are its bus messages and internal events, both in
+#   order of first use
+# - action bits follow A, then any other action the synthesis uses, in order of first use.
+#   Actions written into an event ("Ordered, Write-back data", "GetS/Stall") are split off,
+#   so the columns are plain events
+# - states are numbered as in the simulator tables, unhandled entries hold the state count
+#   (NONE) and no actions
+# - where the synthesis left two transitions for one (state, event) the first one wins, as
+#   in synthia's own lookups, and the entry is counted as ambiguous
+# The tables are written as a NumPy archive, a C header and a SystemVerilog package.
+
+import sys, getopt, os, re
+import numpy as np
+
+import synthia
+
+tableFormats = ('npz', 'c', 'sv')
+
+def splitEvent(e):
+    # "Ordered, Write-back data" -> ("Ordered", ["Write-back data"]), "GetS/Stall" -> ("GetS", ["Stall"])
+    parts = [x.strip() for x in str(e).split(",")]
+    (event, actions) = (parts[0], parts[1:])
+    if ("/" in event):
+        (event, suffix) = [x.strip() for x in event.split("/", 1)]
+        actions = [suffix] + actions
+    return (event, [a for a in actions if a != ""])
+
+def splitAction(a):
+    return [x.strip() for x in str(a).split(",") if x.strip() != ""]
+
+def bitWidth(n):
+    # bits to encode the values 0..n-1
+    return max(1, (n - 1).bit_length())
+
+def unsignedType(bits):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if (bits <= np.iinfo(dtype).bits):
+            return dtype
+    return np.uint64
+
+def identifier(name):
+    s = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', str(name))
+    return re.sub(r'[^0-9A-Za-z]+', '_', s).strip('_').upper()
+
+def identifiers(prefix, names):
+    # one C/SystemVerilog identifier per name, made unique by the index where two names collide
+    result = []
+    for (i, n) in enumerate(names):
+        ident = prefix+"_"+identifier(n)
+        if (ident in result):
+            ident = ident+"_"+str(i)
+        result.append(ident)
+    return result
+
+class ActionSet:
+    # action names and their bits, matched without regard to case
+    def __init__(self):
+        self.names = []
+        self.bits = {}
+        for a in synthia.A:
+            self.bit(a)
+
+    def bit(self, name):
+        key = name.lower()
+        if (key not in self.bits):
+            self.bits[key] = len(self.names)
+            self.names.append(name)
+        return self.bits[key]
+
+    def mask(self, names):
+        m = 0
+        for name in names:
+            m = m | (1 << self.bit(name))
+        return m
+
+class TransitionTable:
+    # dense next-state and action tables of one FSM
+    def __init__(self, name, title, states, transitions, events, actions):
+        self.name = name
+        self.title = title
+
+        self.states = []
+        index = {}
+        for s in list(states) + [x for t in transitions for x in (t.getSource(), t.getDestination())]:
+            if (s.getStateString() not in index):
+                index[s.getStateString()] = len(self.states)
+                self.states.append(s.getStateString())
+
+        self.events = list(events)
+        entries = []
+        for t in transitions:
+            (event, eventActions) = splitEvent(t.getTriggerEvent())
+            if (event not in self.events):
+                self.events.append(event)
+            mask = actions.mask(eventActions + splitAction(t.getAction()))
+            entries.append((index[t.getSource().getStateString()], self.events.index(event), index[t.getDestination().getStateString()], mask))
+
+        n = len(self.states)
+        self.none = n
+        self.stateBits = bitWidth(n + 1)
+        self.eventBits = bitWidth(len(self.events))
+        self.nextState = np.full((n, len(self.events)), self.none, dtype=unsignedType(self.stateBits))
+        self.actions = np.zeros((n, len(self.events)), dtype=np.uint64)
+        self.ambiguous = 0
+        for (s, e, d, mask) in entries:
+            if (self.nextState[s, e] != self.none):
+                self.ambiguous = self.ambiguous + 1
+                continue
+            self.nextState[s, e] = d
+            self.actions[s, e] = mask
+
+    def narrowActions(self, actionBits):
+        self.actions = self.actions.astype(unsignedType(actionBits))
+
+    def handled(self):
+        return int(np.count_nonzero(self.nextState != self.none))
+
+class CompiledProtocol:
+    def __init__(self, protocol, configModel):
+        self.configModel = configModel
+        self.actionSet = ActionSet()
+        self.cache = TransitionTable("cache", "private cache", protocol.states, protocol.transitions, synthia.E, self.actionSet)
+        self.mem = TransitionTable("mem", "shared memory", protocol.memStates, protocol.memTransitions, (), self.actionSet)
+        self.actionBits = len(self.actionSet.names)
+        for table in (self.cache, self.mem):
+            table.narrowActions(self.actionBits)
+
+    def tables(self):
+        return (self.cache, self.mem)
+
+    def writeNumpy(self, path):
+        arrays = {"actions": np.array(self.actionSet.names)}
+        for table in self.tables():
+            arrays[table.name+"NextState"] = table.nextState
+            arrays[table.name+"Actions"] = table.actions
+            arrays[table.name+"States"] = np.array(table.states)
+            arrays[table.name+"Events"] = np.array(table.events)
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def writeCHeader(self, path, source):
+        guard = "SYNTHIA_"+identifier(os.path.splitext(os.path.basename(path))[0])+"_H"
+        actionNames = identifiers("ACT", self.actionSet.names)
+        ctype = lambda dtype: "uint"+str(np.iinfo(dtype).bits)+"_t"
+        lines = ["/* Generated by tables.py from "+str(source)+" ("+self.configModel+" model), do not edit */",
+                 "#ifndef "+guard, "#define "+guard, "", "#include <stdint.h>", "",
+                 "/* action bits */"]
+        for (i, a) in enumerate(actionNames):
+            lines.append("#define "+a+" (1u << "+str(i)+")  /* "+self.actionSet.names[i]+" */")
+        lines.append("#define ACT_BITS "+str(self.actionBits))
+
+        for table in self.tables():
+            prefix = identifier(table.name)
+            stateNames = identifiers(prefix, table.states)
+            eventNames = identifiers(prefix, table.events)
+            lines.append("")
+            lines.append("/* "+table.title+": "+str(len(table.states))+" states ("+str(table.stateBits)+" bits), "+str(len(table.events))+" events ("+str(table.eventBits)+" bits) */")
+            lines.append("enum "+table.name+"_state {")
+            lines.extend("    "+n+" = "+str(i)+"," for (i, n) in enumerate(stateNames))
+            lines.append("    "+prefix+"_STATE_NONE = "+str(table.none))
+            lines.append("};")
+            lines.append("enum "+table.name+"_event {")
+            lines.extend("    "+n+" = "+str(i)+"," for (i, n) in enumerate(eventNames))
+            lines.append("    "+prefix+"_EVENTS = "+str(len(table.events)))
+            lines.append("};")
+            for (kind, values) in (("next_state", table.nextState), ("actions", table.actions)):
+                lines.append("static const "+ctype(values.dtype)+" "+table.name+"_"+kind+"["+str(len(table.states))+"]["+str(len(table.events))+"] = {")
+                for (i, row) in enumerate(values.tolist()):
+                    lines.append("    {"+", ".join(str(v) for v in row)+"},  /* "+table.states[i]+" */")
+                lines.append("};")
+        lines.extend(["", "#endif"])
+        with open(path, "w") as f:
+            f.write("\n".join(lines)+"\n")
+
+    def writeSystemVerilog(self, path, source):
+        package = "synthia_"+identifier(os.path.splitext(os.path.basename(path))[0]).lower()+"_pkg"
+        actionNames = identifiers("ACT", self.actionSet.names)
+        bits = self.actionBits
+        literal = lambda width, v: str(width)+"'d"+str(v)
+        lines = ["// Generated by tables.py from "+str(source)+" ("+self.configModel+" model), do not edit",
+                 "package "+package+";", "",
+                 "  localparam int ACT_BITS = "+str(bits)+";"]
+        for (i, a) in enumerate(actionNames):
+            lines.append("  localparam logic [ACT_BITS-1:0] "+a+" = "+literal(bits, 1 << i)+";  // "+self.actionSet.names[i])
+
+        for table in self.tables():
+            prefix = identifier(table.name)
+            stateNames = identifiers(prefix, table.states)
+            eventNames = identifiers(prefix, table.events)
+            stateType = table.name+"_state_t"
+            eventType = table.name+"_event_t"
+            lines.append("")
+            lines.append("  // "+table.title+": "+str(len(table.states))+" states, "+str(len(table.events))+" events")
+            lines.append("  typedef enum logic ["+str(table.stateBits - 1)+":0] {")
+            lines.append(",\n".join("    "+n+" = "+literal(table.stateBits, i) for (i, n) in enumerate(stateNames + [prefix+"_STATE_NONE"])))
+            lines.append("  } "+stateType+";")
+            lines.append("  typedef enum logic ["+str(table.eventBits - 1)+":0] {")
+            lines.append(",\n".join("    "+n+" = "+literal(table.eventBits, i) for (i, n) in enumerate(eventNames)))
+            lines.append("  } "+eventType+";")
+
+            handled = [(s, e) for (s, e) in np.argwhere(table.nextState != table.none).tolist()]
+            lines.append("")
+            lines.append("  function automatic "+stateType+" "+table.name+"_next_state(input "+stateType+" s, input "+eventType+" e);")
+            lines.append("    case ({s, e})")
+            for (s, e) in handled:
+                lines.append("      {"+stateNames[s]+", "+eventNames[e]+"}: return "+stateNames[int(table.nextState[s, e])]+";")
+            lines.append("      default: return "+prefix+"_STATE_NONE;")
+            lines.append("    endcase")
+            lines.append("  endfunction")
+            lines.append("")
+            lines.append("  function automatic logic [ACT_BITS-1:0] "+table.name+"_actions(input "+stateType+" s, input "+eventType+" e);")
+            lines.append("    case ({s, e})")
+            for (s, e) in handled:
+                mask = int(table.actions[s, e])
+                if (mask != 0):
+                    lines.append("      {"+stateNames[s]+", "+eventNames[e]+"}: return "+" | ".join(actionNames[b] for b in range(bits) if mask & (1 << b))+";")
+            lines.append("      default: return '0;")
+            lines.append("    endcase")
+            lines.append("  endfunction")
+        lines.extend(["", "endpackage"])
+        with open(path, "w") as f:
+            f.write("\n".join(lines)+"\n")
+
+    def printSizes(self):
+        print ("Compiled tables ("+self.configModel+" model)")
+        print ("Machine".ljust(15)+"States".rjust(8)+"Events".rjust(8)+"State bits".rjust(12)+"Event bits".rjust(12)+"Action bits".rjust(13)
+               +"Entries".rjust(9)+"Handled".rjust(9)+"Ambiguous".rjust(11)+"NumPy bytes".rjust(13)+"Packed bits".rjust(13))
+        for table in self.tables():
+            entries = table.nextState.size
+            print (table.title.ljust(15)+str(len(table.states)).rjust(8)+str(len(table.events)).rjust(8)+str(table.stateBits).rjust(12)+str(table.eventBits).rjust(12)
+                   +str(self.actionBits).rjust(13)+str(entries).rjust(9)+str(table.handled()).rjust(9)+str(table.ambiguous).rjust(11)
+                   +str(table.nextState.nbytes + table.actions.nbytes).rjust(13)+str(entries * (table.stateBits + self.actionBits)).rjust(13))
+        print ("Action bits: "+", ".join(str(i)+" "+a for (i, a) in enumerate(self.actionSet.names)))
+        print ("Packed bits: one (next state, actions) word per entry, the size of a lookup ROM")
+
+def compileTables(protocol, configModel, outputPrefix=None, formats=tableFormats, source=None):
+    compiled = CompiledProtocol(protocol, configModel)
+    compiled.printSizes()
+    if (outputPrefix != None):
+        writers = {"npz": (".npz", lambda path: compiled.writeNumpy(path)),
+                   "c": (".h", lambda path: compiled.writeCHeader(path, source)),
+                   "sv": (".sv", lambda path: compiled.writeSystemVerilog(path, source))}
+        for fmt in formats:
+            (suffix, write) = writers[fmt]
+            write(outputPrefix+suffix)
+            print ("Wrote "+outputPrefix+suffix)
+    return compiled
+
+def main(argv):
+    inputfile = ' '
+    configModel = 'direct'
+    outputPrefix = "protocol-tables"
+    formats = tableFormats
+
+    usage = 'tables.py -i <input-protocol> -s <system-model> [-o <output prefix>] [-f <format>[,<format>...]]\n' \
+            'table formats: '+", ".join(tableFormats)+' (default: all)'
+    try:
+        opts, args = getopt.getopt(argv, "hi:s:o:f:", ["ifile=", "system-model=", "ofile=", "formats="])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-s", "--system-model"):
+            configModel = arg
+        elif opt in ("-o", "--ofile"):
+            outputPrefix = arg
+        elif opt in ("-f", "--formats"):
+            formats = tuple(fmt for fmt in arg.split(",") if fmt != "")
+            for fmt in formats:
+                if (fmt not in tableFormats):
+                    print ("Unknown table format "+str(fmt))
+                    print (usage)
+                    sys.exit(2)
+
+    try:
+        protocol = synthia.openProtocol(inputfile, configModel)
+    except (synthia.SpecError, synthia.ProtocolFileError) as e:
+        print (str(e))
+        sys.exit(2)
+    print (" ----- Step 7: Compiled transition tables -----")
+    compileTables(protocol, configModel, outputPrefix, formats, os.path.basename(inputfile))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
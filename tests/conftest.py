@@ -0,0 +1,21 @@
+# Shared fixtures: the tests import the scripts from the repository root
+
+import os, sys
+import pytest
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoDir)
+
+import synthia
+
+def specPath(name):
+    return os.path.join(repoDir, name)
+
+def synthesize(spec, configModel):
+    # the steps of synthia.main, without rendering the state machines
+    return synthia.synthesizeProtocol(specPath(spec), configModel)
+
+@pytest.fixture
+def synthesized():
+    # a fresh synthesis per call, tools may annotate the protocol they are given
+    return synthesize
@@ -0,0 +1,36 @@
+# Batch synthesis in a process pool
+
+import os
+import csv
+
+import synthia
+from conftest import specPath
+
+def test_batch_summary_matches_single_runs(synthesized, tmp_path, monkeypatch):
+    # the state machines are not drawn, so the jobs need no graphviz binaries
+    monkeypatch.setattr(synthia.CoherenceProtocol, "visualizeProtocol", lambda self, *args, **kwargs: None)
+    specs = [specPath("MSI.spec"), specPath("MESI.spec"), specPath("MISSING*.spec")]
+    summaries = synthia.batchSynthesis(specs, ["direct", "memory"], str(tmp_path), 2)
+
+    assert [(os.path.basename(s["spec"]), s["model"]) for s in summaries] == [("MSI.spec", "direct"), ("MSI.spec", "memory"), ("MESI.spec", "direct"), ("MESI.spec", "memory")]
+    for s in summaries:
+        p = synthesized(os.path.basename(s["spec"]), s["model"])
+        assert s["error"] == ""
+        assert s["linear"] == (not p.isNonLinearLatency())
+        assert len(s["nonLinear"]) == len(p.nonLinearTransitions)
+        assert (s["states"], s["transitions"], s["memTransitions"]) == (len(p.states), len(p.transitions), len(p.memTransitions))
+        assert s["outputDir"] == str(tmp_path / (os.path.splitext(os.path.basename(s["spec"]))[0]+"-"+s["model"]))
+        assert os.path.getsize(os.path.join(s["outputDir"], "synthia.log")) > 0
+
+    with open(tmp_path / "summary.csv", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0][:3] == ["Spec", "Model", "WCAL"]
+    assert [(r[1], r[4]) for r in rows[1:]] == [(s["model"], str(s["states"])) for s in summaries]
+
+def test_a_failing_job_is_reported_not_raised(tmp_path, monkeypatch):
+    monkeypatch.setattr(synthia.CoherenceProtocol, "visualizeProtocol", lambda self, *args, **kwargs: None)
+    bad = tmp_path / "bad.spec"
+    bad.write_text("@ State modeling\nI -> (invalid, passive, clean)\n@ Txn specs\n(I, OwnReadM) -> X\n")
+    summaries = synthia.batchSynthesis([str(bad), specPath("MSI.spec")], ["direct"], str(tmp_path / "out"), 2)
+    assert summaries[0]["error"] != ""
+    assert summaries[1]["error"] == ""
@@ -0,0 +1,48 @@
+# Phase benchmark suite
+
+import pytest
+
+import benchmark
+from conftest import specPath
+
+def test_the_phases_reproduce_the_synthesis(synthesized, tmp_path):
+    rows = benchmark.runSuite([specPath("MSI.spec")], (4,), ("direct", "memory"), 1, str(tmp_path))
+    assert [r[7] for r in rows] == 4 * list(benchmark.phases + ("total",))
+    for configModel in ("direct", "memory"):
+        p = synthesized("MSI.spec", configModel)
+        (row,) = [r for r in rows if r[0] == "MSI.spec" and r[1] == configModel and r[7] == "total"]
+        assert row[2:7] == tuple(str(c) for c in (len(p.ipStates), len(p.ipTransitions), len(p.states), len(p.transitions), len(p.memTransitions)))
+        assert row[9:] == tuple(str(c) for c in p.getLatencyCacheStats())
+        assert float(row[8]) == pytest.approx(sum(float(r[8]) for r in rows if r[:2] == row[:2] and r[7] != "total"), abs=1e-5)
+
+    benchmark.writeResults(str(tmp_path / "results.csv"), rows)
+    assert benchmark.readResults(str(tmp_path / "results.csv")) == rows
+
+def test_the_comparison_flags_regressions_and_changed_outputs():
+    baseline = [("MSI.spec", "direct", "3", "18", "20", "60", "12", "analysis", "0.010000"),
+                ("MSI.spec", "direct", "3", "18", "20", "60", "12", "output", "0.010000")]
+    assert benchmark.compareResults(baseline, baseline) == ([], set())
+
+    slower = [baseline[0][:8] + ("0.020000",), baseline[1]]
+    (regressions, changed) = benchmark.compareResults(slower, baseline)
+    assert regressions == [("MSI.spec", "direct", "analysis", 0.01, 0.02)]
+    assert changed == set()
+
+    edited = [r[:4] + ("21",) + r[5:] for r in baseline]
+    (regressions, changed) = benchmark.compareResults(edited, baseline)
+    assert regressions == []
+    assert len(changed) == 1
+
+def test_a_changed_output_fails_the_gate(tmp_path):
+    results = str(tmp_path / "results.csv")
+    argv = ["-b", specPath("MSI.spec"), "--sizes=", "-s", "direct", "-r", "1", "-o", results, "--tolerance=1000"]
+    benchmark.main(argv)
+    rows = benchmark.readResults(results)
+
+    benchmark.writeResults(str(tmp_path / "same.csv"), rows)
+    benchmark.main(argv + ["--baseline="+str(tmp_path / "same.csv")])
+
+    benchmark.writeResults(str(tmp_path / "changed.csv"), [r[:4] + (str(int(r[4]) + 1),) + r[5:] for r in rows])
+    with pytest.raises(SystemExit) as e:
+        benchmark.main(argv + ["--baseline="+str(tmp_path / "changed.csv")])
+    assert e.value.code == 1
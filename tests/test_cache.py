@@ -0,0 +1,46 @@
+# On-disk cache of synthesis results: a second run is served from the cache and
+# reproduces the synthesized tables, a changed spec or system model misses
+
+import os
+import pytest
+
+import synthia
+from conftest import specPath
+from test_synthesis import protocolRows, goldenRows
+
+def parsed(path):
+    p = synthia.CoherenceProtocol()
+    synthia.parse(path, p)
+    return p
+
+@pytest.mark.parametrize("spec, configModel", [("MESI", "direct"), ("MOESI", "memory")])
+def test_a_cached_result_reproduces_the_synthesis(monkeypatch, tmp_path, spec, configModel):
+    first = synthia.synthesizeProtocol(specPath(spec+".spec"), configModel, str(tmp_path))
+    key = synthia.getCacheKey(parsed(specPath(spec+".spec")), configModel)
+    assert os.listdir(str(tmp_path)) == [key+".json"]
+
+    # a hit never reaches the analysis or the synthesis
+    def miss(*args, **kwargs):
+        raise AssertionError("cache miss")
+    monkeypatch.setattr(synthia, "analyzeProtocol", miss)
+    monkeypatch.setattr(synthia.CoherenceProtocol, "synthesizeNonStallingProtocol", miss)
+    second = synthia.synthesizeProtocol(specPath(spec+".spec"), configModel, str(tmp_path))
+
+    assert protocolRows(second) == protocolRows(first) == goldenRows(spec, configModel)
+
+def test_the_key_follows_the_spec_and_the_model(tmp_path):
+    with open(specPath("MSI.spec")) as f:
+        lines = f.readlines()
+    original = tmp_path / "original.spec"
+    original.write_text("".join(lines))
+    # same spec with a comment and a blank line added
+    reformatted = tmp_path / "reformatted.spec"
+    reformatted.write_text("# reformatted\n\n"+"".join(lines))
+    # one transition moved to another destination
+    edited = tmp_path / "edited.spec"
+    edited.write_text("".join(lines).replace("(I, OwnReadM) -> S", "(I, OwnReadM) -> M"))
+
+    key = synthia.getCacheKey(parsed(str(original)), "direct")
+    assert synthia.getCacheKey(parsed(str(reformatted)), "direct") == key
+    assert synthia.getCacheKey(parsed(str(edited)), "direct") != key
+    assert synthia.getCacheKey(parsed(str(original)), "memory") != key
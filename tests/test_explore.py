@@ -0,0 +1,87 @@
+# Design-space exploration over candidate specs, exhaustive and by branch and bound
+
+import pytest
+
+import synthia
+import explore
+from conftest import specPath
+
+def linearRows(results):
+    return sorted((r["assignment"], r["transient"], r["states"], r["transitions"], r["memTransitions"]) for r in results if r["verdict"] == explore.LINEAR)
+
+def remaining(space, depth):
+    n = 1
+    for (i, choices) in space.varied[depth:]:
+        n = n * len(choices)
+    return n
+
+def assertPartition(space, results):
+    # the results cover every candidate exactly once
+    assert sum(r["candidates"] for r in results) == space.size()
+    prefixes = set(r["assignment"] for r in results)
+    assert len(prefixes) == len(results)
+    for a in prefixes:
+        assert not any(a[:k] in prefixes for k in range(len(a)))
+    for r in results:
+        assert r["candidates"] == remaining(space, len(r["assignment"]))
+
+def test_the_exhaustive_search_evaluates_every_candidate(tmp_path):
+    space = explore.DesignSpace(specPath("MOESI.spec"), ["OtherRead"])
+    results = explore.explore(space, "direct", 2)
+    assert [r["assignment"] for r in results] == list(space.assignments())
+    assert all(r["verdict"] in (explore.LINEAR, explore.NON_LINEAR) for r in results)
+
+    # linear candidates agree with a synthesis of the candidate spec
+    linear = [r for r in results if r["verdict"] == explore.LINEAR]
+    assert 0 < len(linear) < len(results)
+    for r in linear[:3] + [r for r in results if r["assignment"] == (0,) * len(space.varied)]:
+        path = str(tmp_path / "candidate.spec")
+        space.writeSpec(path, r["assignment"], "candidate")
+        p = synthia.synthesizeProtocol(path, "direct")
+        assert r["verdict"] == (explore.NON_LINEAR if p.isNonLinearLatency() else explore.LINEAR)
+        if (r["verdict"] == explore.LINEAR):
+            assert (r["states"], r["transitions"], r["memTransitions"]) == (len(p.states), len(p.transitions), len(p.memTransitions))
+            assert r["transient"] == len(p.states) - len(p.ipStates)
+
+    ranked = explore.rankCandidates(results)
+    assert len(ranked) == len(linear)
+    assert [r["transient"] for r in ranked] == sorted(r["transient"] for r in linear)
+
+def test_the_candidate_limit_is_checked():
+    space = explore.DesignSpace(specPath("MOESI.spec"), ["OwnReadM", "OtherRead"])
+    with pytest.raises(ValueError):
+        explore.explore(space, "direct", 1, space.size() - 1)
+
+def test_branch_and_bound_matches_the_exhaustive_search():
+    space = explore.DesignSpace(specPath("MOESI.spec"), ["OwnReadM", "OtherRead"])
+    assert space.size() == 82944
+    exhaustive = explore.explore(space, "direct", 1)
+    (results, stats) = explore.branchAndBound(space, "direct", 1)
+    assert len(exhaustive) == space.size()
+    assertPartition(space, results)
+    assert len(linearRows(exhaustive)) == 3072
+    assert linearRows(results) == linearRows(exhaustive)
+    # every non-linear candidate lies below a pruned subtree
+    pruned = set(r["assignment"] for r in results if r["verdict"] == explore.NON_LINEAR)
+    for r in exhaustive:
+        if (r["verdict"] == explore.NON_LINEAR):
+            assert any(r["assignment"][:k] in pruned for k in range(len(r["assignment"]) + 1))
+
+@pytest.mark.parametrize("jobs", [1, 4])
+@pytest.mark.parametrize("spec, configModel, events", [
+    ("MOESI.spec", "memory", ["OwnReadM", "OtherRead"]),
+    ("MESI.spec", "memory", ["OwnReadM", "OtherRead"]),
+    ("MOESI.spec", "direct", ["OtherRead"]),
+])
+def test_branch_and_bound_counts_every_candidate_once(spec, configModel, events, jobs):
+    space = explore.DesignSpace(specPath(spec), events)
+    (results, stats) = explore.branchAndBound(space, configModel, jobs)
+    assertPartition(space, results)
+    assert linearRows(results) == linearRows(explore.branchAndBound(space, configModel, 1)[0])
+
+def test_a_space_pruned_at_the_root_is_one_result():
+    space = explore.DesignSpace(specPath("MOESI.spec"), ["OwnReadM", "OtherRead"])
+    (results, stats) = explore.branchAndBound(space, "memory", 4)
+    assert len(results) == 1
+    assert results[0]["assignment"] == ()
+    assert results[0]["candidates"] == space.size()
@@ -0,0 +1,34 @@
+# Incremental re-synthesis: after a one-line spec edit only the verdicts that read
+# the edited transition are recomputed, and the result equals a fresh synthesis
+
+import re
+import pytest
+
+import synthia
+from conftest import specPath
+from test_synthesis import protocolRows
+
+def reusedVerdicts(output):
+    return [(int(a), int(b)) for (a, b) in re.findall(r"Reused (\d+) of (\d+) latency verdicts", output)]
+
+@pytest.mark.parametrize("spec, configModel, line, edit", [
+    ("MSI", "direct", "(S, OtherRead) -> S", "(S, OtherRead) -> I"),
+    ("MESI", "memory", "(E, OwnWriteM) -> M", "(E, OwnWriteM) -> I"),
+])
+def test_an_edit_reuses_verdicts_and_matches_a_fresh_synthesis(monkeypatch, capsys, tmp_path, spec, configModel, line, edit):
+    monkeypatch.setattr(synthia.CoherenceProtocol, "visualizeProtocol", lambda *args, **kwargs: None)
+    with open(specPath(spec+".spec")) as f:
+        text = f.read()
+    assert line in text
+    path = tmp_path / (spec+".spec")
+    path.write_text(text)
+
+    incremental = synthia.IncrementalSynthesis(str(path), configModel, str(tmp_path))
+    incremental.update()
+    path.write_text(text.replace(line, edit))
+    p = incremental.update()
+
+    (first, total), (reused, edited) = reusedVerdicts(capsys.readouterr().out)
+    assert first == 0
+    assert 0 < reused < edited
+    assert protocolRows(p) == protocolRows(synthia.synthesizeProtocol(str(path), configModel))
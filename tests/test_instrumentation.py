@@ -0,0 +1,53 @@
+# Per-phase instrumentation of the synthesis
+
+import os, json, tracemalloc
+import pytest
+
+import synthia
+from conftest import specPath
+
+synthesisPhases = ["parse", "constructU", "snapshot", "analysis", "atomicOwn", "atomicOther",
+                   "preOrdered", "postOrdered", "replacements", "fixedPoint", "memFSM"]
+
+@pytest.fixture(autouse=True)
+def stopTracing():
+    # the instrumentation leaves tracemalloc running, which slows down every later test
+    yield
+    tracemalloc.stop()
+
+def test_the_report_has_one_entry_per_phase(tmp_path):
+    instrumentation = synthia.Instrumentation()
+    p = synthia.synthesizeProtocol(specPath("MOESI.spec"), "memory", None, instrumentation)
+    instrumentation.writeReport(str(tmp_path / "report.json"))
+    with open(str(tmp_path / "report.json")) as f:
+        report = json.load(f)
+
+    assert (report["spec"], report["model"]) == (specPath("MOESI.spec"), "memory")
+    assert [r["name"] for r in report["phases"]] == synthesisPhases
+    for r in report["phases"]:
+        assert r["seconds"] >= 0 and r["peakBytes"] >= 0
+    last = report["phases"][-1]
+    assert (last["states"], last["transitions"], last["memTransitions"]) == (len(p.states), len(p.transitions), len(p.memTransitions))
+    for c in synthia.counterNames:
+        assert report["total"][c] == sum(r[c] for r in report["phases"])
+    assert report["total"]["transitionsCreated"] >= len(p.transitions)
+
+def test_a_cache_hit_reports_the_load(tmp_path):
+    synthia.synthesizeProtocol(specPath("MSI.spec"), "direct", str(tmp_path / "cache"), synthia.Instrumentation(False))
+    instrumentation = synthia.Instrumentation(False)
+    synthia.synthesizeProtocol(specPath("MSI.spec"), "direct", str(tmp_path / "cache"), instrumentation)
+    assert [r["name"] for r in instrumentation.phases] == ["parse", "cacheLoad"]
+    assert "peakBytes" not in instrumentation.report()["total"]
+
+def test_the_profile_hook_writes_one_file_per_phase(tmp_path):
+    instrumentation = synthia.Instrumentation(False, str(tmp_path))
+    synthia.synthesizeProtocol(specPath("MSI.spec"), "direct", None, instrumentation)
+    assert sorted(os.listdir(str(tmp_path))) == sorted(name+".prof" for name in synthesisPhases)
+
+def test_the_latency_cache_is_counted_per_phase():
+    instrumentation = synthia.Instrumentation(False)
+    p = synthia.synthesizeProtocol(specPath("MESI.spec"), "direct", None, instrumentation)
+    assert instrumentation.count("analysis", "latencyCacheMisses") > 0
+    assert instrumentation.count("atomicOther", "latencyCacheHits") > 0
+    total = instrumentation.report()["total"]
+    assert (total["latencyCacheHits"], total["latencyCacheMisses"]) == p.getLatencyCacheStats()
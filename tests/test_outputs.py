@@ -0,0 +1,49 @@
+# Output stage: csv tables are rewritten on every run and images are the only
+# formats that reach graphviz
+
+import csv, os
+import pytest
+
+import synthia
+
+def readCsv(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+def transitionRows(transitions):
+    return [[t.getSource().getStateString(), t.getTriggerEvent(), t.getAction(), t.getDestination().getStateString()] for t in transitions]
+
+def test_csv_tables_are_overwritten_across_runs(monkeypatch, synthesized, tmp_path):
+    renders = []
+    monkeypatch.setattr(synthia, "submitRender", lambda *args, **kwargs: renders.append(args))
+    p = synthesized("MESI.spec", "direct")
+    for run in range(2):
+        p.visualizeProtocol(str(tmp_path))
+
+    header = ["Source", "Event", "Action", "Destination"]
+    assert readCsv(os.path.join(str(tmp_path), "output-private-cache.csv")) == [header] + transitionRows(p.transitions)
+    assert readCsv(os.path.join(str(tmp_path), "output-shared-memory.csv")) == [header] + transitionRows(p.memTransitions)
+    assert os.path.exists(os.path.join(str(tmp_path), "private-cache-state-machine.viz"))
+    assert renders == []
+
+def test_only_image_formats_are_rendered(monkeypatch, synthesized, tmp_path):
+    def render(*args, **kwargs):
+        raise AssertionError("graphviz called")
+    monkeypatch.setattr(synthia, "renderImage", render)
+    monkeypatch.setattr(synthia.Digraph, "render", render)
+    monkeypatch.setattr(synthia.Source, "pipe", render)
+    p = synthesized("MSI.spec", "memory")
+    p.visualizeProtocol(str(tmp_path), False, ("csv",))
+    p.visualizeProtocol(str(tmp_path), False, ("dot",))
+    assert synthia.waitForRenders() == []
+    assert sorted(os.listdir(str(tmp_path))) == ["output-private-cache.csv", "output-shared-memory.csv",
+                                                 "private-cache-state-machine.viz", "shared-memory-state-machine.viz"]
+
+    renders = []
+    monkeypatch.setattr(synthia, "submitRender", lambda *args, **kwargs: renders.append(args[1:]))
+    p.visualizeProtocol(str(tmp_path), False, ("png",))
+    assert renders == [(os.path.join(str(tmp_path), name+"-state-machine.viz.png"), "png", False) for name in ("private-cache", "shared-memory")]
+
+def test_an_unknown_format_is_rejected(synthesized, tmp_path):
+    with pytest.raises(ValueError):
+        synthesized("MSI.spec", "direct").visualizeProtocol(str(tmp_path), False, ("jpg",))
@@ -0,0 +1,71 @@
+# Spec parser: every error names its file, line and column
+
+import pytest
+
+import synthia
+from conftest import specPath
+
+states = "@ State modeling\nI -> (invalid, passive, clean)\nM -> (write, active, dirty)\n"
+
+def parseText(tmp_path, text, name="test.spec"):
+    path = tmp_path / name
+    path.write_text(text)
+    p = synthia.CoherenceProtocol()
+    synthia.parse(str(path), p)
+    return p
+
+def parseError(tmp_path, text):
+    with pytest.raises(synthia.SpecError) as e:
+        parseText(tmp_path, text)
+    return e.value
+
+def test_shipped_specs_parse():
+    p = synthia.CoherenceProtocol()
+    synthia.parse(specPath("MSI.spec"), p)
+    assert [s.getStateString() for s in p.states] == ["M", "S", "I"]
+    assert len(p.transitions) == 18
+
+def test_comments_and_blank_lines_are_skipped(tmp_path):
+    p = parseText(tmp_path, "# title\n\n"+states+"  # note\n@ Txn specs\n(I, OwnWriteM) -> M\n")
+    assert len(p.states) == 2
+    assert [(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()) for t in p.transitions] == [("I", "OwnWriteM", "M")]
+
+@pytest.mark.parametrize("text, line, column, message", [
+    ("@ States\n", 1, 1, "unknown section"),
+    ("  I -> (invalid, passive, clean)\n", 1, 3, "expected a section marker"),
+    ("@ State modeling\nI -> invalid\n", 2, 1, "expected <state> -> (<AP>, <PCP>, <SMP>)"),
+    ("@ State modeling\nI -> (invalid, pasive, clean)\n", 2, 16, "unknown PCP value pasive"),
+    (states+"M -> (read, passive, clean)\n", 4, 1, "state M is already defined at"),
+    (states+"@ Txn specs\n(I, OwnWriteM) M\n", 5, 1, "expected (<state>, <event>) -> <state>"),
+    (states+"@ Txn specs\n(X, OwnWriteM) -> M\n", 5, 2, "undefined state X"),
+    (states+"@ Txn specs\n(I,  OwnWrite) -> M\n", 5, 6, "unknown event OwnWrite"),
+    (states+"@ Txn specs\n(I, OwnWriteM) -> S\n", 5, 19, "undefined state S"),
+])
+def test_errors_point_at_the_offending_token(tmp_path, text, line, column, message):
+    e = parseError(tmp_path, text)
+    assert (e.line, e.column) == (line, column)
+    assert e.path.endswith("test.spec")
+    assert message in str(e)
+    assert str(e).startswith(e.path+":"+str(line)+":"+str(column)+": ")
+
+def test_errors_in_included_files_name_the_included_file(tmp_path):
+    (tmp_path / "states.spec").write_text(states+"M -> (write, active, dirty)\n")
+    e = parseError(tmp_path, "@ include states.spec\n")
+    assert e.path.endswith("states.spec")
+    assert (e.line, e.column) == (4, 1)
+    assert "already defined at "+str(tmp_path / "states.spec")+":3" in str(e)
+
+def test_includes_share_the_state_definitions(tmp_path):
+    (tmp_path / "states.spec").write_text(states)
+    p = parseText(tmp_path, "@ include states.spec\n@ Txn specs\n(I, OwnWriteM) -> M\n")
+    assert len(p.states) == 2 and len(p.transitions) == 1
+
+def test_missing_and_cyclic_includes_point_at_the_include(tmp_path):
+    e = parseError(tmp_path, "# missing\n@ include missing.spec\n")
+    assert (e.line, e.column) == (2, 11)
+    assert "cannot include" in str(e)
+
+    (tmp_path / "a.spec").write_text("@ include test.spec\n")
+    e = parseError(tmp_path, "@ include a.spec\n")
+    assert e.path.endswith("a.spec")
+    assert "include cycle" in str(e)
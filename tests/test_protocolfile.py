@@ -0,0 +1,75 @@
+# Binary protocol file (.synp)
+
+import pytest
+
+import synthia
+import verifier
+
+def transitionRows(transitions):
+    return [(t.getSource().getStateString(), t.getTriggerEvent(), t.getAction(), t.getDestination().getStateString()) for t in transitions]
+
+def stateRows(states):
+    return [(s.getStateString(), s.isStableState(), s.AP, s.PCP, s.SMP, s.apWeight, s.pcpWeight, s.smpWeight) for s in states]
+
+def writeAndLoad(tmp_path, p, configModel):
+    path = str(tmp_path / "protocol.synp")
+    synthia.writeProtocolFile(path, p, configModel)
+    assert synthia.isProtocolFile(path)
+    return (path, synthia.openProtocol(path, configModel))
+
+@pytest.mark.parametrize("spec", ["MSI.spec", "MESI.spec", "MOESI.spec", "MESIF.spec"])
+@pytest.mark.parametrize("configModel", ["direct", "memory"])
+def test_round_trip(synthesized, tmp_path, spec, configModel):
+    p = synthesized(spec, configModel)
+    (path, loaded) = writeAndLoad(tmp_path, p, configModel)
+    assert loaded.configModel == configModel
+    assert stateRows(loaded.states) == stateRows(p.states)
+    assert [s.getStateString() for s in loaded.preOrderedStates] == [s.getStateString() for s in p.preOrderedStates]
+    assert [s.getStateString() for s in loaded.postOrderedStates] == [s.getStateString() for s in p.postOrderedStates]
+    assert transitionRows(loaded.transitions) == transitionRows(p.transitions)
+    assert transitionRows(loaded.memTransitions) == transitionRows(p.memTransitions)
+    assert transitionRows(loaded.ipTransitions) == transitionRows(p.ipTransitions)
+    assert transitionRows(loaded.nonLinearTransitions) == transitionRows(p.nonLinearTransitions)
+    # one memory state per name, as in the result cache
+    assert set(s.getStateString() for s in loaded.memStates) == set(s.getStateString() for s in p.memStates)
+
+def test_loaded_protocol_verifies_the_same(synthesized, tmp_path):
+    p = synthesized("MOESI.spec", "memory")
+    (path, loaded) = writeAndLoad(tmp_path, p, "memory")
+    fresh = verifier.ModelChecker(p, "memory", 2).run(1)
+    mapped = verifier.ModelChecker(loaded, "memory", 2).run(1)
+    assert (mapped.states, mapped.transitions, mapped.violationCounts) == (fresh.states, fresh.transitions, fresh.violationCounts)
+
+def test_image_reads_the_tables_in_place(synthesized, tmp_path):
+    p = synthesized("MESI.spec", "direct")
+    (path, loaded) = writeAndLoad(tmp_path, p, "direct")
+    with synthia.ProtocolImage(path) as image:
+        assert image.model == "direct"
+        assert image.toolVersion == synthia.getToolVersion()
+        assert len(image.transitions) == len(p.transitions)
+        assert len(image.nonLinear) == len(p.nonLinearTransitions)
+
+def test_model_mismatch_is_rejected(synthesized, tmp_path):
+    (path, loaded) = writeAndLoad(tmp_path, synthesized("MSI.spec", "direct"), "direct")
+    with pytest.raises(synthia.ProtocolFileError):
+        synthia.openProtocol(path, "memory")
+
+def test_missing_model_is_rejected(synthesized, tmp_path):
+    path = tmp_path / "protocol.synp"
+    with pytest.raises(synthia.ProtocolFileError):
+        synthia.writeProtocolFile(str(path), synthesized("MSI.spec", "direct"), None)
+    assert not path.exists()
+
+def test_damaged_files_are_rejected(synthesized, tmp_path):
+    (path, loaded) = writeAndLoad(tmp_path, synthesized("MSI.spec", "direct"), "direct")
+    with open(path, "rb") as f:
+        data = f.read()
+    truncated = tmp_path / "truncated.synp"
+    truncated.write_bytes(data[:len(data) // 2])
+    with pytest.raises(synthia.ProtocolFileError):
+        synthia.loadProtocolFile(str(truncated))
+    empty = tmp_path / "empty.synp"
+    empty.write_bytes(b"")
+    assert not synthia.isProtocolFile(str(empty))
+    with pytest.raises(synthia.ProtocolFileError):
+        synthia.loadProtocolFile(str(empty))
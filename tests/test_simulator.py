@@ -0,0 +1,99 @@
+# TDM snooping-bus simulator
+
+import numpy as np
+import pytest
+
+import simulator
+
+specs = [(spec, configModel) for spec in ("MSI.spec", "MESI.spec", "MOESI.spec") for configModel in ("direct", "memory")]
+
+@pytest.mark.parametrize("spec, configModel", specs)
+def test_every_request_completes(synthesized, spec, configModel):
+    result = simulator.simulateProtocol(synthesized(spec, configModel), configModel, 4, 3000, lines=4)
+    assert result.requests == 3000
+    assert result.unhandled == {}
+    assert result.stuck == None
+    assert result.histogram.sum() == result.requests
+
+def test_runs_are_reproducible_by_seed(synthesized):
+    protocol = synthesized("MOESI.spec", "direct")
+    first = simulator.simulateProtocol(protocol, "direct", 4, 2000, lines=4, seed=7)
+    again = simulator.simulateProtocol(protocol, "direct", 4, 2000, lines=4, seed=7)
+    assert first.cycles == again.cycles
+    assert np.array_equal(first.histogram, again.histogram)
+    assert np.array_equal(first.slotUse, again.slotUse)
+
+def writeTextTrace(path, requests):
+    with open(path, "w") as f:
+        f.write("# core address op\n")
+        for (c, address, op) in requests:
+            f.write(str(c)+" "+hex(address)+" "+op+"\n")
+
+def test_a_converted_trace_replays_each_core_in_order(tmp_path):
+    rng = np.random.default_rng(3)
+    requests = [(int(c), int(a) * 64 + 8, "RW"[int(w)]) for (c, a, w) in zip(rng.integers(0, 3, 500), rng.integers(0, 20, 500), rng.integers(0, 2, 500))]
+    writeTextTrace(str(tmp_path / "trace.txt"), requests)
+    assert simulator.convertTrace(str(tmp_path / "trace.txt"), str(tmp_path / "trace.bin"), batch=64) == (3, 500)
+
+    workload = simulator.TraceWorkload(str(tmp_path / "trace.bin"), batch=37)
+    assert workload.numCores == 3
+    for c in range(3):
+        expected = [(a // 64, simulator.traceOps[op]) for (core, a, op) in requests if core == c]
+        replayed = []
+        while True:
+            request = workload.nextRequest(c)
+            if (request == None):
+                break
+            replayed.append(request)
+        assert replayed == expected
+
+def test_a_skewed_trace_buffers_one_batch_per_core(tmp_path):
+    # core 1 issues almost every request, core 0 one at each end and core 2 one in the middle
+    requests = [(0, 0x40, "R")] + [(1, 64 * (i % 50), "RW"[i % 2]) for i in range(3000)] + [(0, 0x80, "W")]
+    requests.insert(1500, (2, 0xc0, "W"))
+    writeTextTrace(str(tmp_path / "trace.txt"), requests)
+    simulator.convertTrace(str(tmp_path / "trace.txt"), str(tmp_path / "trace.bin"))
+
+    workload = simulator.TraceWorkload(str(tmp_path / "trace.bin"), batch=100)
+    assert workload.nextRequest(0) == (1, simulator.READ)
+    assert workload.nextRequest(0) == (2, simulator.WRITE)
+    assert workload.nextRequest(0) == None
+    assert workload.cursors[0] == len(requests)
+    assert [len(workload.ops[c]) for c in range(3)] == [1, 0, 0]
+
+    replayed = []
+    while True:
+        request = workload.nextRequest(1)
+        assert len(workload.ops[1]) <= 100
+        if (request == None):
+            break
+        replayed.append(request)
+    assert replayed == [(a // 64, simulator.traceOps[op]) for (core, a, op) in requests if core == 1]
+    assert workload.nextRequest(2) == (3, simulator.WRITE)
+    assert workload.nextRequest(2) == None
+
+def test_a_malformed_trace_line_is_reported(tmp_path):
+    (tmp_path / "trace.txt").write_text("0 0x40 R\n1 0x80 X\n")
+    with pytest.raises(ValueError, match="trace.txt:2:"):
+        simulator.convertTrace(str(tmp_path / "trace.txt"), str(tmp_path / "trace.bin"))
+
+def test_a_trace_replays_through_the_bus(synthesized, tmp_path):
+    rng = np.random.default_rng(5)
+    requests = [(int(c), int(a) * 64, "RW"[int(w)]) for (c, a, w) in zip(rng.integers(0, 4, 2000), rng.integers(0, 4, 2000), rng.random(2000) < 0.3)]
+    writeTextTrace(str(tmp_path / "trace.txt"), requests)
+    simulator.convertTrace(str(tmp_path / "trace.txt"), str(tmp_path / "trace.bin"))
+    result = simulator.replayTrace(synthesized("MSI.spec", "direct"), "direct", str(tmp_path / "trace.bin"))
+    assert result.stuck == None
+    assert result.requests == result.histogram.sum() == 2000
+    assert result.coreHistogram.sum(axis=1).tolist() == [sum(1 for r in requests if r[0] == c) for c in range(4)]
+
+@pytest.mark.parametrize("spec, configModel", specs + [("MESIF.spec", "direct"), ("MESIF.spec", "memory")])
+def test_vectorized_and_scalar_simulation_agree(synthesized, spec, configModel):
+    protocol = synthesized(spec, configModel)
+    tables = simulator.CompiledTables(protocol, configModel)
+    functional = simulator.FunctionalSimulator(tables, 4)
+    workload = simulator.RandomWorkload(4, 5000, 16)
+    vectorized = functional.runVectorized(workload)
+    scalar = functional.runScalar(workload)
+    assert vectorized.requests == 5000
+    assert vectorized.sameAs(scalar)
@@ -0,0 +1,28 @@
+# Input protocol snapshot shared with the synthesis
+
+import pytest
+
+import synthia
+from conftest import specPath
+
+def test_the_snapshot_is_read_only(synthesized):
+    p = synthesized("MSI.spec", "direct")
+    with pytest.raises(AttributeError):
+        p.snapshot.transitions = ()
+    with pytest.raises(TypeError):
+        p.snapshot.transitionMap[(0, "OwnReadM")] = None
+    assert isinstance(p.ipStates, tuple) and isinstance(p.ipTransitions, tuple)
+
+@pytest.mark.parametrize("spec", ["MSI.spec", "MOESI.spec"])
+def test_the_snapshot_shares_the_input_objects(synthesized, spec):
+    parsed = synthia.CoherenceProtocol()
+    synthia.parse(specPath(spec), parsed)
+    p = synthesized(spec, "memory")
+    live = set(id(s) for s in p.states)
+    assert all(id(s) in live for s in p.ipStates)
+    assert [s.getStateString() for s in p.ipStates] == [s.getStateString() for s in parsed.states]
+    assert [(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()) for t in p.ipTransitions] == \
+           [(t.getSource().getStateString(), t.getTriggerEvent(), t.getDestination().getStateString()) for t in parsed.transitions]
+    for t in p.ipTransitions:
+        assert p.snapshot.getTransition(t.getSource(), t.getTriggerEvent()) is t
+        assert t.getSource() in p.ipStates and t.getDestination() in p.ipStates
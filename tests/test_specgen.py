@@ -0,0 +1,30 @@
+# Synthetic spec generator
+
+import pytest
+
+import synthia
+import specgen
+
+def test_a_generated_spec_parses_and_synthesizes(tmp_path):
+    path = str(tmp_path / "gen.spec")
+    spec = specgen.generateSpec(path, 6, seed=3)
+    p = synthia.CoherenceProtocol()
+    synthia.parse(path, p)
+    assert [s.getStateString() for s in p.states] == [n for (n, enc) in spec.states]
+    assert len([t for t in p.transitions if t.getSource() != t.getDestination()]) == spec.transitions
+    assert specgen.synthesizes(path, ("direct", "memory"))
+
+def test_the_output_is_deterministic_per_seed(tmp_path):
+    for seed in (1, 2):
+        specgen.GeneratedSpec(8, seed=seed).write(str(tmp_path / ("a"+str(seed)+".spec")))
+        specgen.GeneratedSpec(8, seed=seed).write(str(tmp_path / ("b"+str(seed)+".spec")))
+        assert (tmp_path / ("a"+str(seed)+".spec")).read_text() == (tmp_path / ("b"+str(seed)+".spec")).read_text()
+    assert (tmp_path / "a1.spec").read_text() != (tmp_path / "a2.spec").read_text()
+
+def test_the_transition_count_is_checked():
+    spec = specgen.GeneratedSpec(4)
+    specgen.GeneratedSpec(4, spec.maxTransitions)
+    with pytest.raises(ValueError):
+        specgen.GeneratedSpec(4, spec.maxTransitions + 1)
+    with pytest.raises(ValueError):
+        specgen.GeneratedSpec(1)
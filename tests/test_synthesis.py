@@ -0,0 +1,96 @@
+# Synthesized state machines against the tables the baseline synthia.py produced
+# (tests/golden/<spec>-<model>.tsv: non-linear input transitions, states in order,
+# private-cache and shared-memory transitions in order)
+
+import os
+import pytest
+
+import synthia
+from conftest import repoDir
+
+specs = [(spec, configModel) for spec in ("MSI", "MESI", "MOESI", "MESIF") for configModel in ("direct", "memory")]
+
+def transitionRow(kind, t):
+    return (kind, t.getSource().getStateString(), t.getTriggerEvent(), t.getAction(), t.getDestination().getStateString())
+
+def protocolRows(p):
+    rows = [transitionRow("nonlinear", t) for t in p.nonLinearTransitions]
+    rows += [("state", s.getStateString(), "transient" if s.isTransientState() else "stable") for s in p.states]
+    rows += [transitionRow("cache", t) for t in p.transitions]
+    rows += [transitionRow("mem", t) for t in p.memTransitions]
+    return rows
+
+def goldenRows(spec, configModel):
+    with open(os.path.join(repoDir, "tests", "golden", spec+"-"+configModel+".tsv")) as f:
+        return [tuple(line.rstrip("\n").split("\t")) for line in f]
+
+@pytest.mark.parametrize("spec, configModel", specs)
+def test_synthesis_matches_the_baseline(synthesized, spec, configModel):
+    assert protocolRows(synthesized(spec+".spec", configModel)) == goldenRows(spec, configModel)
+
+def test_transition_indices_follow_add_and_remove():
+    p = synthia.CoherenceProtocol()
+    i = synthia.CoherenceState("I", True)
+    m = synthia.CoherenceState("M", True)
+    first = synthia.Transition(i, "OwnWriteM", m)
+    second = synthia.Transition(i, "OwnWriteM", i)
+    p.addTransition(first)
+    p.addTransition(synthia.Transition(i, "OwnWriteM", m))
+    p.addTransition(second)
+    assert list(p.transitions) == [first, second]
+    assert p.getTransition(i, "OwnWriteM") is first
+
+    p.removeTransition(first)
+    assert list(p.transitions) == [second]
+    assert p.getTransition(i, "OwnWriteM") is second
+    again = synthia.Transition(i, "OwnWriteM", m)
+    p.addTransition(again)
+    assert list(p.transitions) == [second, again]
+    p.removeTransition(second)
+    p.removeTransition(again)
+    assert len(p.transitions) == 0
+    assert p.getTransition(i, "OwnWriteM") == None
+
+def test_transition_list_is_an_ordered_set():
+    i = synthia.CoherenceState("I", True)
+    ts = [synthia.Transition(i, e, i) for e in ("OwnReadM", "OwnWriteM", "OtherRead", "OtherWrite")]
+    l = synthia.TransitionList(ts[:2])
+    assert not isinstance(l, dict)
+    l.append(ts[2])
+    l.append(ts[3])
+    l.append(ts[0])
+    assert list(l) == ts and len(l) == 4
+    l.remove(ts[1])
+    assert ts[1] not in l and ts[2] in l
+    assert l.first() is ts[0]
+    l.remove(ts[0])
+    assert l.first() is ts[2]
+    assert l.copy() == [ts[2], ts[3]]
+    with pytest.raises(KeyError):
+        l.remove(ts[0])
+
+@pytest.mark.parametrize("spec, configModel", [("MOESI", "direct"), ("MESIF", "memory")])
+def test_u_matches_the_state_view_rules(synthesized, spec, configModel):
+    p = synthesized(spec+".spec", configModel)
+    p.constructU()
+    valid = set((sv.si, sv.sj) for sv in p.getU())
+    assert all(s in p.URow for s in p.states)
+    for si in p.UStates:
+        for sj in p.UStates:
+            assert ((si, sj) in valid) == synthia.StateView(si, sj).isValid()
+    stable = [s for s in p.states if not s.isTransientState()]
+    for sj in stable:
+        views = p.getValidStateViews(p.states, sj)
+        sources = [s.getSource() if s.isTransientState() else s for s in p.states]
+        expected = [s for (i, s) in enumerate(sources) if s not in sources[:i] and synthia.StateView(s, sj).isValid()]
+        assert [sv.si for sv in views] == expected
+
+def test_latency_cache_returns_the_computed_verdicts(synthesized):
+    p = synthesized("MOESI.spec", "memory")
+    (hits, misses) = p.getLatencyCacheStats()
+    assert hits > 0 and misses > 0
+    verdicts = [p.asymptoticLatencyAnalysisTransition(t, "memory") for t in p.ipTransitions]
+    assert verdicts == [p.computeAsymptoticLatencyTransition(t, "memory") for t in p.ipTransitions]
+    before = p.getLatencyCacheStats()
+    assert [p.asymptoticLatencyAnalysisTransition(t, "memory") for t in p.ipTransitions] == verdicts
+    assert p.getLatencyCacheStats() == (before[0] + len(verdicts), before[1])
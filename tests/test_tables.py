@@ -0,0 +1,57 @@
+# Dense next-state and action tables
+
+import shutil
+import subprocess
+import numpy as np
+import pytest
+
+import simulator
+import tables
+
+specs = [(spec, configModel) for spec in ("MSI.spec", "MESI.spec", "MOESI.spec", "MESIF.spec") for configModel in ("direct", "memory")]
+
+@pytest.mark.parametrize("spec, configModel", specs)
+def test_every_transition_is_in_the_tables(synthesized, spec, configModel):
+    p = synthesized(spec, configModel)
+    compiled = tables.CompiledProtocol(p, configModel)
+    for (table, transitions) in ((compiled.cache, p.transitions), (compiled.mem, p.memTransitions)):
+        pairs = set()
+        for t in transitions:
+            (event, eventActions) = tables.splitEvent(t.getTriggerEvent())
+            s = table.states.index(t.getSource().getStateString())
+            e = table.events.index(event)
+            pairs.add((s, e))
+            assert table.nextState[s, e] != table.none
+            if (table.ambiguous == 0):
+                assert table.states[table.nextState[s, e]] == t.getDestination().getStateString()
+                assert int(table.actions[s, e]) == compiled.actionSet.mask(eventActions + tables.splitAction(t.getAction()))
+        assert table.handled() == len(pairs)
+        assert table.handled() + table.ambiguous == len(transitions)
+
+@pytest.mark.parametrize("spec, configModel", specs)
+def test_cache_table_matches_the_simulator(synthesized, spec, configModel):
+    p = synthesized(spec, configModel)
+    compiled = tables.CompiledProtocol(p, configModel)
+    reference = simulator.CompiledTables(p, configModel)
+    names = [reference.stateName(i) for i in range(len(reference.model.cacheStates))]
+    assert compiled.cache.states == names
+    for (j, event) in enumerate(simulator.eventNames):
+        column = compiled.cache.nextState[:, compiled.cache.events.index(event)].astype(np.int64)
+        assert np.array_equal(np.where(column == compiled.cache.none, -1, column), reference.nextState[:, j])
+
+def test_written_tables(synthesized, tmp_path):
+    p = synthesized("MOESI.spec", "direct")
+    prefix = str(tmp_path / "moesi")
+    compiled = tables.compileTables(p, "direct", prefix, source="MOESI.spec")
+    with np.load(prefix+".npz") as arrays:
+        assert list(arrays["actions"]) == compiled.actionSet.names
+        for table in compiled.tables():
+            assert np.array_equal(arrays[table.name+"NextState"], table.nextState)
+            assert np.array_equal(arrays[table.name+"Actions"], table.actions)
+    assert "package synthia_moesi_pkg;" in (tmp_path / "moesi.sv").read_text()
+
+    gcc = shutil.which("gcc")
+    if (gcc == None):
+        pytest.skip("no C compiler")
+    (tmp_path / "main.c").write_text('#include "moesi.h"\nint main(void) { return 0; }\n')
+    subprocess.run([gcc, "-std=c99", "-Wall", "-Werror", "-o", str(tmp_path / "main"), str(tmp_path / "main.c")], cwd=str(tmp_path), check=True)
@@ -0,0 +1,57 @@
+# Explicit-state model checker
+
+import pytest
+
+import verifier
+
+def check(protocol, configModel, numCores, workers=1, **options):
+    checker = verifier.ModelChecker(protocol, configModel, numCores, **options)
+    return (checker, checker.run(workers))
+
+@pytest.mark.parametrize("configModel, states", [("direct", 264), ("memory", 172)])
+def test_msi_is_correct(synthesized, configModel, states):
+    (checker, result) = check(synthesized("MSI.spec", configModel), configModel, 2, symmetry=False)
+    assert result.complete
+    assert result.isCorrect()
+    assert result.states == states
+
+def test_violations_come_with_a_trace_from_the_initial_state(synthesized):
+    (checker, result) = check(synthesized("MESI.spec", "direct"), "direct", 2, symmetry=False)
+    assert not result.isCorrect()
+    assert sum(result.violationCounts.values()) >= len(result.violations) > 0
+    for v in result.violations:
+        assert v.kind in result.violationCounts
+        assert v.trace[0] == ("initial", checker.initialState())
+        assert v.trace[-1][1] == checker.decode(v.state)
+        assert "?" not in [label for (label, g) in v.trace]
+
+def test_max_states_bounds_the_search(synthesized):
+    (checker, result) = check(synthesized("MOESI.spec", "memory"), "memory", 3, symmetry=False, maxStates=100)
+    assert not result.complete
+    assert not result.isCorrect()
+
+@pytest.mark.parametrize("spec, configModel, full, reduced", [("MSI", "memory", 1920, 372), ("MESI", "direct", 54059, 9569)])
+def test_symmetry_reduction_keeps_the_verdict(synthesized, spec, configModel, full, reduced):
+    (checker, exact) = check(synthesized(spec+".spec", configModel), configModel, 3, symmetry=False)
+    (checker, result) = check(synthesized(spec+".spec", configModel), configModel, 3)
+    assert (exact.states, result.states) == (full, reduced)
+    assert sorted(result.violationCounts) == sorted(exact.violationCounts)
+    assert result.isCorrect() == exact.isCorrect()
+
+@pytest.mark.parametrize("spec, configModel, symmetry", [("MSI", "direct", True), ("MOESI", "memory", False)])
+def test_parallel_workers_match_the_serial_search(synthesized, spec, configModel, symmetry):
+    (checker, serial) = check(synthesized(spec+".spec", configModel), configModel, 3, symmetry=symmetry)
+    (checker, parallel) = check(synthesized(spec+".spec", configModel), configModel, 3, 2, symmetry=symmetry)
+    assert parallel.complete
+    assert (parallel.states, parallel.transitions, parallel.violationCounts) == (serial.states, serial.transitions, serial.violationCounts)
+    for v in parallel.violations:
+        assert v.trace[0] == ("initial", checker.initialState())
+        assert v.trace[-1][1] == checker.decode(v.state)
+
+@pytest.mark.parametrize("options", [{"visitedSet": "bitstate"}, {"visitedSet": "disk"}], ids=["bitstate", "disk"])
+def test_visited_sets_agree(synthesized, tmp_path, options):
+    (checker, exact) = check(synthesized("MOESI.spec", "memory"), "memory", 3)
+    (checker, other) = check(synthesized("MOESI.spec", "memory"), "memory", 3, spillDir=str(tmp_path), **options)
+    assert exact.states == 9954
+    assert (other.states, other.transitions, other.violationCounts) == (exact.states, exact.transitions, exact.violationCounts)
+    assert other.visitedReport != None
@@ -0,0 +1,41 @@
+# Analytic worst-case latency bounds against the cycle-level simulator
+
+import pytest
+
+import simulator
+import wcl
+from verifier import READ, WRITE, REPLACEMENT
+
+specs = [(spec, configModel) for spec in ("MSI.spec", "MESI.spec", "MOESI.spec", "MESIF.spec") for configModel in ("direct", "memory")]
+
+def kindBound(model, bounds, kind, j, k):
+    return max([int(bounds[i, j, k]) for (i, r) in enumerate(model.requests) if r.kind == kind] or [0])
+
+@pytest.mark.parametrize("spec, configModel", specs)
+def test_simulated_latencies_stay_within_the_bounds(synthesized, spec, configModel):
+    protocol = synthesized(spec, configModel)
+    slotWidths = (10, 50)
+    (model, bounds) = wcl.latencyBounds(protocol, configModel, 16, slotWidths)
+    for numCores in (2, 4, 8, 16):
+        for (k, slotWidth) in enumerate(slotWidths):
+            for seed in (1, 2, 3):
+                result = simulator.simulateProtocol(protocol, configModel, numCores, 3000, slotWidth=slotWidth, seed=seed)
+                for kind in (READ, WRITE, REPLACEMENT):
+                    assert result.kindMax[kind] <= kindBound(model, bounds, kind, numCores - 1, k)
+
+def test_bounds_grow_with_cores_and_slots(synthesized):
+    model = wcl.LatencyModel(synthesized("MOESI.spec", "direct"), "direct")
+    bounds = model.sweep([1, 2, 4, 8], [10, 50])
+    for (i, r) in enumerate(model.requests):
+        if (r.hit):
+            assert not bounds[i].any()
+        else:
+            assert (bounds[i, 1:] >= bounds[i, :-1]).all()
+            assert (bounds[i, :, 1] == 5 * bounds[i, :, 0]).all()
+
+def test_the_table_has_one_row_per_request_core_and_slot(synthesized, tmp_path):
+    (model, bounds) = wcl.latencyBounds(synthesized("MSI.spec", "memory"), "memory", 4, (10, 50), str(tmp_path / "wcl.csv"))
+    with open(str(tmp_path / "wcl.csv")) as f:
+        rows = f.read().splitlines()
+    assert bounds.shape == (len(model.requests), 4, 2)
+    assert len(rows) == 1 + bounds.size
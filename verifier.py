@@ -0,0 +1,986 @@
+# Step 4: Verify protocol (model checker)
+
+# Explicit-state verification of N private caches running the synthesized
+# private-cache FSM together with the shared-memory FSM over an atomic ordered bus.
+# Global states are tuples of packed per-core words plus one memory word.
+
+import sys, getopt, time, os, mmap, tempfile, hashlib
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from collections import deque
+
+import synthia
+
+# pending requests of a core
+NONE = 0
+READ = 1
+WRITE = 2
+REPLACEMENT = 3
+RESPONSE = 4   # bus action triggered by another core's request (send data, write back)
+KINDS = 5
+
+# data slot of a core: value received for its outstanding request
+NO_DATA = 0
+DATA_STALE = 1
+DATA_FRESH = 2
+WAIT_MEM = 3
+WAIT_CORE = 4  # + index of the core that will supply the data
+
+# action flags
+SEND_DATA = 1
+WRITE_BACK = 2
+
+ORDERED = "Ordered"
+DATA = "Data"
+
+busMessages = {READ: "GetS", WRITE: "GetM", REPLACEMENT: "PutM"}
+observedEvents = {READ: "OtherRead", WRITE: "OtherWrite"}
+
+def actionFlags(t):
+    label = (str(t.getTriggerEvent())+" "+str(t.getAction())).lower()
+    flags = 0
+    if ("send data" in label):
+        flags = flags | SEND_DATA
+    if ("write-back" in label):
+        flags = flags | WRITE_BACK
+    return flags
+
+def normalizeEvent(e):
+    if (e.startswith(ORDERED)):
+        return ORDERED
+    return e
+
+class SystemModel:
+    # compiled private-cache and shared-memory tables of a synthesized protocol
+    def __init__(self, protocol, configModel):
+        self.configModel = configModel
+
+        self.cacheStates = []
+        self.cacheIndex = {}
+        for s in protocol.states:
+            self.addCacheState(s)
+        for t in protocol.transitions:
+            self.addCacheState(t.getSource())
+            self.addCacheState(t.getDestination())
+
+        self.memStates = []
+        self.memIndex = {}
+        for s in protocol.memStates:
+            self.addMemState(s)
+        for t in protocol.memTransitions:
+            self.addMemState(t.getSource())
+            self.addMemState(t.getDestination())
+
+        n = len(self.cacheStates)
+        self.stable = [s.isStableState() for s in self.cacheStates]
+        self.ap = [weightOrZero(s.apWeight) for s in self.cacheStates]
+        self.pcp = [weightOrZero(s.pcpWeight) for s in self.cacheStates]
+        self.readable = [self.stable[i] and self.ap[i] > 0 for i in range(n)]
+        self.writable = [self.stable[i] and self.cacheStates[i].AP == "write" for i in range(n)]
+        self.owner = [self.pcp[i] > 0 and self.ap[i] > 0 for i in range(n)]
+
+        # (state, event) -> [(destination, flags)]
+        self.cacheNext = {}
+        for t in protocol.transitions:
+            key = (self.cacheIndex[t.getSource().getStateString()], normalizeEvent(t.getTriggerEvent()))
+            self.cacheNext.setdefault(key, []).append((self.cacheIndex[t.getDestination().getStateString()], actionFlags(t)))
+
+        self.memStable = [s.isStableState() for s in self.memStates]
+        self.memNext = {}
+        self.memStalls = set()
+        self.memInternal = {}
+        for t in protocol.memTransitions:
+            src = self.memIndex[t.getSource().getStateString()]
+            dst = self.memIndex[t.getDestination().getStateString()]
+            e = str(t.getTriggerEvent())
+            if (e.endswith("/Stall") or str(t.getAction()) == "Stall"):
+                self.memStalls.add((src, e.split("/")[0]))
+            elif (e in ("GetS", "GetM", "PutM")):
+                self.memNext.setdefault((src, e), []).append(dst)
+            else:
+                self.memInternal.setdefault((src, e.startswith(ORDERED)), []).append(dst)
+
+        # stable state a transient state is heading for
+        self.intended = []
+        for s in self.cacheStates:
+            d = None
+            if (not s.isStableState() and s.getIntendedDestination() != None):
+                d = self.cacheIndex.get(s.getIntendedDestination().getStateString())
+            self.intended.append(d)
+
+        # pre-ordered states re-resolve the M/P variant of their request when it is ordered
+        self.retarget = {}
+        for i in range(n):
+            s = self.cacheStates[i]
+            if (self.stable[i] or (i, ORDERED) not in self.cacheNext or s.getSource() == None):
+                continue
+            source = self.cacheIndex.get(s.getSource().getStateString())
+            for (kind, e) in ((READ, "OwnRead"), (WRITE, "OwnWrite")):
+                for v in ("M", "P"):
+                    for (dest, flags) in self.cacheNext.get((source, e+v), []):
+                        if (not self.stable[dest] and (dest, ORDERED) in self.cacheNext):
+                            self.retarget[(i, kind, v)] = dest
+
+        self.invalidState = None
+        for i in range(n):
+            if (self.stable[i] and self.ap[i] == 0):
+                self.invalidState = i
+                break
+
+    def addCacheState(self, s):
+        if (s.getStateString() not in self.cacheIndex):
+            self.cacheIndex[s.getStateString()] = len(self.cacheStates)
+            self.cacheStates.append(s)
+
+    def addMemState(self, s):
+        if (s.getStateString() not in self.memIndex):
+            self.memIndex[s.getStateString()] = len(self.memStates)
+            self.memStates.append(s)
+
+def weightOrZero(w):
+    if (w == None):
+        return 0
+    return w
+
+class Violation:
+    def __init__(self, kind, message, state):
+        self.kind = kind
+        self.message = message
+        self.state = state
+        self.trace = []
+
+class VerificationResult:
+    def __init__(self, numCores):
+        self.numCores = numCores
+        self.states = 0
+        self.transitions = 0
+        self.complete = True
+        self.seconds = 0.0
+        self.violations = []
+        self.violationCounts = {}
+        self.workerStats = []
+        self.visitedReport = None
+
+    def isCorrect(self):
+        return self.complete and len(self.violations) == 0
+
+# visited sets of the serial search: add(key, parent) tells whether the key is new,
+# parentOf(key) gives the key it was first reached from (None for the initial state)
+class ExactVisitedSet:
+    keepsParents = True
+
+    def __init__(self):
+        self.parent = {}
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, key, parent):
+        if (key in self.parent):
+            return False
+        self.parent[key] = parent
+        return True
+
+    def parentOf(self, key):
+        return self.parent.get(key)
+
+    def report(self):
+        return None
+
+    def close(self):
+        pass
+
+# bitstate hashing: k bits per state in a fixed-size bit array. A state whose bits
+# are all set already is taken as visited, so a hash collision silently prunes it
+class BitstateVisitedSet:
+    keepsParents = False
+
+    def __init__(self, keyBytes, megabytes, hashes=3):
+        self.keyBytes = keyBytes
+        self.bits = max(8, int(megabytes * 8 * 1024 * 1024))
+        self.table = bytearray((self.bits + 7) // 8)
+        self.hashes = hashes
+        self.count = 0
+        self.setBits = 0
+        self.expectedMissed = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.to_bytes(self.keyBytes, "little"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def falsePositive(self):
+        return (self.setBits / self.bits) ** self.hashes
+
+    def add(self, key, parent):
+        positions = self.positions(key)
+        if (all(self.table[p >> 3] & (1 << (p & 7)) for p in positions)):
+            return False
+        # a new state got through, at this fill a new state is lost with probability falsePositive()
+        fp = self.falsePositive()
+        self.expectedMissed = self.expectedMissed + fp / (1 - fp)
+        for p in positions:
+            if (not self.table[p >> 3] & (1 << (p & 7))):
+                self.table[p >> 3] = self.table[p >> 3] | (1 << (p & 7))
+                self.setBits = self.setBits + 1
+        self.count = self.count + 1
+        return True
+
+    def parentOf(self, key):
+        return None
+
+    def report(self):
+        coverage = self.count / (self.count + self.expectedMissed)
+        return ("Visited set: bitstate, "+str(self.bits // (8 * 1024))+" KB, "+str(self.hashes)+" hashes, "+str(round(100.0 * self.setBits / self.bits, 2))+"% of bits set; "
+                "estimated coverage "+str(round(100.0 * coverage, 4))+"%, false-positive probability "+"{:.3g}".format(self.falsePositive()))
+
+    def close(self):
+        pass
+
+# exact set as an open-addressing table of fixed-width (key + 1, parent + 1) slots in a
+# memory-mapped temporary file, so the operating system pages it out instead of running out of RAM
+class DiskVisitedSet:
+    keepsParents = True
+
+    def __init__(self, keyBytes, directory=None, slots=1 << 16):
+        self.width = keyBytes + 1
+        self.directory = directory
+        self.count = 0
+        self.open(slots)
+
+    def open(self, slots):
+        self.slots = slots
+        (fd, self.path) = tempfile.mkstemp(prefix="visited-", suffix=".tbl", dir=self.directory)
+        os.ftruncate(fd, slots * 2 * self.width)
+        self.map = mmap.mmap(fd, slots * 2 * self.width)
+        os.close(fd)
+
+    def __len__(self):
+        return self.count
+
+    # slot of key, or of the empty slot it would go in
+    def find(self, key):
+        stored = (key + 1).to_bytes(self.width, "little")
+        empty = bytes(self.width)
+        digest = hashlib.blake2b(stored, digest_size=8).digest()
+        i = int.from_bytes(digest, "little") % self.slots
+        while (True):
+            base = 2 * self.width * i
+            slot = self.map[base:base + self.width]
+            if (slot == stored or slot == empty):
+                return (base, slot == stored)
+            i = (i + 1) % self.slots
+
+    def store(self, base, key, parent):
+        self.map[base:base + self.width] = (key + 1).to_bytes(self.width, "little")
+        parent = 0 if parent == None else parent + 1
+        self.map[base + self.width:base + 2 * self.width] = parent.to_bytes(self.width, "little")
+
+    def add(self, key, parent):
+        (base, found) = self.find(key)
+        if (found):
+            return False
+        self.store(base, key, parent)
+        self.count = self.count + 1
+        if (self.count * 10 > self.slots * 7):
+            self.grow()
+        return True
+
+    def grow(self):
+        (oldMap, oldPath, oldSlots) = (self.map, self.path, self.slots)
+        self.open(2 * oldSlots)
+        for i in range(oldSlots):
+            base = 2 * self.width * i
+            key = int.from_bytes(oldMap[base:base + self.width], "little")
+            if (key != 0):
+                parent = int.from_bytes(oldMap[base + self.width:base + 2 * self.width], "little")
+                self.store(self.find(key - 1)[0], key - 1, None if parent == 0 else parent - 1)
+        oldMap.close()
+        os.unlink(oldPath)
+
+    def parentOf(self, key):
+        (base, found) = self.find(key)
+        if (not found):
+            return None
+        parent = int.from_bytes(self.map[base + self.width:base + 2 * self.width], "little")
+        return None if parent == 0 else parent - 1
+
+    def report(self):
+        return ("Visited set: exact, memory-mapped file of "+str(self.slots * 2 * self.width // 1024)+" KB ("+str(self.count)+"/"+str(self.slots)+" slots used); "
+                "coverage 100%, false-positive probability 0")
+
+    def close(self):
+        self.map.close()
+        os.unlink(self.path)
+
+class ModelChecker:
+    def __init__(self, protocol, configModel, numCores, maxStates=None, maxViolations=10, symmetry=True, visitedSet="exact", bitstateMB=16, hashes=3, spillDir=None):
+        self.model = SystemModel(protocol, configModel)
+        self.numCores = numCores
+        self.maxStates = maxStates
+        self.maxViolations = maxViolations
+        self.symmetry = symmetry
+        self.visitedSet = visitedSet
+        self.bitstateMB = bitstateMB
+        self.hashes = hashes
+        self.spillDir = spillDir
+        self.dataSlots = WAIT_CORE + numCores
+        self.coreBits = (len(self.model.cacheStates) * KINDS * self.dataSlots * 2).bit_length()
+        self.coreMask = (1 << self.coreBits) - 1
+        sharedBits = (len(self.model.memStates) * 2 * (numCores + 1)).bit_length()
+        self.keyBytes = (numCores * self.coreBits + sharedBits + 7) // 8
+
+    # packing of a core (state, pending, data, fresh) into one word, and of the
+    # shared part (memory state, memory fresh, owner index or -1) into another
+    def packCore(self, state, pending, data, fresh):
+        return ((state * KINDS + pending) * self.dataSlots + data) * 2 + fresh
+
+    def unpackCore(self, word):
+        fresh = word & 1
+        word = word >> 1
+        data = word % self.dataSlots
+        word = word // self.dataSlots
+        return [word // KINDS, word % KINDS, data, fresh]
+
+    def packShared(self, mem, memFresh, owner):
+        return (mem * 2 + memFresh) * (self.numCores + 1) + owner + 1
+
+    def unpackShared(self, word):
+        owner = word % (self.numCores + 1) - 1
+        word = word // (self.numCores + 1)
+        return [word >> 1, word & 1, owner]
+
+    def pack(self, cores, shared):
+        return tuple(self.packCore(*c) for c in cores) + (self.packShared(*shared),)
+
+    def unpack(self, g):
+        return ([self.unpackCore(w) for w in g[:-1]], self.unpackShared(g[-1]))
+
+    def initialState(self):
+        if (self.model.invalidState == None):
+            raise ValueError("protocol has no invalid stable state")
+        cores = [[self.model.invalidState, NONE, NO_DATA, 0] for c in range(self.numCores)]
+        return self.pack(cores, [0, 1, -1])
+
+    def describe(self, g):
+        cores, (mem, memFresh, owner) = self.unpack(g)
+        parts = []
+        for (s, pending, data, fresh) in cores:
+            parts.append(self.model.cacheStates[s].getStateString()+("*" if fresh else ""))
+        return "["+", ".join(parts)+"] mem="+self.model.memStates[mem].getStateString()+("*" if memFresh else "")
+
+    # P variants of own requests are used when another cache owns the block
+    def variant(self, owner, c):
+        if (owner >= 0 and owner != c):
+            return "P"
+        return "M"
+
+    # like the latency analysis, a request ordered without an owner takes the variant
+    # whose destination is compatible with the copies the other caches keep
+    def resolve(self, cores, owner, c, s, kind):
+        m = self.model
+        v = self.variant(owner, c)
+        candidates = [v] if v == "P" else ["M", "P"]
+        others = []
+        for j in range(self.numCores):
+            if (j != c):
+                options = m.cacheNext.get((cores[j][0], observedEvents[kind]))
+                others.append(options[0][0] if options else cores[j][0])
+        fallback = s
+        for v in candidates:
+            target = m.retarget.get((s, kind, v))
+            if (target == None):
+                continue
+            if (fallback == s):
+                fallback = target
+            if (m.intended[target] == None or self.compatible(m.intended[target], others)):
+                return target
+        return fallback
+
+    def compatible(self, d, others):
+        m = self.model
+        owners = 1 if m.owner[d] else 0
+        for o in others:
+            if (m.ap[d] + m.ap[o] > 2):
+                return False
+            if (m.owner[o]):
+                owners = owners + 1
+        return owners <= 1
+
+    def deliver(self, cores, supplier, value):
+        # data sent by supplier reaches the caches waiting on it
+        for c in cores:
+            if (c[2] == WAIT_CORE + supplier):
+                c[2] = DATA_FRESH if value else DATA_STALE
+
+    def settle(self, cores, c, dest):
+        # bookkeeping after core c moved to dest
+        m = self.model
+        core = cores[c]
+        core[0] = dest
+        if (m.stable[dest]):
+            core[1] = NONE
+            if (m.ap[dest] == 0):
+                core[3] = 0
+        elif (core[1] == NONE and (dest, ORDERED) in m.cacheNext):
+            core[1] = RESPONSE
+
+    def invalidateOthers(self, cores, c):
+        for j in range(self.numCores):
+            if (j != c):
+                cores[j][3] = 0
+
+    def successors(self, g, stalls):
+        m = self.model
+        cores, shared = self.unpack(g)
+        (mem, memFresh, owner) = shared
+        result = []
+
+        for c in range(self.numCores):
+            s, pending, data, fresh = cores[c]
+
+            # own requests and replacements from stable states
+            if (m.stable[s] and pending == NONE):
+                v = self.variant(owner, c)
+                for (kind, e) in ((READ, "OwnRead"+v), (WRITE, "OwnWrite"+v), (REPLACEMENT, "Replacement")):
+                    for (dest, flags) in m.cacheNext.get((s, e), []):
+                        nc = [list(x) for x in cores]
+                        ns = list(shared)
+                        if (m.stable[dest]):
+                            if (kind == WRITE and m.writable[dest]):
+                                self.invalidateOthers(nc, c)
+                                ns[1] = 0
+                            if (owner == c and not m.owner[dest]):
+                                ns[2] = -1
+                            self.settle(nc, c, dest)
+                        else:
+                            nc[c][0] = dest
+                            nc[c][1] = kind
+                        result.append(("core "+str(c)+" "+e, self.pack(nc, ns)))
+
+            # bus ordering of an outstanding request or response
+            if (pending != NONE and (s, ORDERED) in m.cacheNext):
+                if (pending in (READ, WRITE)):
+                    s = self.resolve(cores, owner, c, s, pending)
+                msg = busMessages.get(pending)
+                if (pending == REPLACEMENT and owner != c):
+                    # the memory drops a write-back from a cache that lost ownership before it was ordered
+                    msg = None
+                if (msg != None and (mem, msg) in m.memStalls):
+                    continue
+                for (dest, flags) in m.cacheNext[(s, ORDERED)]:
+                    result.extend(self.order(cores, shared, c, dest, flags, msg, stalls))
+
+            # data arrival
+            if (data in (DATA_STALE, DATA_FRESH)):
+                for (dest, flags) in m.cacheNext.get((s, DATA), []):
+                    nc = [list(x) for x in cores]
+                    ns = list(shared)
+                    value = 1 if data == DATA_FRESH else 0
+                    nc[c][3] = value
+                    # the write is performed on the received block
+                    if (pending == WRITE and value):
+                        self.invalidateOthers(nc, c)
+                        ns[1] = 0
+                    nc[c][2] = NO_DATA
+                    nc[c][1] = NONE
+                    self.settle(nc, c, dest)
+                    # a post-ordered chain that ends in a stable state hands the block on to the caches waiting on it
+                    if (m.stable[dest]):
+                        self.deliver(nc, c, value)
+                    result.append(("core "+str(c)+" Data", self.pack(nc, ns)))
+
+        return result
+
+    def order(self, cores, shared, c, dest, flags, msg, stalls):
+        m = self.model
+        (mem, memFresh, owner) = shared
+        nc = [list(x) for x in cores]
+        pending = nc[c][1]
+        # data reaching the memory in this slot: (value, written back)
+        transfer = None
+
+        value = nc[c][3]
+        selfSupplied = pending == WRITE and owner == c
+        if (flags & (SEND_DATA | WRITE_BACK)):
+            self.deliver(nc, c, value)
+        if ((flags & WRITE_BACK) or (pending == REPLACEMENT and msg != None)):
+            transfer = (value, True)
+        elif (flags & SEND_DATA):
+            transfer = (value, False)
+        if (m.stable[dest]):
+            self.settle(nc, c, dest)
+        else:
+            nc[c][0] = dest
+            if (pending == RESPONSE and (dest, ORDERED) not in m.cacheNext):
+                nc[c][1] = NONE
+
+        # the owner after this slot
+        newOwner = owner
+        if (pending == WRITE or (pending == READ and m.owner[m.intended[dest] if m.intended[dest] != None else dest])):
+            newOwner = c
+        elif (pending == REPLACEMENT and owner == c):
+            newOwner = -1
+
+        # every other cache observes the request in the same bus slot
+        supplier = None
+        waitOn = None
+        observed = observedEvents.get(pending)
+        if (observed != None):
+            for j in range(self.numCores):
+                if (j == c):
+                    continue
+                sj = nc[j][0]
+                options = m.cacheNext.get((sj, observed))
+                if (not options):
+                    stalls.append((j, m.cacheStates[sj].getStateString(), observed))
+                    continue
+                (dj, fj) = options[0]
+                value = nc[j][3]
+                owes = j == owner and not (fj & SEND_DATA) and not m.stable[dj]
+                if (nc[j][1] == REPLACEMENT and (dj != sj or owes)):
+                    # the replacement now completes as a response to this request
+                    nc[j][1] = RESPONSE
+                self.settle(nc, j, dj)
+                if (fj & SEND_DATA and (supplier == None or j == owner)):
+                    supplier = value
+                if (fj & SEND_DATA):
+                    self.deliver(nc, j, value)
+                if (fj & WRITE_BACK):
+                    transfer = (value, True)
+                elif ((fj & SEND_DATA) and msg != "GetM"):
+                    transfer = (value, False)
+                if (owes):
+                    waitOn = j
+                if (j == owner and newOwner == owner):
+                    kept = m.intended[dj] if m.intended[dj] != None else dj
+                    if (not m.owner[kept]):
+                        newOwner = -1
+
+        # the shared memory sees the request, and takes the data moved in this slot
+        memOptions = [mem]
+        if (msg != None):
+            memOptions = m.memNext.get((mem, msg), [mem])
+
+        result = []
+        for newMem in memOptions:
+            targets = [(newMem, memFresh)]
+            if (transfer != None and transfer[1]):
+                targets = [(newMem, transfer[0])]
+            if (transfer != None and not m.memStable[newMem]):
+                (value, writtenBack) = transfer
+                dests = m.memInternal.get((newMem, False), [])
+                if (writtenBack):
+                    dests = m.memInternal.get((newMem, True), []) + dests
+                if (len(dests) > 0):
+                    targets = [(d, value) for d in dests]
+            for (memState, nm) in targets:
+                mc = [list(x) for x in nc]
+                if (m.memStable[memState]):
+                    for x in mc:
+                        if (x[2] == WAIT_MEM):
+                            x[2] = DATA_FRESH if nm else DATA_STALE
+                if (pending in (READ, WRITE) and not m.stable[mc[c][0]]):
+                    if (selfSupplied):
+                        mc[c][2] = DATA_FRESH if mc[c][3] else DATA_STALE
+                    elif (supplier != None):
+                        mc[c][2] = DATA_FRESH if supplier else DATA_STALE
+                    elif (waitOn != None):
+                        mc[c][2] = WAIT_CORE + waitOn
+                    elif (m.memStable[memState]):
+                        mc[c][2] = DATA_FRESH if nm else DATA_STALE
+                    else:
+                        mc[c][2] = WAIT_MEM
+                result.append(("core "+str(c)+" Ordered", self.pack(mc, [memState, nm, newOwner])))
+        return result
+
+    def check(self, g):
+        # SWMR and data-value invariants over the caches in stable states
+        m = self.model
+        cores, shared = self.unpack(g)
+        violations = []
+        weights = sorted((m.ap[c[0]] for c in cores if m.stable[c[0]]), reverse=True)
+        if (len(weights) > 1 and weights[0] + weights[1] > 2):
+            violations.append(("SWMR", "conflicting access permissions"))
+        if (len([c for c in cores if m.stable[c[0]] and m.owner[c[0]]]) > 1):
+            violations.append(("SWMR", "more than one owner"))
+        for i in range(len(cores)):
+            if (m.readable[cores[i][0]] and cores[i][3] == 0):
+                violations.append(("data-value", "core "+str(i)+" can read a stale value"))
+                break
+        return violations
+
+    def isQuiescent(self, g):
+        m = self.model
+        cores, (mem, memFresh, owner) = self.unpack(g)
+        return all(m.stable[c[0]] and c[1] == NONE for c in cores) and m.memStable[mem]
+
+    # visited states are keyed by one integer: the core words side by side, then the shared word
+    def encode(self, g):
+        key = g[-1]
+        for w in reversed(g[:-1]):
+            key = (key << self.coreBits) | w
+        return key
+
+    def decode(self, key):
+        words = []
+        for c in range(self.numCores):
+            words.append(key & self.coreMask)
+            key = key >> self.coreBits
+        return tuple(words) + (key,)
+
+    # all caches run the same FSM, so global states that permute the caches are
+    # equivalent: sort the caches and renumber the core indices held in data slots
+    # and in the owner index
+    def canonical(self, g):
+        if (not self.symmetry):
+            return self.encode(g)
+        cores, shared = self.unpack(g)
+        waiters = [0] * self.numCores
+        for c in cores:
+            if (c[2] >= WAIT_CORE):
+                waiters[c[2] - WAIT_CORE] = waiters[c[2] - WAIT_CORE] + 1
+        order = sorted(range(self.numCores), key=lambda i: (cores[i][0], cores[i][1], min(cores[i][2], WAIT_CORE), cores[i][3], i == shared[2], waiters[i]))
+        rank = [0] * self.numCores
+        for (newIndex, i) in enumerate(order):
+            rank[i] = newIndex
+        permuted = []
+        for i in order:
+            (s, pending, data, fresh) = cores[i]
+            if (data >= WAIT_CORE):
+                data = WAIT_CORE + rank[data - WAIT_CORE]
+            permuted.append((s, pending, data, fresh))
+        if (shared[2] >= 0):
+            shared = [shared[0], shared[1], rank[shared[2]]]
+        return self.encode(self.pack(permuted, shared))
+
+    def expand(self, key, result):
+        # checks one state and returns the canonical keys of its successors
+        g = self.decode(key)
+        result.states = result.states + 1
+
+        for (kind, message) in self.check(g):
+            self.addViolation(result, kind, message, key)
+
+        stalls = []
+        succ = self.successors(g, stalls)
+        for (j, stateName, e) in stalls:
+            self.addViolation(result, "stall", "core "+str(j)+" in "+stateName+" cannot handle "+e, key)
+        if (len(succ) == 0 and not self.isQuiescent(g)):
+            self.addViolation(result, "deadlock", "no enabled transition", key)
+
+        result.transitions = result.transitions + len(succ)
+        return [self.canonical(h) for (label, h) in succ]
+
+    def run(self, workers=1):
+        if (workers > 1):
+            return self.runParallel(workers)
+
+        result = VerificationResult(self.numCores)
+        start = time.time()
+        init = self.canonical(self.initialState())
+        visited = self.newVisitedSet()
+        visited.add(init, None)
+        frontier = deque([init])
+
+        try:
+            while (len(frontier) > 0):
+                key = frontier.popleft()
+                for h in self.expand(key, result):
+                    if (visited.add(h, key)):
+                        frontier.append(h)
+
+                if (self.maxStates != None and len(visited) >= self.maxStates):
+                    result.complete = False
+                    break
+
+            result.seconds = time.time() - start
+            result.visitedReport = visited.report()
+            if (visited.keepsParents):
+                self.buildTraces(result, visited.parentOf)
+        finally:
+            visited.close()
+        return result
+
+    def newVisitedSet(self):
+        if (self.visitedSet == "bitstate"):
+            return BitstateVisitedSet(self.keyBytes, self.bitstateMB, self.hashes)
+        if (self.visitedSet == "disk"):
+            return DiskVisitedSet(self.keyBytes, self.spillDir)
+        return ExactVisitedSet()
+
+    # states are owned by the worker their key hashes to
+    def partition(self, key, workers):
+        return ((hash(key) * 0x9E3779B97F4A7C15) >> 32) % workers
+
+    def runParallel(self, workers):
+        result = VerificationResult(self.numCores)
+        start = time.time()
+        init = self.canonical(self.initialState())
+
+        # one tracker for all workers, so a segment is only unlinked by the worker that wrote it
+        resource_tracker.ensure_running()
+        context = multiprocessing.get_context()
+        conns = []
+        procs = []
+        for w in range(workers):
+            (mine, theirs) = context.Pipe()
+            p = context.Process(target=explorationWorker, args=(self, w, workers, theirs))
+            p.start()
+            theirs.close()
+            conns.append(mine)
+            procs.append(p)
+
+        try:
+            inboxes = [[] for w in range(workers)]
+            seeds = [[] for w in range(workers)]
+            seeds[self.partition(init, workers)].append(init)
+            visited = 1
+            while (True):
+                for w in range(workers):
+                    conns[w].send(("level", inboxes[w], seeds[w]))
+                replies = [conns[w].recv() for w in range(workers)]
+                seeds = [[] for w in range(workers)]
+
+                # route the batches written to shared memory to their owners
+                inboxes = [[] for w in range(workers)]
+                pending = 0
+                for (name, slices, frontier, states, transitions, violations, counts, added) in replies:
+                    for (dest, (offset, count)) in slices.items():
+                        inboxes[dest].append((name, offset, count))
+                        pending = pending + count
+                    pending = pending + frontier
+                    visited = visited + added
+                    result.states = result.states + states
+                    result.transitions = result.transitions + transitions
+                    for (kind, n) in counts.items():
+                        result.violationCounts[kind] = result.violationCounts.get(kind, 0) + n
+                    for v in violations:
+                        if (len(result.violations) < self.maxViolations and not any((u.kind, u.message) == (v.kind, v.message) for u in result.violations)):
+                            result.violations.append(v)
+
+                if (pending == 0):
+                    break
+                if (self.maxStates != None and visited >= self.maxStates):
+                    result.complete = False
+                    break
+
+            result.seconds = time.time() - start
+
+            def parentOf(key):
+                conn = conns[self.partition(key, workers)]
+                conn.send(("parent", key))
+                return conn.recv()
+            self.buildTraces(result, parentOf)
+
+            result.workerStats = []
+            for w in range(workers):
+                conns[w].send(("stop",))
+                result.workerStats.append(conns[w].recv())
+        finally:
+            for p in procs:
+                p.join(timeout=1)
+                if (p.is_alive()):
+                    p.terminate()
+        return result
+
+    def addViolation(self, result, kind, message, key):
+        result.violationCounts[kind] = result.violationCounts.get(kind, 0) + 1
+        if (len(result.violations) >= self.maxViolations or any((v.kind, v.message) == (kind, message) for v in result.violations)):
+            return
+        result.violations.append(Violation(kind, message, key))
+
+    def buildTraces(self, result, parentOf):
+        for v in result.violations:
+            node = v.state
+            while (parentOf(node) != None):
+                prev = parentOf(node)
+                v.trace.append((self.stepLabel(prev, node), self.decode(node)))
+                node = prev
+            v.trace.append(("initial", self.decode(node)))
+            v.trace.reverse()
+
+    # labels are not stored with the visited states, the step is found again on demand
+    def stepLabel(self, prev, node):
+        for (label, h) in self.successors(self.decode(prev), []):
+            if (self.canonical(h) == node):
+                return label
+        return "?"
+
+    def printResult(self, result):
+        print ("Explored "+str(result.states)+" global states, "+str(result.transitions)+" transitions ("+str(self.numCores)+" cores) in "+str(round(result.seconds, 2))+" s")
+        for (w, states, seconds) in result.workerStats:
+            rate = states / seconds if seconds > 0 else 0.0
+            print ("  worker "+str(w)+": "+str(states)+" states in "+str(round(seconds, 2))+" s ("+str(int(rate))+" states/s)")
+        if (result.visitedReport != None):
+            print (result.visitedReport)
+        if (not result.complete):
+            print ("State limit reached, exploration is incomplete")
+        if (len(result.violations) == 0):
+            print ("No SWMR, data-value, stall or deadlock violations found")
+            return
+        for kind in sorted(result.violationCounts):
+            print (kind+" violations: "+str(result.violationCounts[kind])+" states")
+        if (self.symmetry):
+            print ("Cores are renumbered at every step of a trace (symmetry reduction)")
+        for v in result.violations:
+            print ("--- "+v.kind+": "+v.message)
+            if (len(v.trace) == 0):
+                # bitstate runs keep no parents
+                print ("    reached -> "+self.describe(self.decode(v.state)))
+            for (label, g) in v.trace:
+                print ("    "+label+" -> "+self.describe(g))
+
+# a worker of the parallel exploration: it owns the visited states that hash to it,
+# expands them one BFS level at a time and writes the successors it does not own
+# to a shared-memory segment as fixed-width (key, parent) pairs
+def explorationWorker(checker, index, workers, conn):
+    visited = {}
+    frontier = []
+    segments = []
+    width = checker.keyBytes
+    states = 0
+    busy = 0.0
+
+    while (True):
+        request = conn.recv()
+        if (request[0] == "parent"):
+            conn.send(visited.get(request[1]))
+            continue
+        if (request[0] == "stop"):
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+            conn.send((index, states, busy))
+            return
+
+        (tag, inbox, seeds) = request
+        # every worker has read the segments of the level before the last one
+        while (len(segments) > 1):
+            old = segments.pop(0)
+            old.close()
+            old.unlink()
+
+        start = time.time()
+        added = 0
+        for key in seeds:
+            if (key not in visited):
+                visited[key] = None
+                frontier.append(key)
+                added = added + 1
+        for (name, offset, count) in inbox:
+            shm = shared_memory.SharedMemory(name=name)
+            buf = shm.buf
+            for i in range(count):
+                base = offset + 2 * width * i
+                key = int.from_bytes(buf[base:base + width], "little")
+                if (key not in visited):
+                    visited[key] = int.from_bytes(buf[base + width:base + 2 * width], "little")
+                    frontier.append(key)
+                    added = added + 1
+            del buf
+            shm.close()
+
+        result = VerificationResult(checker.numCores)
+        outgoing = [{} for w in range(workers)]
+        nextFrontier = []
+        for key in frontier:
+            for h in checker.expand(key, result):
+                owner = checker.partition(h, workers)
+                if (owner != index):
+                    if (h not in outgoing[owner]):
+                        outgoing[owner][h] = key
+                elif (h not in visited):
+                    visited[h] = key
+                    nextFrontier.append(h)
+                    added = added + 1
+        frontier = nextFrontier
+
+        total = sum(len(batch) for batch in outgoing)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 2 * width * total))
+        segments.append(shm)
+        slices = {}
+        position = 0
+        for w in range(workers):
+            if (len(outgoing[w]) == 0):
+                continue
+            slices[w] = (position, len(outgoing[w]))
+            for (key, parent) in outgoing[w].items():
+                shm.buf[position:position + width] = key.to_bytes(width, "little")
+                shm.buf[position + width:position + 2 * width] = parent.to_bytes(width, "little")
+                position = position + 2 * width
+
+        states = states + result.states
+        busy = busy + time.time() - start
+        conn.send((shm.name, slices, len(frontier), result.states, result.transitions, result.violations, result.violationCounts, added))
+
+def verifyProtocol(protocol, configModel, numCores, maxStates=None, symmetry=True, workers=1, visitedSet="exact", bitstateMB=16, hashes=3, spillDir=None):
+    checker = ModelChecker(protocol, configModel, numCores, maxStates, symmetry=symmetry, visitedSet=visitedSet, bitstateMB=bitstateMB, hashes=hashes, spillDir=spillDir)
+    result = checker.run(workers)
+    checker.printResult(result)
+    return result
+
+def main(argv):
+    inputfile = ' '
+    configModel = 'direct'
+    numCores = 2
+    maxStates = None
+    symmetry = True
+    workers = 1
+    visitedSet = "exact"
+    bitstateMB = 16
+    hashes = 3
+    spillDir = None
+
+    usage = 'verifier.py -i <input-protocol> -s <system-model> [-n <cores>] [-m <max-states>] [-j <workers>] [--no-symmetry] [--bitstate=<MB>] [--hashes=<k>] [--disk=<dir>]'
+    try:
+        opts, args = getopt.getopt(argv, "hi:s:n:m:j:", ["ifile=", "system-model=", "cores=", "max-states=", "jobs=", "no-symmetry", "bitstate=", "hashes=", "disk="])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-s", "--system-model"):
+            configModel = arg
+        elif opt in ("-n", "--cores"):
+            numCores = int(arg)
+        elif opt in ("-m", "--max-states"):
+            maxStates = int(arg)
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
+        elif opt == "--no-symmetry":
+            symmetry = False
+        elif opt == "--bitstate":
+            visitedSet = "bitstate"
+            bitstateMB = float(arg)
+        elif opt == "--hashes":
+            hashes = int(arg)
+        elif opt == "--disk":
+            visitedSet = "disk"
+            spillDir = arg
+
+    if (workers > 1 and visitedSet != "exact"):
+        print ("--bitstate and --disk are only supported with a single worker")
+        sys.exit(2)
+
+    try:
+        protocol = synthia.openProtocol(inputfile, configModel)
+    except (synthia.SpecError, synthia.ProtocolFileError) as e:
+        print (str(e))
+        sys.exit(2)
+    print (" ----- Step 4: Verify protocol -----")
+    result = verifyProtocol(protocol, configModel, numCores, maxStates, symmetry, workers, visitedSet, bitstateMB, hashes, spillDir)
+    if (not result.isCorrect()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
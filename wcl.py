@@ -0,0 +1,237 @@
+# Step 6: Worst-case latency bounds (analytic)
+
+# Bounds the latency of every request type of a synthesized protocol on a TDM bus with
+# N cores and slots of W cycles (period N*W), for one cache line:
+# - own hops: each Ordered and Data step of the requester's transient chain waits at
+#   most one period (its own slot, or the supplier's slot)
+# - predecessor hops: a cache that ordered its request first may hold the block in a
+#   post-ordered state and hand it on only after its own remaining hops. For a protocol
+#   with a linear WCAL bound one such chain is in the way, otherwise one per other core
+# - residual hops: a cache may still owe a response or data for a snoop it saw in a stable
+#   state. Those go first in its slot, so they delay its own ordering and any data it supplies
+# - queued supply: an owner that stays owner after supplying a reader (O in MOESI), or a
+#   transient state that supplies every reader it snoops, may owe data to every other cache,
+#   one message per slot. Then a data hop, and the ordering of a request from such an owner,
+#   waits up to N - 1 periods
+# - memory stalls: a message the shared memory may stall waits for the transactions of
+#   the other N - 1 cores, one period each
+# Stalled requests and the messages a core owes are assumed to be served in arrival order.
+# The memory model adds one slot per data hop for the forward through the shared memory, and
+# a miss issued within a slot waits up to one more slot for the next slot boundary.
+
+import sys, getopt, csv
+import numpy as np
+
+import synthia
+from verifier import SystemModel, READ, WRITE, REPLACEMENT, ORDERED, DATA, SEND_DATA, busMessages, observedEvents
+
+ownEvents = [("OwnReadM", READ), ("OwnReadP", READ), ("OwnWriteM", WRITE), ("OwnWriteP", WRITE), ("Replacement", REPLACEMENT)]
+
+defaultSlotWidths = (10, 25, 50, 100)
+
+class RequestType:
+    def __init__(self, source, event, kind):
+        self.source = source
+        self.event = event
+        self.kind = kind
+        self.hit = False
+        self.orderedHops = 0
+        self.dataHops = 0
+        self.predecessorHops = 0
+        self.stall = False
+        self.nonLinear = False
+        self.queuedData = False
+        self.queuedOrder = False
+
+    def name(self):
+        return "("+self.source+", "+self.event+")"
+
+    def growth(self):
+        if (self.hit):
+            return "O(1)"
+        if (self.stall or self.queuedData or self.queuedOrder or (self.nonLinear and self.predecessorHops > 0)):
+            return "O(N^2)"
+        return "O(N)"
+
+class LatencyModel:
+    def __init__(self, protocol, configModel):
+        self.model = SystemModel(protocol, configModel)
+        self.configModel = configModel
+        self.forwardSlots = 1 if configModel == "memory" else 0
+        self.nonLinearEvents = set(str(t.getTriggerEvent()) for t in protocol.nonLinearTransitions)
+        self.hops = {}
+        self.queuedSupply = self.supplyStaysOwner()
+        self.residualHops = self.snoopResidue()
+        self.requests = self.requestTypes()
+
+    # longest run of (Ordered, Data) steps from state to a stable state
+    def pathHops(self, state, visiting=()):
+        m = self.model
+        if (m.stable[state]):
+            return (0, 0)
+        if (state in self.hops):
+            return self.hops[state]
+        best = (0, 0)
+        for (event, step) in ((ORDERED, (1, 0)), (DATA, (0, 1))):
+            for (dest, flags) in m.cacheNext.get((state, event), []):
+                if (dest in visiting):
+                    continue
+                (o, d) = self.pathHops(dest, visiting + (state,))
+                if (o + d + 1 > sum(best)):
+                    best = (o + step[0], d + step[1])
+        if (len(visiting) == 0):
+            self.hops[state] = best
+        return best
+
+    # a cache that supplies a reader and can still supply the next one may owe data to several caches
+    def supplyStaysOwner(self):
+        m = self.model
+        for i in range(len(m.cacheStates)):
+            for (dest, flags) in m.cacheNext.get((i, observedEvents[READ]), []):
+                if (m.stable[i] and m.owner[i] and m.stable[dest] and m.owner[dest]):
+                    return True
+                if (not m.stable[i] and dest == i and flags & SEND_DATA):
+                    return True
+        return False
+
+    # messages a cache may still owe for a snoop it saw in a stable state
+    def snoopResidue(self):
+        m = self.model
+        worst = 0
+        for i in range(len(m.cacheStates)):
+            if (not m.stable[i]):
+                continue
+            for event in observedEvents.values():
+                for (dest, flags) in m.cacheNext.get((i, event), []):
+                    if (not m.stable[dest]):
+                        worst = max(worst, sum(self.pathHops(dest)) + 1)
+                    elif (flags & SEND_DATA):
+                        worst = max(worst, 1)
+        return worst
+
+    # hops a cache waiting for its data still has to go once it has seen a request of this kind
+    def predecessorHops(self, kind):
+        m = self.model
+        worst = 0
+        for i in range(len(m.cacheStates)):
+            if (m.stable[i] or (i, DATA) not in m.cacheNext):
+                continue
+            for (dest, flags) in m.cacheNext.get((i, observedEvents[kind]), []):
+                if (dest != i and not m.stable[dest]):
+                    worst = max(worst, sum(self.pathHops(dest)))
+        return worst
+
+    def requestTypes(self):
+        m = self.model
+        stalled = set(msg for (mem, msg) in m.memStalls)
+        requests = []
+        for i in range(len(m.cacheStates)):
+            if (not m.stable[i]):
+                continue
+            for (event, kind) in ownEvents:
+                options = m.cacheNext.get((i, event), [])
+                if (len(options) == 0):
+                    continue
+                r = RequestType(m.cacheStates[i].getStateString(), event, kind)
+                if (all(m.stable[dest] for (dest, flags) in options)):
+                    r.hit = True
+                else:
+                    for (dest, flags) in options:
+                        (o, d) = self.pathHops(dest)
+                        if (o + d > r.orderedHops + r.dataHops):
+                            (r.orderedHops, r.dataHops) = (o, d)
+                    if (kind != REPLACEMENT):
+                        r.predecessorHops = self.predecessorHops(kind)
+                        r.nonLinear = observedEvents[kind] in self.nonLinearEvents
+                    r.stall = busMessages[kind] in stalled
+                    r.queuedData = self.queuedSupply and r.dataHops > 0
+                    r.queuedOrder = self.queuedSupply and m.owner[i]
+                requests.append(r)
+        return requests
+
+    # bounds in cycles for every request type, core count and slot width: shape (requests, cores, widths)
+    def sweep(self, cores, slotWidths):
+        N = np.asarray(cores, dtype=np.int64)[None, :, None]
+        W = np.asarray(slotWidths, dtype=np.int64)[None, None, :]
+        rs = self.requests
+        ordered = np.array([r.orderedHops for r in rs], dtype=np.int64)[:, None, None]
+        data = np.array([r.dataHops for r in rs], dtype=np.int64)[:, None, None]
+        queuedData = np.array([r.queuedData for r in rs], dtype=bool)[:, None, None]
+        queuedOrder = np.array([r.queuedOrder for r in rs], dtype=bool)[:, None, None]
+        pred = np.array([r.predecessorHops for r in rs], dtype=np.int64)[:, None, None]
+        nonLinear = np.array([r.nonLinear for r in rs], dtype=bool)[:, None, None]
+        stall = np.array([r.stall for r in rs], dtype=np.int64)[:, None, None]
+        others = N - 1
+        queue = np.maximum(others, 1)
+        residual = self.residualHops * (ordered + data > 0) * np.minimum(others, 1)
+        own = ordered * np.where(queuedOrder, queue, 1) + data * np.where(queuedData, queue, 1) + residual * (1 + data)
+        periods = own + pred * np.where(nonLinear, others, np.minimum(others, 1)) + stall * others
+        return W * (N * periods + (self.forwardSlots * data + 1) * (ordered + data > 0))
+
+    def writeTable(self, path, cores, slotWidths, bounds):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Request", "Growth", "Cores", "Slot width", "Bound (cycles)", "Bound (slots)"])
+            for (i, r) in enumerate(self.requests):
+                for (j, n) in enumerate(cores):
+                    for (k, w) in enumerate(slotWidths):
+                        writer.writerow([r.name(), r.growth(), n, w, int(bounds[i, j, k]), int(bounds[i, j, k]) // w])
+
+    def printSummary(self, cores, slotWidths, bounds):
+        shown = [j for (j, n) in enumerate(cores) if n in (1, 2, 4, 8, 16, 32, 64) or j == len(cores) - 1]
+        print ("WCL bounds in cycles for "+str(slotWidths[0])+"-cycle slots ("+self.configModel+" model, "+str(self.residualHops)+" residual hops per slot"+(", queued supply" if self.queuedSupply else "")+")")
+        print ("Request".ljust(26)+"Hops (O/D/P/S)".ljust(16)+"Growth".ljust(8)+"".join(("N="+str(cores[j])).rjust(10) for j in shown))
+        for (i, r) in enumerate(self.requests):
+            hops = "-" if r.hit else str(r.orderedHops)+("+" if r.queuedOrder else "")+"/"+str(r.dataHops)+("+" if r.queuedData else "")+"/"+str(r.predecessorHops)+("*" if r.nonLinear else "")+"/"+("1" if r.stall else "0")
+            print (r.name().ljust(26)+hops.ljust(16)+r.growth().ljust(8)+"".join(str(int(bounds[i, j, 0])).rjust(10) for j in shown))
+        print ("O/D/P/S: ordered and data hops of the request (+ behind queued supplies), hops of a predecessor chain (* one per other core), memory stall")
+
+def latencyBounds(protocol, configModel, maxCores=64, slotWidths=defaultSlotWidths, outputFile=None):
+    model = LatencyModel(protocol, configModel)
+    cores = list(range(1, maxCores + 1))
+    bounds = model.sweep(cores, slotWidths)
+    model.printSummary(cores, slotWidths, bounds)
+    if (outputFile != None):
+        model.writeTable(outputFile, cores, slotWidths, bounds)
+        print ("Wrote "+str(bounds.size)+" bounds to "+outputFile)
+    return (model, bounds)
+
+def main(argv):
+    inputfile = ' '
+    configModel = 'direct'
+    maxCores = 64
+    slotWidths = defaultSlotWidths
+    outputFile = None
+
+    usage = 'wcl.py -i <input-protocol> -s <system-model> [--max-cores=<N>] [--slots=<cycles>[,<cycles>...]] [-o <csv file>]'
+    try:
+        opts, args = getopt.getopt(argv, "hi:s:o:", ["ifile=", "system-model=", "max-cores=", "slots="])
+    except getopt.GetoptError:
+        print (usage)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-s", "--system-model"):
+            configModel = arg
+        elif opt == "--max-cores":
+            maxCores = int(arg)
+        elif opt == "--slots":
+            slotWidths = tuple(int(w) for w in arg.split(",") if w != "")
+        elif opt == "-o":
+            outputFile = arg
+
+    try:
+        protocol = synthia.openProtocol(inputfile, configModel)
+    except (synthia.SpecError, synthia.ProtocolFileError) as e:
+        print (str(e))
+        sys.exit(2)
+    print (" ----- Step 6: Worst-case latency bounds -----")
+    latencyBounds(protocol, configModel, maxCores, slotWidths, outputFile)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])